@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+#
+# impt autodiff pipline
+# Copyright 20221222 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+"""Measures the import time of impt in new processes
+
+Usage:
+    python benchmarks/import_time.py --nrun 10 --max_import 0.2
+"""
+import sys
+import time
+import subprocess
+import numpy as np
+from argparse import ArgumentParser
+
+statements = {
+    "import": "import impt",
+    "fpfs_data": "import impt; impt.fpfs.__data_dir__",
+    "fpfs_params": "import impt; impt.fpfs.FpfsParams()",
+    "perturb": "import impt; impt.RespG1",
+}
+
+
+def time_statement(stmt, nrun):
+    """Returns the median wall time of running stmt in a new process,
+    subtracting the start-up time of the interpreter
+    """
+
+    def run(code):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        return time.perf_counter() - t0
+
+    base = np.median([run("pass") for _ in range(nrun)])
+    return np.median([run(stmt) for _ in range(nrun)]) - base
+
+
+def main():
+    parser = ArgumentParser(description="impt import time benchmark")
+    parser.add_argument("--nrun", default=5, type=int, help="number of runs")
+    parser.add_argument(
+        "--max_import",
+        default=None,
+        type=float,
+        help="fails if `import impt` takes longer than this (seconds)",
+    )
+    args = parser.parse_args()
+    out = {}
+    for name, stmt in statements.items():
+        out[name] = time_statement(stmt, args.nrun)
+        print("%-12s %8.3f s   [%s]" % (name, out[name], stmt))
+    if args.max_import is not None and out["import"] > args.max_import:
+        print("`import impt` is slower than %.3f s" % args.max_import)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
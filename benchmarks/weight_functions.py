@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+#
+# impt autodiff pipline
+# Copyright 20221222 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+"""Compares the branch-free weight functions with closed-form derivatives
+(impt.weights) against the previous piecewise implementations, for the
+values and the derivatives up to third order, and for the noise bias of the
+shear response of a selected ellipticity on the test catalog [tsfunc2
+keeps its piecewise form, since its closed-form derivative chain was slower
+in the noise bias of the pipeline, so it is not compared]
+
+Usage:
+    python benchmarks/weight_functions.py --nrow 1000000 --ncat 100000 --nrun 5
+"""
+import os
+import sys
+import time
+import fitsio
+import numpy as np
+from argparse import ArgumentParser
+
+import jax
+import jax.numpy as jnp
+from jax import jit
+
+import impt
+
+jax.config.update("jax_enable_x64", True)
+
+
+@jit
+def smfunc_piecewise(x, mu, sigma):
+    return jax.nn.sigmoid((x - mu) / sigma)
+
+
+@jit
+def ssfunc2_piecewise(x, mu, sigma):
+    t = (x - mu) / sigma / 2.0 + 0.5
+
+    def func(t):
+        return 6 * t**5.0 - 15 * t**4.0 + 10 * t**3.0
+
+    return jnp.piecewise(t, [t < 0, (t >= 0) & (t <= 1), t > 1], [0.0, func, 1.0])
+
+
+@jit
+def ssfunc3_piecewise(x, mu, sigma):
+    t = (x - mu) / sigma / 2.0 + 0.5
+
+    def func(t):
+        return -20 * t**7 + 70 * t**6.0 - 84 * t**5.0 + 35 * t**4.0
+
+    return jnp.piecewise(t, [t < 0, (t >= 0) & (t <= 1), t > 1], [0.0, func, 1.0])
+
+
+funcs = {
+    "sm": (smfunc_piecewise, impt.weights.smfunc),
+    "ss2": (ssfunc2_piecewise, impt.weights.ssfunc2),
+    "ss3": (ssfunc3_piecewise, impt.weights.ssfunc3),
+}
+
+
+def time_call(func, args, nrun):
+    """Returns the time of the first call [including compilation] and the
+    median time of the following calls
+    """
+
+    def run():
+        t0 = time.perf_counter()
+        jax.block_until_ready(func(*args))
+        return time.perf_counter() - t0
+
+    first = run()
+    return first, np.median([run() for _ in range(nrun)])
+
+
+def derivatives(ufunc, order):
+    """Returns the order-th derivative of ufunc with respect to x, vectorized
+    over x
+    """
+    func = ufunc
+    for _ in range(order):
+        func = jax.grad(func)
+    return jit(jax.vmap(func, in_axes=(0, None, None)))
+
+
+def bench_funcs(nrow, nrun):
+    x = jnp.asarray(np.random.default_rng(1).normal(scale=2.0, size=nrow))
+    print("weight functions on %d points [first call, median call in ms]" % nrow)
+    for name, (old, new) in funcs.items():
+        for order in range(4):
+            fo = derivatives(old, order)
+            fn = derivatives(new, order)
+            err = np.max(np.abs(fo(x, 0.3, 0.7) - fn(x, 0.3, 0.7)))
+            to = time_call(fo, (x, 0.3, 0.7), nrun)
+            tn = time_call(fn, (x, 0.3, 0.7), nrun)
+            print(
+                "%-4s d%d  piecewise %8.1f %8.2f   closed-form %8.1f %8.2f"
+                "   max diff %.1e"
+                % (name, order, to[0] * 1e3, to[1] * 1e3, tn[0] * 1e3, tn[1] * 1e3, err)
+            )
+    return
+
+
+def build_obs(func_name, ufunc, noise_cov):
+    """Returns the noise bias of the shear response of the selected
+    ellipticity, with the weight function ufunc
+    """
+    params = impt.fpfs.FpfsParams(Const=2.0, lower_m00=1.0, sigma_m00=0.5)
+    wsel = impt.fpfs.FpfsWeightSelect(params, func_name=func_name)
+    wsel.ufunc = ufunc
+    e1 = impt.fpfs.FpfsE1(params) * wsel
+    return impt.BiasNoise(impt.RespG1(e1), noise_cov)
+
+
+def bench_pipeline(ncat, nrun):
+    fname = os.path.join(impt.fpfs.__data_dir__, "fpfs-cut32-0000-g1-0000.fits")
+    cat = impt.fpfs.read_catalog(fname)
+    # tiles the test catalog to ncat rows
+    cat = jnp.tile(cat, (ncat // cat.shape[0] + 1, 1))[:ncat]
+    noise_cov = impt.fpfs.utils.fpfscov_to_imptcov(fitsio.read(fname))
+    print(
+        "BiasNoise(RespG1(e1 * wsel)) on %d rows [first call, median call in ms]"
+        % cat.shape[0]
+    )
+    # the piecewise functions are not known to have compact support, so all
+    # the rows are evaluated for both versions
+    impt.set_exec_mode(prune=False)
+    for name, (old, new) in funcs.items():
+        obs_old = build_obs(name, old, noise_cov)
+        obs_new = build_obs(name, new, noise_cov)
+        err = abs(float(obs_old.sum(cat)) - float(obs_new.sum(cat)))
+        # new observables for timing, so that the first call compiles
+        to = time_call(build_obs(name, old, noise_cov).sum, (cat,), nrun)
+        tn = time_call(build_obs(name, new, noise_cov).sum, (cat,), nrun)
+        print(
+            "%-4s     piecewise %8.1f %8.2f   closed-form %8.1f %8.2f"
+            "   diff %.1e"
+            % (name, to[0] * 1e3, to[1] * 1e3, tn[0] * 1e3, tn[1] * 1e3, err)
+        )
+    impt.set_exec_mode(prune=True)
+    return
+
+
+def main():
+    parser = ArgumentParser(description="impt weight function benchmark")
+    parser.add_argument("--nrow", default=1000000, type=int, help="number of points")
+    parser.add_argument("--nrun", default=5, type=int, help="number of runs")
+    parser.add_argument(
+        "--ncat", default=100000, type=int, help="number of catalog rows"
+    )
+    args = parser.parse_args()
+    bench_funcs(args.nrow, args.nrun)
+    bench_pipeline(args.ncat, args.nrun)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
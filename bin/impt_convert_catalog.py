@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+#
+# FPFS shear estimator
+# Copyright 20220312 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+import os
+import impt
+from argparse import ArgumentParser
+
+
+def main(args):
+    system = getattr(impt, args.layout)
+    for fname in args.input:
+        out_name = os.path.join(
+            args.output_dir,
+            os.path.splitext(os.path.basename(fname))[0] + ".impt",
+        )
+        header = system.convert_catalog(
+            fname, out_name, dtype=args.dtype, chunk_size=args.chunk_size
+        )
+        print("%s: %d rows -> %s" % (fname, header["nrow"], out_name))
+    return
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="convert FITS catalogs to the memory-mapped impt format"
+    )
+    parser.add_argument("input", nargs="+", type=str, help="FITS catalogs")
+    parser.add_argument(
+        "--output_dir", required=True, type=str, help="output directory"
+    )
+    parser.add_argument(
+        "--layout",
+        default="fpfs",
+        choices=["fpfs", "fpfs4"],
+        help="layout of the columns",
+    )
+    parser.add_argument(
+        "--dtype",
+        default="float64",
+        choices=["float32", "float64"],
+        help="data type on disk",
+    )
+    parser.add_argument(
+        "--chunk_size",
+        default=1000000,
+        type=int,
+        help="number of rows converted at a time",
+    )
+    args = parser.parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+    main(args)
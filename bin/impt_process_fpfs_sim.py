@@ -35,7 +35,7 @@ os.environ["OMP_NUM_THREAD"] = "1"
 
 
 class Worker(object):
-    def __init__(self, config_name, gver="g1"):
+    def __init__(self, config_name, gver="g1", ndevices=1, read_ahead=2):
         cparser = ConfigParser()
         cparser.read(config_name)
         self.shear_value = cparser.getfloat("distortion", "shear_value")
@@ -55,24 +55,61 @@ class Worker(object):
         self.upper_mag = cparser.getfloat("FPFS", "cut_mag")
         self.lower_m00 = 10 ** ((self.magz - self.upper_mag) / 2.5)
         self.lower_r2 = cparser.getfloat("FPFS", "cut_r2")
+        # sweep mode: a grid of magnitude cuts evaluated together on each
+        # catalog [e.g., cut_mag_grid = 24.0, 24.5, 25.0]
+        if cparser.has_option("FPFS", "cut_mag_grid"):
+            grid = cparser.get("FPFS", "cut_mag_grid").split(",")
+            self.upper_mags = np.array([float(mag) for mag in grid])
+        else:
+            self.upper_mags = np.array([self.upper_mag])
 
         if not os.path.exists(self.indir):
             raise FileNotFoundError("Cannot find input directory: %s!" % self.indir)
         print("The input directory for galaxy shear catalogs is %s. " % self.indir)
         # setup WL distortion parameter
         self.gver = gver
+        # number of CPU devices the rows of a catalog are split across
+        self.ndevices = ndevices
+        # number of catalogs read in advance
+        self.read_ahead = read_ahead
+        # observables are prepared once per process (see get_functions)
+        self.funcs = None
+        self.columns = None
         return
 
-    def prepare_functions(self):
-        params = impt.fpfs.FpfsParams(
+    def __getstate__(self):
+        # the compiled observables are not sent to the other processes
+        state = self.__dict__.copy()
+        state["funcs"] = None
+        state["columns"] = None
+        return state
+
+    def get_functions(self):
+        if self.funcs is None:
+            # pad catalogs to power-of-two lengths, so that the compiled
+            # programs are reused by the catalogs with different length
+            impt.set_exec_mode(buckets="pow2", devices=self.ndevices)
+            self.funcs = self.prepare_functions()
+        return self.funcs
+
+    def get_params(self, lower_m00):
+        return impt.fpfs.FpfsParams(
             Const=20,
-            lower_m00=self.lower_m00,
+            lower_m00=lower_m00,
             sigma_m00=0.2,
             lower_r2=self.lower_r2,
             upper_r2=200,
             sigma_r2=0.4,
             sigma_v=0.2,
         )
+
+    def get_sweep_params(self):
+        # parameters of the magnitude cuts [traced, with a batch axis]
+        lower_m00 = 10 ** ((self.magz - self.upper_mags) / 2.5)
+        return self.get_params(lower_m00)
+
+    def prepare_functions(self):
+        params = self.get_params(self.lower_m00)
         funcnm = "ss2"
         e1_impt = impt.fpfs.FpfsE1(params, func_name=funcnm)
         w_det = impt.fpfs.FpfsWeightDetect(params, func_name=funcnm)
@@ -86,51 +123,104 @@ class Worker(object):
         gc.collect()
         return e1, enoise, res1, rnoise
 
-    def get_sum_e_r(self, in_nm, e1, enoise, res1, rnoise):
-        assert os.path.isfile(
-            in_nm
-        ), "Cannot find input galaxy shear catalogs : %s " % (in_nm)
-        mm = impt.fpfs.read_catalog(in_nm)
-        print("number of galaxies: %d" % len(mm))
-        e1_sum = jnp.sum(e1.evaluate(mm))
-        e1_sum = e1_sum - jnp.sum(enoise.evaluate(mm))
+    def get_columns(self):
+        # indexes of the columns used by the observables
+        if self.columns is None:
+            self.columns = impt.catalog.column_indexes(
+                list(self.get_functions()), impt.fpfs.default.col_names
+            )
+        return self.columns
+
+    def get_out_name(self, ind0):
+        return os.path.join(self.outdir, "%04d.fits" % ind0)
+
+    def get_in_names(self, ind0):
+        pp = "cut%d" % self.rcut
+        return [
+            os.path.join(
+                self.indir, "fpfs-%s-%04d-%s-%s.fits" % (pp, ind0, self.gver, rot)
+            )
+            for rot in ["0000", "2222"]
+        ]
+
+    def iter_catalogs(self, ids):
+        # reads the catalogs one after another [run in a background thread]
+        columns = self.get_columns()
+        for ind0 in ids:
+            for irot, in_nm in enumerate(self.get_in_names(ind0)):
+                assert os.path.isfile(
+                    in_nm
+                ), "Cannot find input galaxy shear catalogs : %s " % (in_nm)
+                yield ind0, irot, impt.fpfs.read_catalog(in_nm, columns=columns)
+
+    def get_sum_e_r(self, cats, e1, enoise, res1, rnoise):
+        print("number of galaxies: %s" % [len(mm) for mm in cats])
+        # sums the ellipticity, shear response and their noise biases over
+        # each catalog for all the cuts in one call [shape: (ncat, ncut)]
+        params = self.get_sweep_params() if len(self.upper_mags) > 1 else None
+        sums = impt.evaluate_catalogs(
+            [e1, enoise, res1, rnoise], cats, reduce="sum", params=params
+        )
+        e1_s, enoise_s, res1_s, rnoise_s = [
+            np.reshape(ss, (len(cats), -1)) for ss in sums
+        ]
+        e1_sum = e1_s - enoise_s
 
         # shear response
-        r1_sum = jnp.sum(res1.evaluate(mm))
-        r1_sum = r1_sum - jnp.sum(rnoise.evaluate(mm))
-        del mm
+        r1_sum = res1_s - rnoise_s
         return e1_sum, r1_sum
 
-    def run(self, ind0):
-        out_nm = os.path.join(self.outdir, "%04d.fits" % ind0)
-        if os.path.isfile(out_nm):
-            print("Already has the output file")
+    def run(self, ids):
+        """Processes a block of simulations; the catalogs of the next
+        simulations are read in a background thread while the current ones are
+        evaluated
+        """
+        ids = np.atleast_1d(ids).tolist()
+        todo = []
+        for ind0 in ids:
+            if os.path.isfile(self.get_out_name(ind0)):
+                print("Already has the output file")
+            else:
+                todo.append(ind0)
+        if len(todo) == 0:
             return
 
+        funcs = self.get_functions()
         start_time = time.time()
-        e1, enoise, res1, rnoise = self.prepare_functions()
-        pp = "cut%d" % self.rcut
-        in_nm1 = os.path.join(
-            self.indir, "fpfs-%s-%04d-%s-0000.fits" % (pp, ind0, self.gver)
-        )
-        sum_e1_1, sum_r1_1 = self.get_sum_e_r(in_nm1, e1, enoise, res1, rnoise)
-        gc.collect()
+        cats = {}
+        reads = impt.prefetch(self.iter_catalogs(todo), self.read_ahead)
+        for ind0, irot, mm in reads:
+            cats[irot] = mm
+            del mm
+            if len(cats) < 2:
+                continue
+            # the two rotated catalogs are evaluated together
+            sum_e1, sum_r1 = self.get_sum_e_r([cats[0], cats[1]], *funcs)
+            cats = {}
+            sum_e1_1, sum_e1_2 = sum_e1
+            sum_r1_1, sum_r1_2 = sum_r1
+            print(
+                "--- computational time: %.2f seconds ---" % (time.time() - start_time)
+            )
+            start_time = time.time()
 
-        in_nm2 = os.path.join(
-            self.indir, "fpfs-%s-%04d-%s-2222.fits" % (pp, ind0, self.gver)
-        )
-        sum_e1_2, sum_r1_2 = self.get_sum_e_r(in_nm2, e1, enoise, res1, rnoise)
-        del e1, enoise, res1, rnoise
+            names = [("cut", "<f8"), ("de", "<f8"), ("eA", "<f8"), ("res", "<f8")]
+            cols = [
+                self.upper_mags,
+                sum_e1_2 - sum_e1_1,
+                (sum_e1_1 + sum_e1_2) / 2.0,
+                (sum_r1_1 + sum_r1_2) / 2.0,
+            ]
+            if len(self.upper_mags) > 1:
+                # sweep mode: a table with one row for each cut
+                out = np.zeros(len(self.upper_mags), dtype=names)
+                for (name, _), col in zip(names, cols):
+                    out[name] = col
+            else:
+                # the (4, 1) array of a single cut
+                out = np.array(cols, dtype=np.float64).reshape((4, 1))
+            fitsio.write(self.get_out_name(ind0), out)
         gc.collect()
-        print("--- computational time: %.2f seconds ---" % (time.time() - start_time))
-
-        out = np.zeros((4, 1))
-        # names= [('cut','<f8'), ('de','<f8'), ('eA','<f8') ('res','<f8')]
-        out[0, 0] = self.upper_mag
-        out[1, 0] = sum_e1_2 - sum_e1_1
-        out[2, 0] = (sum_e1_1 + sum_e1_2) / 2.0
-        out[3, 0] = (sum_r1_1 + sum_r1_2) / 2.0
-        fitsio.write(out_nm, out)
         return
 
 
@@ -139,9 +229,16 @@ def main(pool):
     cparser.read(args.config)
     gver = cparser.get("distortion", "g_test")
     print("Testing for %s . " % gver)
-    worker = Worker(args.config, gver=gver)
+    worker = Worker(
+        args.config, gver=gver, ndevices=args.ndevices, read_ahead=args.read_ahead
+    )
     refs = list(range(args.minId, args.maxId))
-    for _ in pool.map(worker.run, refs):
+    # each task processes a block of simulations, so that the catalogs of the
+    # next simulations in the block are read ahead
+    blocks = [
+        refs[i : i + args.block_size] for i in range(0, len(refs), args.block_size)
+    ]
+    for _ in pool.map(worker.run, blocks):
         pass
     del worker, cparser
     pool.close()
@@ -157,6 +254,30 @@ if __name__ == "__main__":
         "--maxId", required=True, type=int, help="maximum id number, e.g. 4000"
     )
     parser.add_argument("--config", required=True, type=str, help="configure file name")
+    parser.add_argument(
+        "--ndevices",
+        default=1,
+        type=int,
+        help="Number of CPU devices the rows of a catalog are split across.",
+    )
+    parser.add_argument(
+        "--read_ahead",
+        default=2,
+        type=int,
+        help="Number of catalogs read in advance (0 for no read-ahead).",
+    )
+    parser.add_argument(
+        "--block_size",
+        default=10,
+        type=int,
+        help="Number of simulations processed by one task.",
+    )
+    parser.add_argument(
+        "--cache_dir",
+        default=None,
+        type=str,
+        help="Directory of the compilation cache shared by the processes.",
+    )
     group = parser.add_mutually_exclusive_group()
     group.add_argument(
         "--ncores",
@@ -173,5 +294,10 @@ if __name__ == "__main__":
         help="Run with MPI.",
     )
     args = parser.parse_args()
+    if args.ndevices > 1:
+        # needs to be set before any JAX operation
+        impt.set_host_devices(args.ndevices)
+    if args.cache_dir is not None:
+        impt.enable_compilation_cache(args.cache_dir)
     pool = schwimmbad.choose_pool(mpi=args.mpi, processes=args.n_cores)
     main(pool)
@@ -2,15 +2,49 @@
 # flake8: noqa
 import os
 from .__version__ import __version__
-from .perturb import *
-from . import fpfs
-from . import fpfs4
 
-# We need accuracy is below 1e-6
-from jax import config
-
-config.update("jax_enable_x64", True)
+# JAX is configured before it is imported [we need accuracy below 1e-6];
+# the submodules also enable x64 in case JAX has already been imported
 os.environ["JAX_PLATFORM_NAME"] = "cpu"
+os.environ.setdefault("JAX_ENABLE_X64", "True")
+
+from .lazy import attach
 
-__all__ = ["fpfs", "fpfs4"]
-__all__ += perturb.__all__
+# the submodules (and JAX) are imported on first access
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    submodules=[
+        "fpfs",
+        "fpfs4",
+        "artifact",
+        "base",
+        "catalog",
+        "dependency",
+        "engine",
+        "memory",
+        "perturb",
+        "weights",
+    ],
+    attrs={
+        "perturb": ["RespG1", "RespG2", "RespG", "BiasNoise"],
+        "engine": [
+            "set_exec_mode",
+            "get_exec_mode",
+            "set_host_devices",
+            "enable_compilation_cache",
+            "precision",
+        ],
+        "base": [
+            "evaluate_many",
+            "check_precision",
+            "evaluate_stream",
+            "evaluate_catalogs",
+        ],
+        "catalog": ["prefetch"],
+        "artifact": [
+            "export_observables",
+            "load_observables",
+            "ExportedObservables",
+        ],
+    },
+)
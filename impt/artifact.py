@@ -0,0 +1,175 @@
+# impt autodiff pipline
+# Copyright 20221222 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# python lib
+
+# This file exports compiled observables to versioned artifacts, which can be
+# loaded and evaluated without the code constructing the observables
+
+import json
+import dataclasses
+
+import numpy as np
+import jax
+
+from .__version__ import __version__
+from .base import NlBase, _ObsGroup
+from .engine import compile_rows, compile_sum, get_precision
+from .engine import pad_to_bucket, resolve_mode
+
+__all__ = ["export_observables", "load_observables", "ExportedObservables"]
+
+# version of the artifact format
+format_version = 1
+
+
+def _params_dict(params):
+    """Returns the parameters of an observable as a json serializable dict"""
+    if not dataclasses.is_dataclass(params):
+        return repr(params)
+    out = {}
+    for field in dataclasses.fields(params):
+        value = getattr(params, field.name)
+        try:
+            out[field.name] = float(value)
+        except (TypeError, ValueError):
+            out[field.name] = repr(value)
+    return out
+
+
+def export_observables(
+    obs_list,
+    ncol,
+    fname,
+    reduce=None,
+    mode=None,
+    chunk_size=None,
+    metadata=None,
+):
+    """Exports a list of observables to an artifact, in which the observables
+    are lowered to one program taking catalogs with any number of rows
+
+    Args:
+        obs_list (list):    a list of observables [e.g., the output of
+                            `impt.fpfs.future.prepare_func_e1`]
+        ncol (int):         number of columns of the catalogs
+        fname (str):        output file name [npz format]
+        reduce (str):       None (per-galaxy values), "sum" or "mean" over
+                            the galaxies
+        mode (str):         execution mode ["map" or "vmap"], default to the
+                            global setting (see `set_exec_mode`)
+        chunk_size (int):   number of rows vectorized together in "vmap" mode
+        metadata (dict):    json serializable metadata stored in the artifact
+                            [e.g., the name of the data release]
+    Returns:
+        out (dict):         metadata of the artifact
+    """
+    from jax import export
+
+    if reduce not in (None, "sum", "mean"):
+        raise ValueError("reduce: %s is not supported" % reduce)
+    for obs in obs_list:
+        if not isinstance(obs, NlBase):
+            raise TypeError("Input observable is not a instance of NlBase")
+    mode, chunk_size = resolve_mode(mode, chunk_size)
+    group = _ObsGroup(list(obs_list))
+    # the rows are exported in the precision set by `impt.precision`
+    dtype = np.dtype(get_precision() or np.float64)
+    (nrow,) = export.symbolic_shape("nrow")
+    cat_spec = jax.ShapeDtypeStruct((nrow, ncol), dtype)
+    if reduce is None:
+        func = compile_rows(group._obs_func, mode, chunk_size)
+        exported = export.export(func)(cat_spec)
+    else:
+        func = compile_sum(group._obs_func, mode, chunk_size)
+        exported = export.export(func)(cat_spec, jax.ShapeDtypeStruct((), np.int64))
+    info = {
+        "format_version": format_version,
+        "impt_version": __version__,
+        "jax_version": jax.__version__,
+        "observables": [type(obs).__name__ for obs in obs_list],
+        "params": [_params_dict(obs.params) for obs in obs_list],
+        "ncol": int(ncol),
+        "dtype": dtype.name,
+        "reduce": reduce,
+        "mode": mode,
+        "chunk_size": chunk_size,
+        "metadata": metadata if metadata is not None else {},
+    }
+    payload = np.frombuffer(exported.serialize(), dtype=np.uint8)
+    with open(fname, "wb") as ff:
+        np.savez(ff, info=np.array(json.dumps(info)), payload=payload)
+    return info
+
+
+class ExportedObservables(object):
+    """Observables loaded from an artifact [see `export_observables`]; the
+    loaded program is compiled on the first call, without tracing the
+    observables
+    """
+
+    def __init__(self, fname):
+        from jax import export
+
+        with np.load(fname, allow_pickle=False) as data:
+            self.info = json.loads(str(data["info"]))
+            payload = data["payload"].tobytes()
+        if self.info["format_version"] > format_version:
+            raise ValueError(
+                "artifact format version %d is not supported by impt %s"
+                % (self.info["format_version"], __version__)
+            )
+        self.exported = export.deserialize(bytearray(payload))
+        self.ncol = self.info["ncol"]
+        self.reduce = self.info["reduce"]
+        self._func = jax.jit(self.exported.call)
+        return
+
+    @property
+    def metadata(self):
+        """User metadata stored in the artifact"""
+        return self.info["metadata"]
+
+    def __call__(self, cat):
+        """Evaluates the observables on a catalog
+
+        Args:
+            cat (ndarray):      input catalog [shape: (nrow, ncol)]
+        Returns:
+            out (list):         a list of the evaluated observables [or their
+                                sum or mean over the galaxies]
+        """
+        if cat.ndim != 2 or cat.shape[1] != self.ncol:
+            raise ValueError("input catalog should have shape (nrow, %d)" % self.ncol)
+        nrow = cat.shape[0]
+        pcat, _ = pad_to_bucket(cat)
+        pcat = np.asarray(pcat, dtype=self.info.get("dtype", "float64"))
+        if self.reduce is None:
+            out = self._func(pcat)
+            return [oo[:nrow] for oo in out]
+        out = self._func(pcat, nrow)
+        if self.reduce == "mean":
+            out = [oo / nrow for oo in out]
+        return list(out)
+
+
+def load_observables(fname):
+    """Loads observables exported by `export_observables`
+
+    Args:
+        fname (str):        artifact file name
+    Returns:
+        out (ExportedObservables):  callable returning the list of evaluated
+                                    observables of a catalog
+    """
+    return ExportedObservables(fname)
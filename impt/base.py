@@ -13,9 +13,18 @@
 #
 # python lib
 
+import hashlib
 import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+import jax
+import jax.numpy as jnp
 from flax import struct
-from jax import lax, grad, jacfwd, jacrev
+from jax import jacfwd, jacrev, vmap
+from .engine import run_rows, run_segments, clear_executables, shared_call
+from .engine import precision, prune_enabled
+from .dependency import input_columns
 
 
 logging.basicConfig(
@@ -24,8 +33,144 @@ logging.basicConfig(
     level=logging.INFO,
 )
 
+# interned structural keys of observables
+_struct_ids = {}
+
+# number of updates of observables [parameters, functions or constants]; the
+# structural keys computed before an update are recomputed, since the keys of
+# the observables built on the updated one change as well
+_updates = [0]
+
+# stack of the parameter trees bound while tracing [type of the parameter
+# tree -> tree]; see `bind_params`
+_bound_params = [{}]
+
+
+def struct_key(value):
+    """Returns a hashable key describing the structure and the values of an
+    attribute of an observable; attributes with equal keys are taken as
+    identical in common-subexpression elimination
+    """
+    if isinstance(value, NlBase):
+        return ("obs", value.key)
+    if isinstance(value, jax.core.Tracer):
+        # traced parameters are identical only if they are the same tracer
+        return ("tracer", id(value))
+    if isinstance(value, (np.ndarray, jax.Array)):
+        arr = np.ascontiguousarray(value)
+        digest = hashlib.sha1(arr.tobytes()).hexdigest()
+        return ("array", arr.shape, arr.dtype.str, digest)
+    if isinstance(value, (list, tuple)):
+        return tuple(struct_key(vv) for vv in value)
+    if isinstance(value, struct.PyTreeNode):
+        leaves, tree = jax.tree_util.tree_flatten(value)
+        return ("tree", tree, struct_key(leaves))
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return ("id", id(value))
+
+
+@contextmanager
+def bind_params(params):
+    """Within this context, the observables with parameters of the type of
+    params use params instead [e.g., the parameters traced as inputs of a
+    compiled program]; None restores the parameters of the observables
+    """
+    _bound_params.append({} if params is None else {type(params): params})
+    try:
+        yield
+    finally:
+        _bound_params.pop()
+
+
+def prepare_params(params):
+    """Converts a parameter tree to arrays passed to compiled programs; if
+    any parameter has a batch axis [shape: (nparam,)], the others are
+    broadcast to it
+
+    Args:
+        params (PyTreeNode):    parameter tree [e.g., `impt.fpfs.FpfsParams`]
+    Returns:
+        out (PyTreeNode):       parameter tree of float64 arrays
+    """
+    if not isinstance(params, struct.PyTreeNode):
+        raise ValueError("Input parameter is not a instance of pyTreeNode")
+    leaves, tree = jax.tree_util.tree_flatten(params)
+    leaves = [np.asarray(ll, dtype=np.float64) for ll in leaves]
+    if any(ll.ndim > 1 for ll in leaves):
+        raise ValueError("parameters should be scalars or 1D arrays")
+    sizes = set(ll.size for ll in leaves if ll.ndim == 1)
+    if len(sizes) > 1:
+        raise ValueError("batched parameters should have the same length")
+    if len(sizes) == 1:
+        (nparam,) = sizes
+        leaves = [np.broadcast_to(ll, (nparam,)) for ll in leaves]
+    return jax.tree_util.tree_unflatten(tree, [jnp.asarray(ll) for ll in leaves])
+
+
+def _check_params(obs_list, params):
+    """Checks that params can replace the parameters of the observables"""
+    if not any(isinstance(obs._params, type(params)) for obs in obs_list):
+        raise TypeError(
+            "params of type %s are not used by the observables" % type(params).__name__
+        )
+
+
+def _call_with_params(func, x, params):
+    """Calls the per-row function func(x) with the parameters replaced by
+    params [see `prepare_params`]; with a batch of parameters, the outputs
+    have one more axis [shape: (nparam, ...)]
+    """
+
+    def call(pp):
+        # in the precision of the row
+        pp = jax.tree_util.tree_map(lambda vv: vv.astype(x.dtype), pp)
+        with bind_params(pp):
+            return func(x)
+
+    leaves = jax.tree_util.tree_leaves(params)
+    if len(leaves) == 0 or leaves[0].ndim == 0:
+        return call(params)
+    return vmap(call)(params)
+
+
+def mark_updated(obs):
+    """Marks an observable as updated, so that the structural keys are
+    recomputed and the executables compiled for the old keys are dropped
+    """
+    obs.__dict__.pop("_key", None)
+    clear_executables(obs)
+    _updates[0] += 1
+    return
+
+
+def _sync_executables(owner, key):
+    """Drops the executables of owner if they were compiled for another
+    structural key [e.g., before an update of the observable, of one of its
+    parents or of a member of the group]
+    """
+    if owner.__dict__.get("_executables_key") != key:
+        clear_executables(owner)
+        owner._executables_key = key
+    return
+
+
+def _as_index(idx):
+    return np.array(idx, dtype=int)
+
+
+def _shared_func(obs, tag, func):
+    """Memoizes a per-row function of an observable on its structural key"""
+    return lambda x: shared_call(obs.key, tag, func, x)
+
 
 class LinRespBase:
+    """Shear response of linear observables; the response is linear in the
+    row, i.e., dg(row) = A @ row with a constant response matrix A
+    """
+
     def _dg1(*args):
         # each function has a basic function to apply to row and a function
         # wraped with lax
@@ -36,11 +181,82 @@ class LinRespBase:
         # wraped with lax
         raise NotImplementedError("You need to over-ride the _dg2 method")
 
+    def response_matrix(self, component, ncol, dtype=np.float64):
+        """Returns the shear response matrix
+
+        Args:
+            component (int):    shear component [1 or 2]
+            ncol (int):         number of columns in a row
+            dtype (dtype):      data type of the matrix [that of the rows]
+        Returns:
+            out (ndarray):      response matrix A [shape: (ncol, ncol)] with
+                                dg(row) = A @ row
+        """
+        if component not in (1, 2):
+            raise ValueError("component: %s is not supported" % component)
+        cache = self.__dict__.setdefault("_response_matrix", {})
+        dtype = np.dtype(dtype)
+        if (component, ncol, dtype) in cache:
+            return cache[(component, ncol, dtype)]
+        if (component, ncol) not in cache:
+            terms = self.response_terms(component)
+            if terms is not None:
+                mat = np.zeros((ncol, ncol))
+                for iout, iin, coeff in terms:
+                    mat[iout, iin] += coeff
+            else:
+                func = self._dg1 if component == 1 else self._dg2
+                # the response is linear, so its Jacobian is the response
+                # matrix
+                with jax.ensure_compile_time_eval():
+                    mat = jax.jacfwd(func)(jnp.zeros(ncol, dtype=jnp.float64))
+            cache[(component, ncol)] = np.asarray(mat)
+        # cast once, so that rows in lower precision are not upcast
+        out = cache[(component, ncol)].astype(dtype)
+        cache[(component, ncol, dtype)] = out
+        return out
+
+    def response_terms(self, component):
+        """Returns the nonzero elements of the response matrix as a list of
+        (output column, input column, coefficient); None if the response is
+        only defined through _dg1 and _dg2
+        """
+        return None
+
+    def dg_sub(self, component, x, idx):
+        """Returns the shear response of the columns idx of the row x; only
+        the columns with nonzero response coefficients are read
+
+        Args:
+            component (int):    shear component [1 or 2]
+            x (ndarray):        input row
+            idx (tuple):        indexes of the columns
+        Returns:
+            out (ndarray):      shear response of the columns idx
+        """
+        mat = self.response_matrix(component, x.shape[-1], x.dtype)
+        mat = mat[_as_index(idx)]
+        cols = np.flatnonzero(np.any(mat != 0.0, axis=0))
+        if len(cols) == 0:
+            return jnp.zeros(len(idx), dtype=x.dtype)
+        xs = jnp.stack([x[i] for i in cols])
+        return jnp.dot(mat[:, cols], xs)
+
+    def _dg(self, component, cat):
+        mat = self.response_matrix(component, cat.shape[-1], cat.dtype)
+        return jnp.dot(cat, mat.T)
+
     def dg1(self, cat):
-        return lax.map(self._dg1, cat)
+        """Returns the shear response [first component] of the catalog as one
+        matrix product
+        """
+        return self._dg(1, cat)
 
     def dg2(self, cat):
-        return lax.map(self._dg2, cat)
+        """Returns the shear response [second component] of the catalog as one
+        matrix product
+        """
+        return self._dg(2, cat)
 
 
 class NlBase:
@@ -54,36 +270,236 @@ class NlBase:
             if not isinstance(lin_resp, LinRespBase):
                 raise ValueError("Input lin_resp is not a instance of LinRespBase")
         self.lin_resp = lin_resp
-        if not isinstance(params, struct.PyTreeNode):
-            raise ValueError("Input parameter is not a instance of pyTreeNode")
         self.params = params
         self._set_obs_func(self._base_func)
 
+    @property
+    def params(self):
+        """Parameters of the observable; the parameters of the same type
+        bound by `bind_params` (e.g., traced parameters) while tracing
+        """
+        return _bound_params[-1].get(type(self._params), self._params)
+
+    @params.setter
+    def params(self, params):
+        if not isinstance(params, struct.PyTreeNode):
+            raise ValueError("Input parameter is not a instance of pyTreeNode")
+        self._params = params
+        mark_updated(self)
+
     def _base_func(*args):
         raise NotImplementedError("You need to over-ride the _base_func method")
 
-    def _set_obs_func(self, func):
-        """Setup observable functions [func, derivative and Hessian]"""
-        self._obs_func = func
-        self._obs_grad_func = grad(self._obs_func, argnums=self.nmodes)
-        self._obs_hessian_func = jacfwd(
-            jacrev(
-                self._obs_func,
-            )
-        )
+    def _set_obs_func(self, func, expr=None, operands=()):
+        """Setup observable function; the derivatives and Hessian are built
+        lazily from it when requested
+
+        Args:
+            func (Callable):    observable function of a row
+            expr (str):         operator of arithmetic observables [the
+                                expression node is built from the current
+                                keys of the operands, see `key`]
+            operands (tuple):   operands of arithmetic observables
+        """
+        self._expr = expr
+        self._operands = operands
+        # a function set from outside which is neither the base function nor
+        # an arithmetic expression is part of the structure
+        if expr is None and func != self._base_func:
+            self._custom_func = func
+        else:
+            self._custom_func = None
+        self._obs_func = _shared_func(self, "func", func)
+        mark_updated(self)
+        self.__dict__.pop("_input_columns", None)
         return
 
-    def evaluate(self, cat):
-        """Calls this observable function"""
-        return lax.map(self._obs_func, cat)
+    @property
+    def key(self):
+        """Structural key of the observable (an interned integer); observables
+        with the same key compute the same function and are only traced once
+        in one program
+        """
+        if self.__dict__.get("_key_update") != _updates[0]:
+            self.__dict__.pop("_key", None)
+        if "_key" not in self.__dict__:
+            if self._expr is not None:
+                node = _expr_node(self._expr, self._operands)
+            else:
+                attrs = tuple(
+                    sorted(
+                        (kk, struct_key(vv))
+                        for kk, vv in self.__dict__.items()
+                        if not kk.startswith("_")
+                        and kk not in ("parent", "lin_resp", "nmodes")
+                    )
+                )
+                parent = None if self.parent is None else self.parent.key
+                node = (
+                    type(self),
+                    type(self.lin_resp),
+                    parent,
+                    struct_key(self._params),
+                    attrs,
+                    self._custom_func,
+                )
+            self._key = _struct_ids.setdefault(node, len(_struct_ids))
+            self._key_update = _updates[0]
+        return self._key
+
+    # gradient and Hessian in the space of the columns that the function
+    # depends on [see `input_columns`]
+    @property
+    def _obs_reduced_grad(self):
+        return _shared_func(self, "rgrad", self._reduced_grad)
+
+    @property
+    def _obs_reduced_hessian(self):
+        return _shared_func(self, "rhessian", self._reduced_hessian)
+
+    # full-width gradient and Hessian
+    @property
+    def _obs_grad_func(self):
+        return _shared_func(self, "grad", self._full_grad)
+
+    @property
+    def _obs_hessian_func(self):
+        return _shared_func(self, "hessian", self._full_hessian)
+
+    def input_columns(self, ncol, dtype=jnp.float64):
+        """Returns the columns of the input row that the observable depends
+        on (found at trace time)
+
+        Args:
+            ncol (int):         number of columns in a row
+            dtype (dtype):      data type of the row
+        Returns:
+            out (tuple):        sorted indexes of the columns
+        """
+        cache = self.__dict__.setdefault("_input_columns", {})
+        key = (ncol, jnp.dtype(dtype))
+        if key not in cache:
+            # the columns do not depend on the values of the parameters
+            with bind_params(None):
+                cache[key] = input_columns(self._obs_func, ncol, dtype)
+        return cache[key]
+
+    def _reduced_func(self, x):
+        """Returns the observable function of the columns it depends on,
+        the indexes of these columns and their values in the row x
+        """
+        idx = self.input_columns(x.shape[-1], x.dtype)
+        if len(idx) == 0:
+            z = jnp.zeros((0,), dtype=x.dtype)
+        else:
+            z = jnp.stack([x[i] for i in idx])
+
+        def func(z):
+            # the other columns are not used by the observable
+            return self._obs_func(jnp.zeros_like(x).at[_as_index(idx)].set(z))
+
+        return func, idx, z
+
+    def _reduced_grad(self, x):
+        """Returns the gradient vector in the space of the dependent columns
+        and the indexes of these columns; for vector-valued observables, the
+        Jacobian matrix [shape: (nout, ncol)] from one reverse pass over the
+        shared function
+        """
+        func, idx, z = self._reduced_func(x)
+        return jacrev(func)(z), idx
+
+    def _reduced_hessian(self, x):
+        """Returns the Hessian matrix in the space of the dependent columns
+        and the indexes of these columns
+        """
+        func, idx, z = self._reduced_func(x)
+        return jacfwd(jacrev(func))(z), idx
+
+    def _full_grad(self, x):
+        res, idx = self._obs_reduced_grad(x)
+        # the leading axes are the axes of the output
+        out = jnp.zeros(res.shape[:-1] + x.shape, dtype=res.dtype)
+        return out.at[..., _as_index(idx)].set(res)
+
+    def _full_hessian(self, x):
+        res, idx = self._obs_reduced_hessian(x)
+        out = jnp.zeros(res.shape[:-2] + x.shape + x.shape, dtype=res.dtype)
+        idx = _as_index(idx)
+        return out.at[(Ellipsis,) + np.ix_(idx, idx)].set(res)
+
+    def support(self, cat):
+        """Returns the mask of the rows of the catalog where the observable or
+        its derivatives can be nonzero; the observable vanishes in a
+        neighborhood of the other rows [e.g., zero selection weight], which
+        are skipped in sums [see `set_exec_mode`]
+
+        Args:
+            cat (ndarray):      input catalog [numpy array]
+        Returns:
+            out (ndarray):      boolean mask of the rows, None for all the
+                                rows
+        """
+        if self._expr is not None:
+            return _expr_support(self._expr, self._operands, cat)
+        if self._custom_func is not None:
+            return None
+        return self._base_support(cat)
+
+    def _base_support(self, cat):
+        # the support of _base_func, all the rows if unknown
+        return None
+
+    def _params_func(self, x, params):
+        return _call_with_params(self._obs_func, x, params)
+
+    def evaluate(self, cat, mode=None, chunk_size=None, params=None):
+        """Calls this observable function; the output of vector-valued
+        observables [e.g., `impt.fpfs.FpfsWeightE`] has one more axis
+        [shape: (nrow, nout)]
+
+        Args:
+            cat (ndarray):      input catalog
+            mode (str):         execution mode ["map" or "vmap"], default to
+                                the global setting (see `set_exec_mode`)
+            chunk_size (int):   number of rows vectorized together in "vmap"
+                                mode, default to the global setting
+            params (PyTreeNode):    parameters replacing the parameters of
+                                    the same type in the observable; they are
+                                    traced, so new values reuse the compiled
+                                    program; parameters with a batch axis
+                                    [shape: (nparam,)] are evaluated in batch
+                                    [output shape: (nrow, nparam, ...)]
+        """
+        return _run_obs(self, [self], cat, mode, chunk_size, None, params)
 
-    def grad(self, cat):
-        """Calls the gradient vector function of observable function"""
-        return lax.map(self._obs_grad_func, cat)
+    def grad(self, cat, mode=None, chunk_size=None):
+        """Calls the gradient vector function of observable function
+        [see `evaluate` for the arguments; shape: (nrow, ..., ncol)]
+        """
+        _sync_executables(self, self.key)
+        return run_rows(self, "_obs_grad_func", cat, mode, chunk_size)
 
-    def hessian(self, cat):
-        """Calls the hessian matrix function of observable function"""
-        return lax.map(self._obs_hessian_func, cat)
+    def hessian(self, cat, mode=None, chunk_size=None):
+        """Calls the hessian matrix function of observable function
+        [see `evaluate` for the arguments; shape: (nrow, ..., ncol, ncol)]
+        """
+        _sync_executables(self, self.key)
+        return run_rows(self, "_obs_hessian_func", cat, mode, chunk_size)
+
+    def sum(self, cat, mode=None, chunk_size=None, params=None):
+        """Sums this observable over the catalog without storing the
+        per-galaxy values [see `evaluate` for the arguments; in "map" mode,
+        chunk_size is the number of rows summed in each step]
+        """
+        return _run_obs(self, [self], cat, mode, chunk_size, "sum", params)
+
+    def mean(self, cat, mode=None, chunk_size=None, params=None):
+        """Averages this observable over the catalog without storing the
+        per-galaxy values [see `sum` for the arguments; nan for an empty
+        catalog]
+        """
+        return _run_obs(self, [self], cat, mode, chunk_size, "mean", params)
 
     def make_obs_new(self):
         out = NlBase(self.params, self, self.lin_resp)
@@ -97,7 +513,7 @@ class NlBase:
             func = lambda x: self._obs_func(x) + other
         else:
             raise TypeError("Cannot add %s to observable" % type(other))
-        obs._set_obs_func(func)
+        obs._set_obs_func(func, "add", (self, other))
         return obs
 
     def __sub__(self, other):
@@ -108,7 +524,7 @@ class NlBase:
             func = lambda x: self._obs_func(x) - other
         else:
             raise TypeError("Cannot subtract %s to observable" % type(other))
-        obs._set_obs_func(func)
+        obs._set_obs_func(func, "sub", (self, other))
         return obs
 
     def __mul__(self, other):
@@ -119,7 +535,7 @@ class NlBase:
             func = lambda x: self._obs_func(x) * other
         else:
             raise TypeError("Cannot multiply %s to observable" % type(other))
-        obs._set_obs_func(func)
+        obs._set_obs_func(func, "mul", (self, other))
         return obs
 
     def __truediv__(self, other):
@@ -130,7 +546,7 @@ class NlBase:
             func = lambda x: self._obs_func(x) / other
         else:
             raise TypeError("Cannot multiply %s to observable" % type(other))
-        obs._set_obs_func(func)
+        obs._set_obs_func(func, "truediv", (self, other))
         return obs
 
     def __pow__(self, other):
@@ -139,5 +555,288 @@ class NlBase:
             func = lambda x: self._obs_func(x) ** other
         else:
             raise TypeError("Cannot power %s to observable" % type(other))
-        obs._set_obs_func(func)
+        obs._set_obs_func(func, "pow", (self, other))
         return obs
+
+
+def _expr_node(op, operands):
+    """Returns the expression node of an arithmetic observable from the
+    current structural keys of its operands
+    """
+    keys = [oo.key if isinstance(oo, NlBase) else ("const", oo) for oo in operands]
+    if op in ("add", "mul") and all(isinstance(oo, NlBase) for oo in operands):
+        # commutative
+        keys = sorted(keys)
+    return (op,) + tuple(keys)
+
+
+def _expr_support(op, operands, cat):
+    """Returns the support of an arithmetic observable from the supports of
+    its operands [see `NlBase.support`]
+    """
+    masks = [oo.support(cat) if isinstance(oo, NlBase) else None for oo in operands]
+    if op in ("add", "sub"):
+        # union
+        if any(mm is None for mm in masks):
+            return None
+        return np.logical_or(*masks)
+    if op == "mul":
+        # intersection
+        masks = [mm for mm in masks if mm is not None]
+        if len(masks) == 0:
+            return None
+        return np.logical_and.reduce(masks)
+    if op == "truediv":
+        return masks[0]
+    if op == "pow" and operands[1] > 0:
+        return masks[0]
+    return None
+
+
+def support_mask(obs_list, cat, params=None):
+    """Returns the mask of the rows of the catalog where any of the
+    observables or their derivatives can be nonzero [see `NlBase.support`]
+
+    Args:
+        obs_list (list):        a list of observables
+        cat (ndarray):          input catalog
+        params (PyTreeNode):    parameters replacing the parameters of the
+                                observables [see `NlBase.evaluate`]; with a
+                                batch of parameters, the union of the supports
+    Returns:
+        out (ndarray):          boolean mask of the rows, None for all the rows
+    """
+    cat = np.asarray(cat)
+    if params is None:
+        plist = [None]
+    else:
+        leaves, tree = jax.tree_util.tree_flatten(prepare_params(params))
+        leaves = [np.asarray(ll) for ll in leaves]
+        nparam = leaves[0].size if leaves and leaves[0].ndim == 1 else 0
+        if nparam == 0:
+            plist = [jax.tree_util.tree_unflatten(tree, leaves)]
+        else:
+            plist = [
+                jax.tree_util.tree_unflatten(tree, [ll[i] for ll in leaves])
+                for i in range(nparam)
+            ]
+    out = np.zeros(cat.shape[0], dtype=bool)
+    for pp in plist:
+        with bind_params(pp):
+            for obs in obs_list:
+                mask = obs.support(cat)
+                if mask is None:
+                    return None
+                out |= mask
+    return out
+
+
+def _prune_rows(obs_list, cat, params):
+    """Drops the rows outside the support of the observables [they add zero
+    to the sums]
+    """
+    if not prune_enabled() or cat.shape[0] == 0:
+        return cat
+    mask = support_mask(obs_list, cat, params)
+    if mask is None or np.all(mask):
+        return cat
+    # one row is kept, so that the catalog is not empty
+    mask[np.argmax(mask)] = True
+    return np.asarray(cat)[mask]
+
+
+def _run_obs(owner, obs_list, cat, mode, chunk_size, reduce, params):
+    """Evaluates the per-row function of an observable (or a group of
+    observables) with its own parameters or with params [see
+    `NlBase.evaluate`]; in sums, the rows outside the support of the
+    observables are skipped
+    """
+    if params is None:
+        name, args = "_obs_func", ()
+    else:
+        _check_params(obs_list, params)
+        name, args = "_params_func", (prepare_params(params),)
+    _sync_executables(owner, tuple(obs.key for obs in obs_list))
+    if reduce is None:
+        return run_rows(owner, name, cat, mode, chunk_size, None, args)
+    nrow = cat.shape[0]
+    cat = _prune_rows(obs_list, cat, params)
+    out = run_rows(owner, name, cat, mode, chunk_size, "sum", args)
+    if reduce == "mean":
+        out = jax.tree_util.tree_map(lambda x: x / nrow, out)
+    return out
+
+
+class _ObsGroup:
+    """A group of observables evaluated by one compiled program"""
+
+    def __init__(self, obs_list):
+        self.obs_list = obs_list
+
+    def _obs_func(self, x):
+        return tuple(obs._obs_func(x) for obs in self.obs_list)
+
+    def _params_func(self, x, params):
+        return _call_with_params(self._obs_func, x, params)
+
+
+# the groups (and their compiled executables) used recently
+_obs_groups = OrderedDict()
+_max_obs_groups = 32
+
+
+def _get_group(obs_list):
+    """Returns the (cached) group of a list of observables"""
+    for obs in obs_list:
+        if not isinstance(obs, NlBase):
+            raise TypeError("Input observable is not a instance of NlBase")
+    key = tuple(id(obs) for obs in obs_list)
+    if key in _obs_groups:
+        _obs_groups.move_to_end(key)
+    else:
+        _obs_groups[key] = _ObsGroup(list(obs_list))
+        if len(_obs_groups) > _max_obs_groups:
+            _obs_groups.popitem(last=False)
+    return _obs_groups[key]
+
+
+def evaluate_many(obs_list, cat, mode=None, chunk_size=None, reduce=None, params=None):
+    """Evaluates a list of observables with one pass over the catalog; all the
+    observables are traced into one program, which traces their common
+    sub-observables (with the same structural key), gradients and shear
+    responses only once
+
+    Args:
+        obs_list (list):    a list of observables
+        cat (ndarray):      input catalog
+        mode (str):         execution mode ["map" or "vmap"], default to
+                            the global setting (see `set_exec_mode`)
+        chunk_size (int):   number of rows vectorized together in "vmap"
+                            mode, default to the global setting
+        reduce (str):       None (per-galaxy values), "sum" or "mean" over
+                            the galaxies [see `NlBase.sum`]
+        params (PyTreeNode):    traced parameters replacing the parameters of
+                                the observables [see `NlBase.evaluate`]
+    Returns:
+        out (list):         a list of the evaluated observables
+    """
+    group = _get_group(obs_list)
+    out = _run_obs(group, obs_list, cat, mode, chunk_size, reduce, params)
+    return list(out)
+
+
+def evaluate_catalogs(
+    obs_list, cats, reduce="sum", mode=None, chunk_size=None, params=None
+):
+    """Reduces a list of observables over each catalog of a list [e.g., the
+    catalogs of the rotated simulations] with one call; the catalogs are
+    packed into one padded catalog with the index of the catalog of each row,
+    so that one compiled program evaluates them all
+
+    Args:
+        obs_list (list):    a list of observables
+        cats (list):        a list of catalogs [shape: (nrow_i, ncol)]
+        reduce (str):       "sum" or "mean" over the galaxies of a catalog
+        mode (str):         execution mode ["map" or "vmap"], default to
+                            the global setting (see `set_exec_mode`)
+        chunk_size (int):   number of rows vectorized together in "vmap"
+                            mode, default to the global setting
+        params (PyTreeNode):    traced parameters replacing the parameters of
+                                the observables [see `NlBase.evaluate`]
+    Returns:
+        out (list):         a list of the reduced observables, one for each
+                            observable [shape: (ncat, ...)]
+    """
+    if reduce not in ("sum", "mean"):
+        raise ValueError("reduce: %s is not supported" % reduce)
+    group = _get_group(obs_list)
+    if params is None:
+        name, args = "_obs_func", ()
+    else:
+        _check_params(obs_list, params)
+        name, args = "_params_func", (prepare_params(params),)
+    nrows = np.array([len(cc) for cc in cats], dtype=np.float64)
+    cats = [_prune_rows(obs_list, cc, params) for cc in cats]
+    _sync_executables(group, tuple(obs.key for obs in obs_list))
+    out = run_segments(group, name, cats, mode, chunk_size, args)
+    if reduce == "mean":
+        out = [oo / nrows.reshape((-1,) + (1,) * (oo.ndim - 1)) for oo in out]
+    return list(out)
+
+
+def evaluate_stream(
+    obs_list, chunks, reduce="sum", mode=None, chunk_size=None, params=None
+):
+    """Reduces a list of observables over a stream of catalog chunks [e.g.,
+    `impt.fpfs.iter_catalog`], so that only one chunk is kept in memory
+
+    Args:
+        obs_list (list):    a list of observables
+        chunks (Iterable):  chunks of the catalog [shape: (nrow, ncol)]
+        reduce (str):       "sum" or "mean" over the galaxies
+        mode (str):         execution mode ["map" or "vmap"], default to
+                            the global setting (see `set_exec_mode`)
+        chunk_size (int):   number of rows vectorized together in "vmap"
+                            mode, default to the global setting
+        params (PyTreeNode):    traced parameters replacing the parameters of
+                                the observables [see `NlBase.evaluate`]
+    Returns:
+        out (list):         a list of the reduced observables
+    """
+    if reduce not in ("sum", "mean"):
+        raise ValueError("reduce: %s is not supported" % reduce)
+    out = None
+    nrow = 0
+    for cat in chunks:
+        if cat.shape[0] == 0:
+            continue
+        sums = evaluate_many(obs_list, cat, mode, chunk_size, "sum", params)
+        sums = [np.asarray(ss, dtype=np.float64) for ss in sums]
+        out = sums if out is None else [oo + ss for oo, ss in zip(out, sums)]
+        nrow += cat.shape[0]
+    if out is None:
+        raise ValueError("the catalog is empty")
+    if reduce == "mean":
+        out = [oo / nrow for oo in out]
+    return out
+
+
+def check_precision(obs_list, cat, dtype="float32", nsample=1000, seed=0):
+    """Measures the error of evaluating observables in lower precision (see
+    `impt.precision`) against the float64 evaluation on a random sample of
+    the catalog
+
+    Args:
+        obs_list (list):    a list of observables
+        cat (ndarray):      input catalog
+        dtype (str):        floating point type to test
+        nsample (int):      number of rows in the sample
+        seed (int):         seed of the random sample
+    Returns:
+        out (list):         a list of dicts, one for each observable, with
+                            the maximum absolute error of the per-galaxy
+                            values ("max_abs"), the absolute and relative
+                            error of their mean ("mean_abs" and "mean_rel")
+    """
+    cat = np.asarray(cat, dtype=np.float64)
+    nrow = cat.shape[0]
+    if nrow > nsample:
+        rng = np.random.default_rng(seed)
+        cat = cat[np.sort(rng.choice(nrow, nsample, replace=False))]
+    with precision("float64"):
+        outs0 = evaluate_many(obs_list, cat)
+    with precision(dtype):
+        outs1 = evaluate_many(obs_list, cat)
+    out = []
+    for out0, out1 in zip(outs0, outs1):
+        out0 = np.asarray(out0, dtype=np.float64)
+        out1 = np.asarray(out1, dtype=np.float64)
+        mean_abs = np.abs(np.mean(out1) - np.mean(out0))
+        out.append(
+            {
+                "max_abs": float(np.max(np.abs(out1 - out0))),
+                "mean_abs": float(mean_abs),
+                "mean_rel": float(mean_abs / max(np.abs(np.mean(out0)), 1e-30)),
+            }
+        )
+    return out
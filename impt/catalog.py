@@ -0,0 +1,321 @@
+# impt autodiff pipline
+# Copyright 20221222 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# python lib
+
+# This file contains the readers of catalogs shared by the systems of
+# observables (e.g., fpfs and fpfs4); it does not import JAX
+
+import json
+import queue
+import threading
+
+import numpy as np
+
+__all__ = ["prefetch"]
+
+
+def column_indexes(columns, col_names):
+    """Returns the indexes of the columns to read
+
+    Args:
+        columns (list):     None (all the columns), or a list of column names,
+                            column indexes and observables [the columns that
+                            the observables depend on]
+        col_names (list):   names of the columns of the catalog
+    Returns:
+        out (tuple):        sorted indexes of the columns
+    """
+    ncol = len(col_names)
+    if columns is None:
+        return tuple(range(ncol))
+    if not isinstance(columns, (list, tuple)):
+        columns = [columns]
+    out = set()
+    for col in columns:
+        if hasattr(col, "input_columns"):
+            out.update(col.input_columns(ncol))
+        elif isinstance(col, str):
+            if col not in col_names:
+                raise ValueError("column: %s is not in the catalog" % col)
+            out.add(col_names.index(col))
+        else:
+            col = int(col)
+            if col < 0 or col >= ncol:
+                raise ValueError("column index: %d is out of range" % col)
+            out.add(col)
+    return tuple(sorted(out))
+
+
+def to_matrix(data, col_names, idx=None, dtype=np.float64, mask=None):
+    """Converts a structured array to a matrix with one copy; the rows are
+    selected and converted column by column into the preallocated matrix
+
+    Args:
+        data (ndarray):     structured array
+        col_names (list):   names of the columns of the matrix
+        idx (tuple):        indexes of the columns copied from data, the other
+                            columns are set to zero [default to all]
+        dtype (dtype):      data type of the matrix
+        mask (ndarray):     boolean mask of the rows to keep [default to all]
+    Returns:
+        out (ndarray):      matrix [shape: (nrow, ncol)]
+    """
+    nrow = len(data) if mask is None else int(np.count_nonzero(mask))
+    if idx is None or len(idx) == len(col_names):
+        idx = range(len(col_names))
+        out = np.empty((nrow, len(col_names)), dtype=dtype)
+    else:
+        out = np.zeros((nrow, len(col_names)), dtype=dtype)
+    for i in idx:
+        col = data[col_names[i]]
+        out[:, i] = col if mask is None else col[mask]
+    return out
+
+
+def read_names(col_names, idx, cut_names=()):
+    """Returns the names of the columns to read from disk: the columns idx
+    and the columns used by the cut
+    """
+    names = [col_names[i] for i in idx]
+    return names + [name for name in cut_names if name not in names]
+
+
+def read_fits(fname, col_names, cut=None, columns=None, cut_names=(), ext=1):
+    """Reads the columns of a FITS table which are used
+
+    Args:
+        fname (str):        FITS file name
+        col_names (list):   names of the columns
+        cut (Callable):     function returning a boolean mask of the rows to
+                            keep [structured array]
+        columns (list):     columns to read [see `column_indexes`]; the other
+                            columns are set to zero
+        cut_names (list):   names of the columns used by the cut
+        ext (int):          extension of the table
+    Returns:
+        out (ndarray):      catalog [shape: (nrow, ncol)]
+    """
+    import fitsio
+
+    idx = column_indexes(columns, col_names)
+    data = fitsio.read(fname, ext=ext, columns=read_names(col_names, idx, cut_names))
+    # the cut is applied while the matrix is filled [no copy of the table]
+    mask = None if cut is None else cut(data)
+    return to_matrix(data, col_names, idx, mask=mask)
+
+
+def iter_fits(
+    fname, col_names, chunk_size, cut=None, columns=None, cut_names=(), ext=1
+):
+    """Iterates over the rows of a FITS table in chunks, reading one chunk at
+    a time with range reads
+
+    Args:
+        fname (str):        FITS file name
+        col_names (list):   names of the columns
+        chunk_size (int):   number of rows read at a time
+        cut (Callable):     function returning a boolean mask of the rows to
+                            keep from a chunk [structured array]
+        columns (list):     columns to read [see `column_indexes`]; the other
+                            columns are set to zero
+        cut_names (list):   names of the columns used by the cut
+        ext (int):          extension of the table
+    Yields:
+        out (ndarray):      matrix of a chunk [shape: (nrow, ncol)]
+    """
+    import fitsio
+
+    chunk_size = int(chunk_size)
+    if chunk_size < 1:
+        raise ValueError("chunk_size should be a positive integer")
+    idx = column_indexes(columns, col_names)
+    names = read_names(col_names, idx, cut_names)
+    with fitsio.FITS(fname) as ff:
+        hdu = ff[ext]
+        nrow = hdu.get_nrows()
+        for start in range(0, nrow, chunk_size):
+            data = hdu[names][start : min(start + chunk_size, nrow)]
+            mask = None if cut is None else cut(data)
+            yield to_matrix(data, col_names, idx, mask=mask)
+    return
+
+
+def _put(qq, item, stop):
+    """Puts an item in a queue unless the consumer has stopped"""
+    while not stop.is_set():
+        try:
+            qq.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def prefetch(iterable, depth=1):
+    """Iterates over iterable with its next items produced in a background
+    thread, so that reading the next chunk of a catalog overlaps with the
+    evaluation of the current one
+
+    Args:
+        iterable (Iterable):    e.g., an iterator over the chunks of a catalog
+        depth (int):            number of items produced in advance [0 for no
+                                prefetching]
+    Yields:
+        out:                    the items of iterable
+    """
+    if depth < 1:
+        yield from iterable
+        return
+    done = object()
+    qq = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                if not _put(qq, (item, None), stop):
+                    return
+        except BaseException as err:
+            _put(qq, (done, err), stop)
+            return
+        _put(qq, (done, None), stop)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, err = qq.get()
+            if item is done:
+                if err is not None:
+                    raise err
+                return
+            yield item
+    finally:
+        # the consumer stops early (or raises)
+        stop.set()
+        thread.join()
+
+
+# magic string of the columnar catalog format
+_magic = b"IMPTCAT\x00"
+# version of the columnar catalog format
+columnar_version = 1
+# the data starts at a multiple of this number of bytes
+_align = 64
+
+
+def write_columnar(
+    fname, data, col_names, layout, cut=None, dtype=np.float64, nrow=None
+):
+    """Writes a catalog in the columnar format: a json header followed by the
+    columns stored one after another, which can be memory mapped
+
+    Args:
+        fname (str):        output file name
+        data (Callable):    function returning an iterator over the chunks of
+                            the catalog [shape: (nrow, ncol)]; it is called
+                            twice (to count the rows, then to write them) if
+                            nrow is not given, so that only one chunk is kept
+                            in memory
+        col_names (list):   names of the columns
+        layout (str):       layout of the columns [e.g., "fpfs"]
+        cut (str):          description of the cut applied to the rows
+        dtype (dtype):      data type on disk ["float32" or "float64"]
+        nrow (int):         number of rows of the catalog
+    Returns:
+        header (dict):      header of the catalog
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError("dtype: %s is not supported" % dtype)
+    ncol = len(col_names)
+    if nrow is None:
+        nrow = sum(len(chunk) for chunk in data())
+    header = {
+        "version": columnar_version,
+        "layout": layout,
+        "col_names": list(col_names),
+        "dtype": dtype.name,
+        "nrow": nrow,
+        "cut": cut,
+    }
+    raw = json.dumps(header).encode()
+    offset = -(-(len(_magic) + 8 + len(raw)) // _align) * _align
+    with open(fname, "wb") as ff:
+        ff.write(_magic)
+        ff.write(np.array(len(raw), dtype="<u8").tobytes())
+        ff.write(raw)
+        ff.write(b"\x00" * (offset - ff.tell()))
+        ff.truncate(offset + nrow * ncol * dtype.itemsize)
+    if nrow == 0:
+        return header
+    out = np.memmap(fname, dtype=dtype, mode="r+", offset=offset, shape=(ncol, nrow))
+    start = 0
+    for chunk in data():
+        if chunk.shape[1] != ncol:
+            raise ValueError("the chunks should have %d columns" % ncol)
+        if start + len(chunk) > nrow:
+            raise ValueError("the number of rows is not %d" % nrow)
+        out[:, start : start + len(chunk)] = chunk.T
+        start += len(chunk)
+    if start != nrow:
+        raise ValueError("the number of rows is not %d" % nrow)
+    out.flush()
+    del out
+    return header
+
+
+def read_columnar_header(fname):
+    """Returns the header of a catalog in the columnar format and the offset
+    of its data
+    """
+    with open(fname, "rb") as ff:
+        if ff.read(len(_magic)) != _magic:
+            raise ValueError("%s is not a catalog in the columnar format" % fname)
+        size = int(np.frombuffer(ff.read(8), dtype="<u8")[0])
+        header = json.loads(ff.read(size).decode())
+    if header["version"] > columnar_version:
+        raise ValueError(
+            "columnar format version %d is not supported" % header["version"]
+        )
+    offset = -(-(len(_magic) + 8 + size) // _align) * _align
+    return header, offset
+
+
+def read_columnar(fname, columns=None):
+    """Memory maps a catalog in the columnar format without reading it
+
+    Args:
+        fname (str):        file name
+        columns (list):     columns to read [see `column_indexes`]; if given,
+                            only these columns are read from disk and copied
+                            to the output, the other columns are set to zero
+    Returns:
+        out (ndarray):      catalog [shape: (nrow, ncol)]; a read-only
+                            column-major view of the file if columns is None
+        header (dict):      header of the catalog
+    """
+    header, offset = read_columnar_header(fname)
+    col_names = header["col_names"]
+    shape = (len(col_names), header["nrow"])
+    if header["nrow"] == 0:
+        return np.zeros(shape[::-1], dtype=header["dtype"]), header
+    data = np.memmap(fname, dtype=header["dtype"], mode="r", offset=offset, shape=shape)
+    if columns is None:
+        return data.T, header
+    idx = column_indexes(columns, col_names)
+    out = np.zeros(shape[::-1], dtype=header["dtype"])
+    for i in idx:
+        out[:, i] = data[i]
+    return out, header
@@ -0,0 +1,192 @@
+# impt autodiff pipline
+# Copyright 20221222 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# python lib
+
+# This file finds the columns of a row that a per-row function depends on by
+# walking through the jaxpr of the function
+
+import jax
+
+try:
+    from jax.extend import core
+except ImportError:  # older versions of jax
+    from jax import core
+
+# marker for a variable which is the input row itself
+_ROW = "row"
+
+# primitives which return the input row unchanged (up to dtype)
+_row_preserving = ("convert_element_type", "copy", "copy_p")
+
+# primitives which call their sub-jaxpr once with their inputs; the loops
+# (scan and while) and cond are walked separately, the other primitives with
+# sub-jaxprs are treated conservatively
+_calls = (
+    "pjit",
+    "jit",
+    "closed_call",
+    "core_call",
+    "remat",
+    "checkpoint",
+    "custom_jvp_call",
+    "custom_vjp_call",
+    "custom_vjp_call_jaxpr",
+)
+
+
+def _sub_jaxpr(eqn):
+    """Returns the sub-jaxpr called by an equation (e.g. jit, custom_jvp)
+    if the sub-jaxpr takes exactly the inputs of the equation
+    """
+    if eqn.primitive.name not in _calls:
+        return None
+    for val in eqn.params.values():
+        if isinstance(val, core.ClosedJaxpr):
+            val = val.jaxpr
+        if isinstance(val, core.Jaxpr) and len(val.invars) == len(eqn.invars):
+            return val
+    return None
+
+
+def _slice_columns(eqn, ncol):
+    """Returns the columns read by a slice of the input row"""
+    (start,) = eqn.params["start_indices"]
+    (limit,) = eqn.params["limit_indices"]
+    strides = eqn.params["strides"]
+    step = 1 if strides is None else strides[0]
+    return frozenset(range(start, min(limit, ncol), step))
+
+
+def _as_set(info, ncol):
+    """Returns the columns of a dependence"""
+    return frozenset(range(ncol)) if info is _ROW else info
+
+
+def _walk_loop(body, consts, carry, xs, ncol):
+    """Propagates the dependence through the body of a loop until the
+    dependence of the carry converges [the carry of an iteration depends on
+    the carry of the previous ones]
+
+    Args:
+        body (Jaxpr):       jaxpr of the body [consts, carry, xs -> carry, ys]
+        consts (list):      dependence of the constants of the body
+        carry (list):       dependence of the initial carry
+        xs (list):          dependence of the sequences scanned over
+        ncol (int):         number of columns in a row
+    Returns:
+        out (list):         dependence of the outputs of the body
+    """
+    # neither the carry nor the elements of the sequences are the row
+    carry = [_as_set(info, ncol) for info in carry]
+    xs = [_as_set(info, ncol) for info in xs]
+    while True:
+        outs = _walk(body, consts + carry + xs, ncol)
+        new = [cc | oo for cc, oo in zip(carry, outs)]
+        if new == carry:
+            return new + outs[len(carry) :]
+        carry = new
+
+
+def _walk_control(eqn, ins, ncol):
+    """Propagates the dependence through scan, while and cond; returns None
+    for the other primitives
+    """
+    name = eqn.primitive.name
+    params = eqn.params
+    if name == "scan":
+        nconst = params["num_consts"]
+        ncarry = params["num_carry"]
+        return _walk_loop(
+            params["jaxpr"].jaxpr,
+            ins[:nconst],
+            ins[nconst : nconst + ncarry],
+            ins[nconst + ncarry :],
+            ncol,
+        )
+    if name == "while":
+        ncond = params["cond_nconsts"]
+        nbody = params["body_nconsts"]
+        consts = ins[ncond : ncond + nbody]
+        carry = _walk_loop(
+            params["body_jaxpr"].jaxpr, consts, ins[ncond + nbody :], [], ncol
+        )
+        # the number of iterations depends on the predicate
+        cond_ins = ins[:ncond] + carry
+        pred = frozenset().union(*_walk(params["cond_jaxpr"].jaxpr, cond_ins, ncol))
+        return [cc | pred for cc in carry]
+    if name == "cond":
+        # the outputs depend on the index of the branch
+        outs = [_as_set(ins[0], ncol)] * len(eqn.outvars)
+        for branch in params["branches"]:
+            bouts = _walk(branch.jaxpr, ins[1:], ncol)
+            outs = [oo | bb for oo, bb in zip(outs, bouts)]
+        return outs
+    return None
+
+
+def _walk(jaxpr, infos, ncol):
+    """Propagates the dependence of variables through a jaxpr
+
+    Args:
+        jaxpr (Jaxpr):      jaxpr of the function
+        infos (list):       dependence of the input variables, each one is
+                            either _ROW or a frozenset of columns
+        ncol (int):         number of columns in a row
+    Returns:
+        out (list):         dependence of the output variables
+    """
+    env = {}
+
+    def read(var):
+        if isinstance(var, core.Literal):
+            return frozenset()
+        return env.get(var, frozenset())
+
+    for var, info in zip(jaxpr.invars, infos):
+        env[var] = info
+
+    for eqn in jaxpr.eqns:
+        ins = [read(var) for var in eqn.invars]
+        name = eqn.primitive.name
+        sub = _sub_jaxpr(eqn)
+        if name == "slice" and len(ins) == 1 and ins[0] is _ROW:
+            outs = [_slice_columns(eqn, ncol)]
+        elif name in _row_preserving and len(ins) == 1 and ins[0] is _ROW:
+            outs = [_ROW]
+        elif sub is not None and len(sub.outvars) == len(eqn.outvars):
+            outs = _walk(sub, ins, ncol)
+        else:
+            outs = _walk_control(eqn, ins, ncol)
+        if outs is None:
+            # conservative: every output depends on every input
+            dep = frozenset().union(*[_as_set(info, ncol) for info in ins])
+            outs = [dep] * len(eqn.outvars)
+        for var, info in zip(eqn.outvars, outs):
+            env[var] = info
+    return [_as_set(read(var), ncol) for var in jaxpr.outvars]
+
+
+def input_columns(func, ncol, dtype):
+    """Returns the columns of the row that a per-row function depends on
+
+    Args:
+        func (Callable):    per-row function
+        ncol (int):         number of columns in a row
+        dtype (dtype):      data type of the row
+    Returns:
+        out (tuple):        sorted indexes of the columns
+    """
+    closed = jax.make_jaxpr(func)(jax.ShapeDtypeStruct((ncol,), dtype))
+    outs = _walk(closed.jaxpr, [_ROW], ncol)
+    return tuple(sorted(frozenset().union(*outs)))
@@ -0,0 +1,895 @@
+# impt autodiff pipline
+# Copyright 20221222 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# python lib
+
+# This file contains the execution engine which applies per-galaxy functions
+# to the rows of a catalog
+
+import os
+import atexit
+from contextlib import contextmanager
+
+import numpy as np
+import jax
+import jax.numpy as jnp
+from jax import lax, vmap
+from jax.sharding import Mesh, PartitionSpec
+
+from .memory import row_footprint
+
+# We need accuracy is below 1e-6 [in case JAX is imported before impt]
+jax.config.update("jax_enable_x64", True)
+
+__all__ = [
+    "set_exec_mode",
+    "get_exec_mode",
+    "set_host_devices",
+    "enable_compilation_cache",
+    "precision",
+]
+
+# supported execution modes
+# "map":  serial lax.map over the rows of the catalog
+# "vmap": vectorized (vmap) over chunks of rows, lax.map over the chunks
+exec_modes = ("map", "vmap")
+
+_settings = {
+    "mode": "map",
+    "chunk_size": 64,
+    # bucket sizes for the number of rows ["off", "pow2" or a list of sizes]
+    "buckets": "off",
+    # smallest bucket in "pow2" bucketing
+    "min_bucket": 1024,
+    # number of devices the rows of a catalog are split across
+    "devices": 1,
+    # floating point type of the rows passed to the per-row functions [None
+    # keeps the type of the catalog]; see `precision`
+    "dtype": None,
+    # skip the rows outside the support of the observables in sums
+    "prune": True,
+    # memory budget of one call on a device [bytes]; None for no budget
+    "memory_budget": None,
+}
+
+# name of the mesh axis along the rows of a catalog
+_row_axis = "rows"
+
+
+# stack of memos shared by the functions traced into one program
+_trace_memos = []
+
+
+@contextmanager
+def shared_trace():
+    """Within this context, a per-row function called repeatedly on the same
+    (traced) input is only traced once [see `shared_call`]
+    """
+    _trace_memos.append({})
+    try:
+        yield
+    finally:
+        _trace_memos.pop()
+
+
+def shared_call(owner_key, tag, func, x):
+    """Calls func(x), reusing the output traced for the same owner key, tag
+    and input inside a `shared_trace` context
+    """
+    if not _trace_memos:
+        return func(x)
+    memo = _trace_memos[-1]
+    key = (owner_key, tag, id(x))
+    # the input is kept in the memo, so its id cannot be reused
+    if key in memo and memo[key][0] is x:
+        return memo[key][1]
+    out = func(x)
+    memo[key] = (x, out)
+    return out
+
+
+def _with_shared_trace(func):
+    """Traces func with a fresh memo, so that its common sub-functions are
+    traced once
+    """
+
+    def traced(x, *args):
+        with shared_trace():
+            return func(x, *args)
+
+    return traced
+
+
+def set_host_devices(ndevice):
+    """Exposes ndevice CPU devices in this process, so that the rows of a
+    catalog can be split across CPU cores [see `set_exec_mode`]; this needs to
+    be called before any JAX operation is executed
+
+    Args:
+        ndevice (int):      number of host CPU devices
+    """
+    ndevice = int(ndevice)
+    if ndevice < 1:
+        raise ValueError("ndevice should be a positive integer")
+    try:
+        jax.config.update("jax_num_cpu_devices", ndevice)
+    except AttributeError:
+        # older versions of jax
+        flag = "--xla_force_host_platform_device_count=%d" % ndevice
+        os.environ["XLA_FLAGS"] = (os.environ.get("XLA_FLAGS", "") + " " + flag).strip()
+    except RuntimeError:
+        if len(jax.devices("cpu")) != ndevice:
+            raise RuntimeError(
+                "set_host_devices should be called before any JAX operation"
+            )
+    return
+
+
+def enable_compilation_cache(cache_dir=None, max_size=2**30, min_compile_time=0.5):
+    """Enables the persistent (on-disk) cache of the compiled programs, so
+    that the processes running the same observables on the same machine
+    compile them once. A program is looked up by a hash of its lowered
+    computation, which depends on the structure of the observables and on the
+    values of their parameters (e.g., FpfsParams), but not on the Python
+    objects or the process
+
+    Args:
+        cache_dir (str):        directory of the cache; default to the
+                                environment variable IMPT_CACHE_DIR or
+                                ~/.cache/impt
+        max_size (int):         size limit of the cache in bytes; the least
+                                recently used programs are evicted when the
+                                limit is exceeded [-1 for no limit]
+        min_compile_time (float): programs compiled faster than this (in
+                                seconds) are not cached
+    Returns:
+        cache_dir (str):        directory of the cache
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get(
+            "IMPT_CACHE_DIR",
+            os.path.join(os.path.expanduser("~"), ".cache", "impt"),
+        )
+    cache_dir = os.path.abspath(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    jax.config.update("jax_enable_compilation_cache", True)
+    jax.config.update("jax_compilation_cache_dir", cache_dir)
+    try:
+        # jax evicts the least recently used programs itself, but needs
+        # filelock to do so
+        import filelock  # noqa: F401
+
+        jax.config.update("jax_compilation_cache_max_size", int(max_size))
+    except ImportError:
+        jax.config.update("jax_compilation_cache_max_size", -1)
+        if max_size >= 0:
+            prune_compilation_cache(cache_dir, max_size)
+            atexit.register(prune_compilation_cache, cache_dir, max_size)
+    jax.config.update("jax_persistent_cache_min_compile_time_secs", min_compile_time)
+    jax.config.update("jax_persistent_cache_min_entry_size_bytes", 0)
+    # the cache is initialized by the first compilation; reset it in case the
+    # process has already compiled something
+    from jax.experimental.compilation_cache import compilation_cache
+
+    compilation_cache.reset_cache()
+    return cache_dir
+
+
+def prune_compilation_cache(cache_dir, max_size):
+    """Removes the least recently used files of the compilation cache until
+    its size is below max_size bytes
+
+    Args:
+        cache_dir (str):        directory of the cache
+        max_size (int):         size limit of the cache in bytes
+    """
+    entries = []
+    for root, _, fnames in os.walk(cache_dir):
+        for fname in fnames:
+            path = os.path.join(root, fname)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                # removed by another process
+                continue
+            entries.append((max(st.st_atime, st.st_mtime), st.st_size, path))
+    total = sum(ee[1] for ee in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+    return
+
+
+def set_exec_mode(
+    mode=None,
+    chunk_size=None,
+    buckets=None,
+    min_bucket=None,
+    devices=None,
+    prune=None,
+    memory_budget=None,
+):
+    """Sets the global execution mode used to apply observables to catalogs
+
+    Args:
+        mode (str):         execution mode ["map" or "vmap"]
+        chunk_size (int):   number of rows vectorized together in "vmap" mode
+        buckets (str|list): padding of the number of rows before calling the
+                            compiled functions, "off" (no padding), "pow2"
+                            (next power of two) or a list of bucket sizes
+        min_bucket (int):   smallest bucket size in "pow2" bucketing
+        devices (int|str):  number of devices the rows are split across, or
+                            "all" for all the devices [see `set_host_devices`
+                            to expose several CPU devices]
+        prune (bool):       whether to skip the rows where the observables
+                            and their derivatives vanish (e.g., zero
+                            selection weight) in sums [see `NlBase.support`]
+        memory_budget (float|str):  memory available to one call on a device
+                                    [bytes], or "off" for no budget; the
+                                    number of rows evaluated together is
+                                    reduced to fit it, and MemoryError is
+                                    raised if the catalog and the stored
+                                    outputs do not fit [see
+                                    `estimate_memory`]
+    """
+    if mode is not None:
+        if mode not in exec_modes:
+            raise ValueError("mode: %s is not supported" % mode)
+        _settings["mode"] = mode
+    if chunk_size is not None:
+        if int(chunk_size) < 1:
+            raise ValueError("chunk_size should be a positive integer")
+        _settings["chunk_size"] = int(chunk_size)
+    if buckets is not None:
+        if isinstance(buckets, str):
+            if buckets not in ("off", "pow2"):
+                raise ValueError("buckets: %s is not supported" % buckets)
+        else:
+            buckets = sorted(int(bb) for bb in buckets)
+            if len(buckets) == 0 or buckets[0] < 1:
+                raise ValueError("bucket sizes should be positive integers")
+        _settings["buckets"] = buckets
+    if min_bucket is not None:
+        _settings["min_bucket"] = max(int(min_bucket), 1)
+    if devices is not None:
+        ndevice = len(jax.devices())
+        if devices == "all":
+            devices = ndevice
+        devices = int(devices)
+        if devices < 1 or devices > ndevice:
+            raise ValueError(
+                "devices should be between 1 and %d (the number of devices)" % ndevice
+            )
+        _settings["devices"] = devices
+    if prune is not None:
+        _settings["prune"] = bool(prune)
+    if memory_budget is not None:
+        if memory_budget == "off":
+            memory_budget = None
+        elif float(memory_budget) <= 0.0:
+            raise ValueError("memory_budget should be positive")
+        else:
+            memory_budget = int(memory_budget)
+        _settings["memory_budget"] = memory_budget
+    return
+
+
+@contextmanager
+def precision(dtype):
+    """Within this context, the per-row functions (observables and their
+    derivatives) are evaluated with the rows cast to dtype, while the sums
+    over rows are accumulated in float64; other JAX code in the process is
+    not affected [see `impt.check_precision` for the error of the outputs]
+
+    Args:
+        dtype (str):        floating point type ["float32" or "float64"]
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError("dtype: %s is not supported" % dtype)
+    old = _settings["dtype"]
+    _settings["dtype"] = dtype
+    try:
+        yield
+    finally:
+        _settings["dtype"] = old
+
+
+def get_precision():
+    """Returns the floating point type of the rows [None if the type of the
+    catalog is kept]
+    """
+    return _settings["dtype"]
+
+
+def get_exec_mode():
+    """Returns the global execution mode and chunk size"""
+    return _settings["mode"], _settings["chunk_size"]
+
+
+def get_memory_budget():
+    """Returns the memory budget of one call on a device [bytes; None for no
+    budget]
+    """
+    return _settings["memory_budget"]
+
+
+def prune_enabled():
+    """Returns whether the rows outside the support of the observables are
+    skipped in sums
+    """
+    return _settings["prune"]
+
+
+def resolve_mode(mode=None, chunk_size=None):
+    """Fills the unset execution options with the global settings"""
+    if mode is None:
+        mode = _settings["mode"]
+    if mode not in exec_modes:
+        raise ValueError("mode: %s is not supported" % mode)
+    if chunk_size is None:
+        chunk_size = _settings["chunk_size"]
+    return mode, int(chunk_size)
+
+
+def _is_symbolic(dim):
+    """Whether a dimension is symbolic [in shape-polymorphic export]"""
+    return not isinstance(dim, (int, np.integer))
+
+
+def _clip_chunk(chunk_size, nrow):
+    """Clips the chunk size to the number of rows (if it is known)"""
+    if _is_symbolic(nrow):
+        return chunk_size
+    return max(min(chunk_size, nrow), 1)
+
+
+def pad_rows(cat, nrow):
+    """Pads the catalog to nrow rows by repeating its last row (so that
+    the padded rows are valid inputs of the observable functions)
+    """
+    npad = nrow - cat.shape[0]
+    if not _is_symbolic(npad) and npad == 0:
+        return cat
+    return jnp.concatenate([cat, jnp.repeat(cat[-1:], npad, axis=0)], axis=0)
+
+
+def map_rows(func, cat, mode=None, chunk_size=None):
+    """Applies a per-row function to every row of the catalog
+
+    Args:
+        func (Callable):    function applied to a row
+        cat (ndarray):      input catalog [shape: (nrow, ncol)]
+        mode (str):         execution mode ["map" or "vmap"]
+        chunk_size (int):   number of rows vectorized together in "vmap" mode
+    Returns:
+        out (ndarray):      stacked outputs of func [shape: (nrow, ...)]
+    """
+    mode, chunk_size = resolve_mode(mode, chunk_size)
+    if mode == "map":
+        return lax.map(func, cat)
+    nrow = cat.shape[0]
+    chunk_size = _clip_chunk(chunk_size, nrow)
+    nchunk = -(-nrow // chunk_size)
+    cat = pad_rows(cat, nchunk * chunk_size)
+    cat = cat.reshape((nchunk, chunk_size) + cat.shape[1:])
+    out = lax.map(vmap(func), cat)
+    return jax.tree_util.tree_map(
+        lambda x: x.reshape((nchunk * chunk_size,) + x.shape[2:])[:nrow],
+        out,
+    )
+
+
+def _acc_dtype(dtype):
+    """Returns the type used to accumulate the outputs of type dtype"""
+    if jnp.issubdtype(dtype, jnp.floating):
+        return jnp.promote_types(dtype, jnp.float64)
+    return dtype
+
+
+def _kahan_add(total, comp, part):
+    """Adds part to total with Kahan's compensated summation"""
+    y = part - comp
+    out = total + y
+    comp = (out - total) - y
+    return out, comp
+
+
+def sum_rows(func, cat, nvalid=None, mode=None, chunk_size=None):
+    """Sums a per-row function over the rows of the catalog; the catalog is
+    processed in chunks with lax.scan, so that only the outputs of one chunk
+    are stored, and the chunk sums are accumulated with compensated summation
+
+    Args:
+        func (Callable):    function applied to a row
+        cat (ndarray):      input catalog [shape: (nrow, ncol)]
+        nvalid (int):       number of valid rows [the rest are padding];
+                            default to all the rows
+        mode (str):         execution mode within a chunk ["map" or "vmap"]
+        chunk_size (int):   number of rows in a chunk
+    Returns:
+        out (ndarray):      sum of the outputs of func
+    """
+    mode, chunk_size = resolve_mode(mode, chunk_size)
+    nrow = cat.shape[0]
+    if nvalid is None:
+        nvalid = nrow
+    # the output shapes from a dummy row [the catalog may be empty]
+    shapes = jax.eval_shape(func, jnp.zeros(cat.shape[1:], cat.dtype))
+    zeros = jax.tree_util.tree_map(
+        lambda x: jnp.zeros(x.shape, _acc_dtype(x.dtype)), shapes
+    )
+    if nrow == 0:
+        return zeros
+    chunk_size = _clip_chunk(chunk_size, nrow)
+    nchunk = -(-nrow // chunk_size)
+    cat = pad_rows(cat, nchunk * chunk_size)
+    cat = cat.reshape((nchunk, chunk_size) + cat.shape[1:])
+    inds = jnp.arange(nchunk * chunk_size).reshape((nchunk, chunk_size))
+    if mode == "map":
+        inner = lambda rows: lax.map(func, rows)
+    else:
+        inner = vmap(func)
+
+    def chunk_sum(out, mask):
+        mask = mask.reshape(mask.shape + (1,) * (out.ndim - 1))
+        # accumulated in float64 even if the rows are in lower precision
+        out = out.astype(_acc_dtype(out.dtype))
+        return jnp.sum(jnp.where(mask, out, 0.0), axis=0)
+
+    def step(carry, xs):
+        rows, ind = xs
+        out = inner(rows)
+        part = jax.tree_util.tree_map(lambda x: chunk_sum(x, ind < nvalid), out)
+        total, comp = carry
+        flat = [
+            _kahan_add(tt, cc, pp)
+            for tt, cc, pp in zip(
+                jax.tree_util.tree_leaves(total),
+                jax.tree_util.tree_leaves(comp),
+                jax.tree_util.tree_leaves(part),
+            )
+        ]
+        tree = jax.tree_util.tree_structure(total)
+        total = jax.tree_util.tree_unflatten(tree, [ff[0] for ff in flat])
+        comp = jax.tree_util.tree_unflatten(tree, [ff[1] for ff in flat])
+        return (total, comp), None
+
+    (total, _), _ = lax.scan(step, (zeros, zeros), (cat, inds))
+    return total
+
+
+def segment_sum_rows(func, cat, seg, nseg, mode=None, chunk_size=None):
+    """Sums a per-row function over the rows of each segment of the catalog
+    [e.g., the rows from one of several packed catalogs]; the catalog is
+    processed in chunks as in `sum_rows`
+
+    Args:
+        func (Callable):    function applied to a row
+        cat (ndarray):      input catalog [shape: (nrow, ncol)]
+        seg (ndarray):      segment index of each row; rows with an index
+                            outside [0, nseg) (e.g., padding) are dropped
+        nseg (int):         number of segments
+        mode (str):         execution mode within a chunk ["map" or "vmap"]
+        chunk_size (int):   number of rows in a chunk
+    Returns:
+        out (ndarray):      sums of the outputs of func [shape: (nseg, ...)]
+    """
+    mode, chunk_size = resolve_mode(mode, chunk_size)
+    nrow = cat.shape[0]
+    # the output shapes from a dummy row [the catalog may be empty]
+    shapes = jax.eval_shape(func, jnp.zeros(cat.shape[1:], cat.dtype))
+    zeros = jax.tree_util.tree_map(
+        lambda x: jnp.zeros((nseg,) + x.shape, _acc_dtype(x.dtype)), shapes
+    )
+    if nrow == 0:
+        return zeros
+    chunk_size = _clip_chunk(chunk_size, nrow)
+    nchunk = -(-nrow // chunk_size)
+    npad = nchunk * chunk_size - nrow
+    cat = pad_rows(cat, nchunk * chunk_size)
+    seg = jnp.concatenate([seg, jnp.full((npad,), nseg, dtype=seg.dtype)])
+    cat = cat.reshape((nchunk, chunk_size) + cat.shape[1:])
+    seg = seg.reshape((nchunk, chunk_size))
+    if mode == "map":
+        inner = lambda rows: lax.map(func, rows)
+    else:
+        inner = vmap(func)
+
+    def chunk_sum(out, ids):
+        out = out.astype(_acc_dtype(out.dtype))
+        return jax.ops.segment_sum(out, ids, num_segments=nseg)
+
+    def step(carry, xs):
+        rows, ids = xs
+        out = inner(rows)
+        part = jax.tree_util.tree_map(lambda x: chunk_sum(x, ids), out)
+        total, comp = carry
+        flat = [
+            _kahan_add(tt, cc, pp)
+            for tt, cc, pp in zip(
+                jax.tree_util.tree_leaves(total),
+                jax.tree_util.tree_leaves(comp),
+                jax.tree_util.tree_leaves(part),
+            )
+        ]
+        tree = jax.tree_util.tree_structure(total)
+        total = jax.tree_util.tree_unflatten(tree, [ff[0] for ff in flat])
+        comp = jax.tree_util.tree_unflatten(tree, [ff[1] for ff in flat])
+        return (total, comp), None
+
+    (total, _), _ = lax.scan(step, (zeros, zeros), (cat, seg))
+    return total
+
+
+def bucket_size(nrow):
+    """Returns the padded number of rows for a catalog with nrow rows"""
+    buckets = _settings["buckets"]
+    if buckets == "off":
+        return nrow
+    if buckets == "pow2":
+        nb = _settings["min_bucket"]
+        while nb < nrow:
+            nb *= 2
+        return nb
+    for nb in buckets:
+        if nb >= nrow:
+            return nb
+    # larger than all buckets, use a multiple of the largest one
+    return -(-nrow // buckets[-1]) * buckets[-1]
+
+
+def pad_to_bucket(cat, multiple=1):
+    """Pads the catalog to its bucket size
+
+    Args:
+        cat (ndarray):      input catalog [shape: (nrow, ncol)]
+        multiple (int):     the padded length is rounded up to a multiple of
+                            this number [e.g., the number of devices]
+    Returns:
+        out (ndarray):      padded catalog [shape: (nbucket, ncol)]
+        mask (ndarray):     validity mask of the padded rows
+    """
+    nrow = cat.shape[0]
+    if nrow == 0:
+        # nothing to pad with
+        return cat, np.zeros(0, dtype=bool)
+    nb = -(-bucket_size(nrow) // multiple) * multiple
+    mask = np.arange(nb) < nrow
+    if nb == nrow:
+        return cat, mask
+    # pad on host so that each new catalog length does not compile a new
+    # padding program
+    cat = np.asarray(cat)
+    pad = np.broadcast_to(cat[-1:], (nb - nrow,) + cat.shape[1:])
+    return np.concatenate([cat, pad], axis=0), mask
+
+
+def shard_rows(func, ndevice, in_specs, out_specs):
+    """Maps func over the shards of a catalog split along its rows across
+    ndevice devices
+    """
+    mesh = Mesh(np.array(jax.devices()[:ndevice]), (_row_axis,))
+    # the per-row functions are not annotated for replication (e.g.
+    # jnp.piecewise branches), so the replication check is switched off
+    if hasattr(jax, "shard_map"):
+        return jax.shard_map(
+            func,
+            mesh=mesh,
+            in_specs=in_specs,
+            out_specs=out_specs,
+            check_vma=False,
+        )
+    # older versions of jax
+    from jax.experimental.shard_map import shard_map
+
+    return shard_map(
+        func,
+        mesh=mesh,
+        in_specs=in_specs,
+        out_specs=out_specs,
+        check_rep=False,
+    )
+
+
+def compile_rows(func, mode, chunk_size, donate=False, ndevice=1, nargs=0):
+    """Returns a compiled function applying func to every row of a catalog;
+    with ndevice > 1, the rows are split evenly across the devices. The
+    compiled function takes nargs extra (traced) arguments after the catalog,
+    which are passed to func after the row
+    """
+    # buffer donation is not implemented for CPU
+    donate = donate and jax.default_backend() != "cpu"
+    func = _with_shared_trace(func)
+
+    def run(cat, *args):
+        return map_rows(lambda x: func(x, *args), cat, mode, chunk_size)
+
+    if ndevice > 1:
+        run = shard_rows(
+            run,
+            ndevice,
+            (PartitionSpec(_row_axis),) + (PartitionSpec(),) * nargs,
+            PartitionSpec(_row_axis),
+        )
+    return jax.jit(run, donate_argnums=(0,) if donate else ())
+
+
+def compile_sum(func, mode, chunk_size, donate=False, ndevice=1, nargs=0):
+    """Returns a compiled function summing func over the valid rows of a
+    catalog [see `sum_rows`]; with ndevice > 1, each device sums its share of
+    the rows and the partial sums are added across devices [see
+    `compile_rows` for nargs]
+    """
+    donate = donate and jax.default_backend() != "cpu"
+    func = _with_shared_trace(func)
+
+    def run(cat, nvalid, *args):
+        return sum_rows(lambda x: func(x, *args), cat, nvalid, mode, chunk_size)
+
+    if ndevice > 1:
+        local = run
+
+        def run(cat, nvalid, *args):
+            # number of valid rows counted from the first local row
+            offset = lax.axis_index(_row_axis) * cat.shape[0]
+            out = local(cat, nvalid - offset, *args)
+            return jax.tree_util.tree_map(lambda x: lax.psum(x, _row_axis), out)
+
+        run = shard_rows(
+            run,
+            ndevice,
+            (PartitionSpec(_row_axis),) + (PartitionSpec(),) * (nargs + 1),
+            PartitionSpec(),
+        )
+    return jax.jit(run, donate_argnums=(0,) if donate else ())
+
+
+def compile_segment_sum(func, mode, chunk_size, nseg, donate=False, ndevice=1, nargs=0):
+    """Returns a compiled function summing func over the rows of each segment
+    of a catalog [see `segment_sum_rows`]; with ndevice > 1, each device sums
+    its share of the rows and the partial sums are added across devices [see
+    `compile_rows` for nargs]
+    """
+    donate = donate and jax.default_backend() != "cpu"
+    func = _with_shared_trace(func)
+
+    def run(cat, seg, *args):
+        return segment_sum_rows(
+            lambda x: func(x, *args), cat, seg, nseg, mode, chunk_size
+        )
+
+    if ndevice > 1:
+        local = run
+
+        def run(cat, seg, *args):
+            out = local(cat, seg, *args)
+            return jax.tree_util.tree_map(lambda x: lax.psum(x, _row_axis), out)
+
+        run = shard_rows(
+            run,
+            ndevice,
+            (PartitionSpec(_row_axis),) * 2 + (PartitionSpec(),) * nargs,
+            PartitionSpec(),
+        )
+    return jax.jit(run, donate_argnums=(0,) if donate else ())
+
+
+def clear_executables(owner):
+    """Drops the compiled executables cached on the owner (needs to be called
+    when the functions or the constants they close over are updated)
+    """
+    owner.__dict__.pop("_executables", None)
+    owner.__dict__.pop("_footprints", None)
+    return
+
+
+def _row_footprint(owner, name, ncol, dtype, args):
+    """Returns the (cached) memory footprint of one row of the per-row method
+    `name` of `owner` [see `impt.memory.row_footprint`]
+    """
+    cache = owner.__dict__.setdefault("_footprints", {})
+    shapes = tuple(np.shape(vv) for vv in jax.tree_util.tree_leaves(args))
+    key = (name, ncol, np.dtype(dtype), shapes)
+    if key not in cache:
+        func = _with_shared_trace(getattr(owner, name))
+        cache[key] = row_footprint(func, ncol, dtype, args)
+    return cache[key]
+
+
+def estimate_memory(
+    owner, name, pcat, mode, chunk_size, reduce=None, args=(), ndevice=1, nseg=0
+):
+    """Estimates the memory used on a device by applying the per-row method
+    `name` of `owner` to the (padded) catalog; the intermediate values of the
+    rows are estimated from the jaxpr of the method without the fusions of
+    XLA, so the estimate is an upper bound
+
+    Args:
+        owner (object):     observable or a group of observables
+        name (str):         name of the per-row method
+        pcat (ndarray):     padded catalog [shape: (nrow, ncol)]
+        mode (str):         execution mode ["map" or "vmap"]
+        chunk_size (int):   number of rows in a chunk
+        reduce (str):       None (per-row outputs) or "sum"
+        args (tuple):       extra arguments of the per-row method
+        ndevice (int):      number of devices the rows are split across
+        nseg (int):         number of segments [in segment sums]
+    Returns:
+        out (dict):         bytes of the catalog ("catalog"), the stored
+                            outputs ("outputs"), the intermediate values of
+                            one row ("row") and of one chunk ("chunk"), and
+                            their total ("total")
+    """
+    nrow, ncol = pcat.shape
+    out, work = _row_footprint(owner, name, ncol, pcat.dtype, args)
+    nloc = -(-nrow // ndevice)
+    res = {"catalog": nloc * ncol * pcat.dtype.itemsize, "row": work}
+    if reduce is None:
+        res["outputs"] = nloc * out
+    else:
+        # compensated sums
+        res["outputs"] = 2 * max(nseg, 1) * out
+    chunk_size = _clip_chunk(chunk_size, nloc)
+    if mode == "vmap":
+        res["chunk"] = chunk_size * work
+    elif reduce is None:
+        res["chunk"] = work
+    else:
+        # the outputs of the rows in a chunk are stored before the sum
+        res["chunk"] = work + chunk_size * out
+    res["total"] = res["catalog"] + res["outputs"] + res["chunk"]
+    return res
+
+
+def _fit_chunk(owner, name, pcat, mode, chunk_size, reduce, args, ndevice, nseg=0):
+    """Returns the chunk size fitting the memory budget [the largest power of
+    two not larger than chunk_size, so that catalogs of different lengths
+    share executables]; raises MemoryError if one row does not fit
+    """
+    budget = _settings["memory_budget"]
+    if budget is None:
+        return chunk_size
+    while True:
+        res = estimate_memory(
+            owner, name, pcat, mode, chunk_size, reduce, args, ndevice, nseg
+        )
+        if res["total"] <= budget:
+            return chunk_size
+        if chunk_size == 1 or (mode == "map" and reduce is None):
+            break
+        chunk_size = 1 << ((min(chunk_size, pcat.shape[0]) - 1).bit_length() - 1)
+    mb = 2.0**20
+    hint = (
+        "; the per-row outputs are stored, use a sum (reduce='sum'), "
+        "evaluate_stream or a contraction (e.g. BiasNoise) instead"
+        if reduce is None and res["outputs"] > res["chunk"]
+        else ""
+    )
+    raise MemoryError(
+        "%s needs about %.1f MB [catalog %.1f MB, outputs %.1f MB, "
+        "intermediate values %.1f MB] on each device, which exceeds the "
+        "memory budget of %.1f MB (see `impt.set_exec_mode`)%s"
+        % (
+            name,
+            res["total"] / mb,
+            res["catalog"] / mb,
+            res["outputs"] / mb,
+            res["chunk"] / mb,
+            budget / mb,
+            hint,
+        )
+    )
+
+
+def run_rows(owner, name, cat, mode=None, chunk_size=None, reduce=None, args=()):
+    """Applies the per-row method `name` of `owner` to the catalog using the
+    compiled executable cached on the owner; the catalog is padded to its
+    bucket size, so that catalogs with similar length share one executable
+
+    Args:
+        owner (object):     observable or linear response object
+        name (str):         name of the per-row method
+        cat (ndarray):      input catalog [shape: (nrow, ncol)]
+        mode (str):         execution mode ["map" or "vmap"]
+        chunk_size (int):   number of rows vectorized together in "vmap" mode
+        reduce (str):       None (per-row outputs), "sum" or "mean" over the
+                            rows [without storing the per-row outputs]
+        args (tuple):       extra arguments of the per-row method [traced, so
+                            the executable is reused for new values]
+    Returns:
+        out (ndarray):      stacked outputs [shape: (nrow, ...)] or their
+                            reduction over rows
+    """
+    if reduce not in (None, "sum", "mean"):
+        raise ValueError("reduce: %s is not supported" % reduce)
+    mode, chunk_size = resolve_mode(mode, chunk_size)
+    ndevice = _settings["devices"]
+    dtype = _settings["dtype"]
+    nrow = cat.shape[0]
+    pcat, _ = pad_to_bucket(cat, ndevice)
+    if dtype is not None and pcat.dtype != dtype:
+        pcat = pcat.astype(dtype)
+    padded = pcat.shape[0] != nrow
+    chunk_size = _fit_chunk(owner, name, pcat, mode, chunk_size, reduce, args, ndevice)
+    cache = owner.__dict__.setdefault("_executables", {})
+    nargs = len(args)
+    key = (name, mode, chunk_size, padded, reduce is not None, ndevice, nargs)
+    if key not in cache:
+        # the padded copy is a temporary buffer which can be donated
+        compile_func = compile_rows if reduce is None else compile_sum
+        cache[key] = compile_func(
+            getattr(owner, name), mode, chunk_size, padded, ndevice, nargs
+        )
+    if reduce is not None:
+        # the number of valid rows is traced, so catalogs in the same bucket
+        # share the executable
+        out = cache[key](pcat, nrow, *args)
+        if reduce == "mean":
+            out = jax.tree_util.tree_map(lambda x: x / nrow, out)
+        return out
+    out = cache[key](pcat, *args)
+    if not padded:
+        return out
+    return jax.tree_util.tree_map(lambda x: x[:nrow], out)
+
+
+def run_segments(owner, name, cats, mode=None, chunk_size=None, args=()):
+    """Sums the per-row method `name` of `owner` over each catalog of a list;
+    the catalogs are packed into one padded catalog with the index of the
+    catalog of each row, and are evaluated by one compiled executable
+
+    Args:
+        owner (object):     observable or a group of observables
+        name (str):         name of the per-row method
+        cats (list):        a list of catalogs [shape: (nrow_i, ncol)]
+        mode (str):         execution mode ["map" or "vmap"]
+        chunk_size (int):   number of rows vectorized together in "vmap" mode
+        args (tuple):       extra arguments of the per-row method [see
+                            `run_rows`]
+    Returns:
+        out (ndarray):      sums over the rows of each catalog [shape:
+                            (ncat, ...)]
+    """
+    mode, chunk_size = resolve_mode(mode, chunk_size)
+    ndevice = _settings["devices"]
+    dtype = _settings["dtype"]
+    nseg = len(cats)
+    if nseg == 0:
+        raise ValueError("the list of catalogs is empty")
+    # pack on host
+    cat = np.concatenate([np.asarray(cc) for cc in cats], axis=0)
+    seg = np.concatenate(
+        [np.full(len(cc), i, dtype=np.int32) for i, cc in enumerate(cats)]
+    )
+    nrow = cat.shape[0]
+    pcat, _ = pad_to_bucket(cat, ndevice)
+    if dtype is not None and pcat.dtype != dtype:
+        pcat = pcat.astype(dtype)
+    # the padded rows are in no catalog
+    seg = np.concatenate([seg, np.full(pcat.shape[0] - nrow, nseg, dtype=np.int32)])
+    chunk_size = _fit_chunk(
+        owner, name, pcat, mode, chunk_size, "sum", args, ndevice, nseg
+    )
+    cache = owner.__dict__.setdefault("_executables", {})
+    key = (name, mode, chunk_size, "segment", nseg, ndevice, len(args))
+    if key not in cache:
+        cache[key] = compile_segment_sum(
+            getattr(owner, name), mode, chunk_size, nseg, True, ndevice, len(args)
+        )
+    return cache[key](pcat, seg, *args)
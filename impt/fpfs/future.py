@@ -18,6 +18,7 @@
 # from functools import partial
 
 import numpy as np
+import jax.numpy as jnp
 from flax import struct
 from .default import npeak
 
@@ -25,12 +26,13 @@ from .default import indexes as did
 from ..base import NlBase
 from .linobs import FpfsLinResponse
 from .utils import tsfunc2, smfunc, ssfunc2, ssfunc3
-from ..perturb import BiasNoise, RespG1, RespG2
+from ..perturb import BiasNoise, RespG, RespG1, RespG2
 
 __all__ = [
     "FpfsExtParams",
     "FpfsExtE1",
     "FpfsExtE2",
+    "FpfsExtE",
 ]
 
 """
@@ -42,7 +44,9 @@ or take it as an example to develop new system
 
 
 class FpfsExtParams(struct.PyTreeNode):
-    """FPFS parameter tree, these parameters are fixed in the tree"""
+    """FPFS parameter tree, these parameters are the leaves of the tree, so
+    they can be traced (see `NlBase.evaluate`)
+    """
 
     # Exting parameter
     C0: float = struct.field(pytree_node=True, default=5.0)
@@ -52,22 +56,22 @@ class FpfsExtParams(struct.PyTreeNode):
 
     # flux selection
     # cut on magntidue
-    lower_m00: float = struct.field(pytree_node=False, default=0.2)
+    lower_m00: float = struct.field(pytree_node=True, default=0.2)
     # softening paramter for cut on flux
-    sigma_m00: float = struct.field(pytree_node=False, default=0.2)
+    sigma_m00: float = struct.field(pytree_node=True, default=0.2)
 
     # size selection
     # cut on size
-    lower_r2: float = struct.field(pytree_node=False, default=0.03)
-    upper_r2: float = struct.field(pytree_node=False, default=2.0)
+    lower_r2: float = struct.field(pytree_node=True, default=0.03)
+    upper_r2: float = struct.field(pytree_node=True, default=2.0)
     # softening paramter for cut on size
-    sigma_r2: float = struct.field(pytree_node=False, default=0.2)
+    sigma_r2: float = struct.field(pytree_node=True, default=0.2)
 
     # peak selection
     # cut on peak
-    lower_v: float = struct.field(pytree_node=False, default=0.005)
+    lower_v: float = struct.field(pytree_node=True, default=0.005)
     # softening parameter for cut on peak
-    sigma_v: float = struct.field(pytree_node=False, default=0.2)
+    sigma_v: float = struct.field(pytree_node=True, default=0.2)
 
 
 class FpfsObsBase(NlBase):
@@ -91,32 +95,19 @@ class FpfsObsBase(NlBase):
             lin_resp=lin_resp,
         )
 
-
-class FpfsExtE1(FpfsObsBase):
-    """FPFS selection weight"""
-
-    def __init__(self, params, parent=None, skip=1, func_name="ts2"):
-        self.nmodes = 31
-        self.skip = skip
-        super().__init__(
-            params=params,
-            parent=parent,
-            func_name=func_name,
-        )
-
-    # @partial(jit, static_argnums=(0,))
-    def _base_func(self, cat):
+    def _weight(self, cat):
+        """Returns the selection and detection weight"""
         # selection on flux
         w0 = self.ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
 
         # selection on size (lower limit)
         # (M00 + M20) / M00 > lower_r2_lower
+        # M00 ( 1 - lower_r2_lower) + M20 > 0
         r2l = cat[did["m00"]] * (1.0 - self.params.lower_r2) + cat[did["m20"]]
         w2l = self.ufunc(r2l, self.params.sigma_r2, self.params.sigma_r2)
 
         # selection on size (upper limit)
         # (M00 + M20) / M00 < upper_r2
-        # M00 ( 1 - lower_r2_lower) + M20 > 0
         # r2u = cat[did["m00"]] * (self.params.upper_r2 - 1.0) - cat[did["m20"]]
         # w2u = self.ufunc(r2u, 0.0, self.params.sigma_r2)
         w2u = 1.0
@@ -131,13 +122,30 @@ class FpfsExtE1(FpfsObsBase):
                 self.params.lower_v,
                 self.params.sigma_v,
             )
+        return wdet * wsel
 
-        # ellipticity
-        denom = (cat[did["m00"]] + self.params.C0) ** self.params.alpha * (
+    def _denom(self, cat):
+        """Returns the denominator of the ellipticity"""
+        return (cat[did["m00"]] + self.params.C0) ** self.params.alpha * (
             cat[did["m00"]] + cat[did["m20"]] + self.params.C2
         ) ** self.params.beta
-        e1 = cat[did["m22c"]] / denom
-        return wdet * wsel * e1
+
+
+class FpfsExtE1(FpfsObsBase):
+    """FPFS selection weight"""
+
+    def __init__(self, params, parent=None, skip=1, func_name="ts2"):
+        self.nmodes = 31
+        self.skip = skip
+        super().__init__(
+            params=params,
+            parent=parent,
+            func_name=func_name,
+        )
+
+    # @partial(jit, static_argnums=(0,))
+    def _base_func(self, cat):
+        return self._weight(cat) * cat[did["m22c"]] / self._denom(cat)
 
 
 class FpfsExtE2(FpfsObsBase):
@@ -154,61 +162,43 @@ class FpfsExtE2(FpfsObsBase):
 
     # @partial(jit, static_argnums=(0,))
     def _base_func(self, cat):
-        # selection on flux
-        w0 = self.ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
+        return self._weight(cat) * cat[did["m22s"]] / self._denom(cat)
 
-        # selection on size (lower limit)
-        # (M00 + M20) / M00 > lower_r2_lower
-        # M00 ( 1 - lower_r2_lower) + M20 > 0
-        r2l = cat[did["m00"]] * (1.0 - self.params.lower_r2) + cat[did["m20"]]
-        w2l = self.ufunc(r2l, self.params.sigma_r2, self.params.sigma_r2)
 
-        # selection on size (upper limit)
-        # (M00 + M20) / M00 < upper_r2
-        # r2u = cat[did["m00"]] * (self.params.upper_r2 - 1.0) - cat[did["m20"]]
-        # w2u = self.ufunc(r2u, 0.0, self.params.sigma_r2)
-        w2u = 1.0
-        wsel = w0 * w2l * w2u
+class FpfsExtE(FpfsObsBase):
+    """FPFS weighted ellipticity (both components) [shape: (2,)]; the weight
+    is computed once for the two components
+    """
 
-        # detection
-        wdet = 1.0
-        for i in range(0, npeak, self.skip):
-            # v_i > lower_v
-            wdet = wdet * self.ufunc(
-                cat[did["v%d" % i]],
-                self.params.lower_v,
-                self.params.sigma_v,
-            )
+    def __init__(self, params, parent=None, skip=1, func_name="ts2"):
+        self.nmodes = 31
+        self.skip = skip
+        super().__init__(
+            params=params,
+            parent=parent,
+            func_name=func_name,
+        )
 
-        # ellipticity
-        denom = (cat[did["m00"]] + self.params.C0) ** self.params.alpha * (
-            cat[did["m00"]] + cat[did["m20"]] + self.params.C2
-        ) ** self.params.beta
-        e2 = cat[did["m22s"]] / denom
-        return wdet * wsel * e2
+    def _base_func(self, cat):
+        ell = jnp.stack([cat[did["m22c"]], cat[did["m22s"]]])
+        return self._weight(cat) * ell / self._denom(cat)
 
 
-def prepare_func_e1(
-    cov_mat,
-    ratio=1.3,
-    c0=4.0,
-    c2=4.0,
-    alpha=0.2,
-    beta=0.8,
-    snr_min=12,
-    r2_min=0.03,
-    r2_max=2.0,
-):
+def _prepare_params(cov_mat, ratio, c0, c2, alpha, beta, snr_min, r2_min, r2_max):
+    """Returns the parameters scaled by the noise level of the modes"""
     std_modes = np.sqrt(np.diagonal(cov_mat))
-    std_m00 = std_modes[did["m00"]]
+    # python floats are weakly typed, so they do not promote the precision
+    # of the rows (see `impt.precision`)
+    std_m00 = float(std_modes[did["m00"]])
     std_m20 = np.sqrt(
         cov_mat[did["m00"], did["m00"]]
         + cov_mat[did["m20"], did["m20"]]
         + cov_mat[did["m00"], did["m20"]]
         + cov_mat[did["m20"], did["m00"]]
     )
-    std_v0 = std_modes[did["v0"]]
-    params = FpfsExtParams(
+    std_m20 = float(std_m20)
+    std_v0 = float(std_modes[did["v0"]])
+    return FpfsExtParams(
         C0=c0 * std_m00,
         C2=c2 * std_m20,
         alpha=alpha,
@@ -221,6 +211,22 @@ def prepare_func_e1(
         sigma_r2=ratio * std_m20,
         sigma_v=ratio * std_v0,
     )
+
+
+def prepare_func_e1(
+    cov_mat,
+    ratio=1.3,
+    c0=4.0,
+    c2=4.0,
+    alpha=0.2,
+    beta=0.8,
+    snr_min=12,
+    r2_min=0.03,
+    r2_max=2.0,
+):
+    params = _prepare_params(
+        cov_mat, ratio, c0, c2, alpha, beta, snr_min, r2_min, r2_max
+    )
     funcnm = "ss2"
     e1 = FpfsExtE1(params, func_name=funcnm)
     enoise = BiasNoise(e1, cov_mat)
@@ -240,27 +246,8 @@ def prepare_func_e2(
     r2_min=0.03,
     r2_max=2.0,
 ):
-    std_modes = np.sqrt(np.diagonal(cov_mat))
-    std_m00 = std_modes[did["m00"]]
-    std_m20 = np.sqrt(
-        cov_mat[did["m00"], did["m00"]]
-        + cov_mat[did["m20"], did["m20"]]
-        + cov_mat[did["m00"], did["m20"]]
-        + cov_mat[did["m20"], did["m00"]]
-    )
-    std_v0 = std_modes[did["v0"]]
-    params = FpfsExtParams(
-        C0=c0 * std_m00,
-        C2=c2 * std_m20,
-        alpha=alpha,
-        beta=beta,
-        lower_m00=snr_min * std_m00,
-        lower_r2=r2_min,
-        upper_r2=r2_max,
-        lower_v=ratio * std_v0 * 0.4,
-        sigma_m00=ratio * std_m00,
-        sigma_r2=ratio * std_m20,
-        sigma_v=ratio * std_v0,
+    params = _prepare_params(
+        cov_mat, ratio, c0, c2, alpha, beta, snr_min, r2_min, r2_max
     )
     funcnm = "ss2"
     e2 = FpfsExtE2(params, func_name=funcnm)
@@ -268,3 +255,30 @@ def prepare_func_e2(
     res2 = RespG2(e2)
     rnoise = BiasNoise(res2, cov_mat)
     return e2, enoise, res2, rnoise
+
+
+def prepare_func_e(
+    cov_mat,
+    ratio=1.3,
+    c0=4.0,
+    c2=4.0,
+    alpha=0.2,
+    beta=0.8,
+    snr_min=12,
+    r2_min=0.03,
+    r2_max=2.0,
+):
+    """Returns the ellipticity (e1, e2) and its noise bias [shape: (2,)], the
+    shear response matrix and its noise bias [shape: (2, 2); R_ij = d e_i /
+    d g_j]; they replace `prepare_func_e1` and `prepare_func_e2` with one
+    pass [see `prepare_func_e1` for the arguments]
+    """
+    params = _prepare_params(
+        cov_mat, ratio, c0, c2, alpha, beta, snr_min, r2_min, r2_max
+    )
+    funcnm = "ss2"
+    ell = FpfsExtE(params, func_name=funcnm)
+    enoise = BiasNoise(ell, cov_mat)
+    res = RespG(ell)
+    rnoise = BiasNoise(res, cov_mat)
+    return ell, enoise, res, rnoise
@@ -18,16 +18,22 @@
 
 # from jax import jit
 # from functools import partial
+import numpy as np
 import jax.numpy as jnp
-from fitsio import read as fitsread
-import numpy.lib.recfunctions as rfn
 
 from .default import indexes as did
-from .default import col_names
+from .default import col_names, npeak
+from .. import catalog
 from ..base import LinRespBase
 
 
-__all__ = ["read_catalog", "FpfsLinResponse"]
+__all__ = [
+    "read_catalog",
+    "iter_catalog",
+    "convert_catalog",
+    "load_catalog",
+    "FpfsLinResponse",
+]
 
 
 """
@@ -38,87 +44,145 @@ or take it as an example to develop new system
 # of Observables
 
 
-def read_catalog(fname):
-    x = fitsread(fname)[col_names]
-    x = x[(x["fpfs_M00"] + x["fpfs_M20"]) > 1e-5]
-    out = rfn.structured_to_unstructured(x, copy=False)
-    out = jnp.array(out, dtype=jnp.float64)
+# columns used by the quality cut
+cut_names = ["fpfs_M00", "fpfs_M20"]
+
+
+def quality_cut(x):
+    """Returns the mask of the rows passing the quality cut"""
+    return (x["fpfs_M00"] + x["fpfs_M20"]) > 1e-5
+
+
+def read_catalog(fname, columns=None):
+    """Reads a FITS catalog and applies the quality cut; only the columns
+    which are used are read
+
+    Args:
+        fname (str):        FITS file name
+        columns (list):     columns to read, e.g., the observables to evaluate
+                            [see `impt.catalog.column_indexes`]; the other
+                            columns are set to zero [default to all]
+    Returns:
+        out (ndarray):      catalog [shape: (nrow, ncol)]
+    """
+    out = catalog.read_fits(fname, col_names, quality_cut, columns, cut_names)
+    # the matrix is already in float64 [no conversion copy]
+    out = jnp.asarray(out)
+    return out
+
+
+def iter_catalog(fname, chunk_size=1000000, prefetch=1, columns=None):
+    """Iterates over a catalog in chunks of rows, so that a large catalog is
+    processed in bounded memory; the next chunk is read in a background
+    thread while the current one is evaluated
+
+    Args:
+        fname (str):        FITS file name
+        chunk_size (int):   number of rows read at a time [the chunks are
+                            smaller after the quality cut]
+        prefetch (int):     number of chunks read in advance
+        columns (list):     columns to read [see `read_catalog`]
+    Yields:
+        out (ndarray):      a chunk of the catalog [shape: (nrow, ncol)]
+    """
+    chunks = catalog.iter_fits(
+        fname, col_names, chunk_size, quality_cut, columns, cut_names
+    )
+    yield from catalog.prefetch(chunks, prefetch)
+
+
+def convert_catalog(fname, out_name, dtype="float64", chunk_size=1000000):
+    """Converts a FITS catalog to the columnar format [see `load_catalog`];
+    the catalog is converted in chunks of rows
+
+    Args:
+        fname (str):        FITS file name
+        out_name (str):     output file name
+        dtype (str):        data type on disk ["float32" or "float64"]
+        chunk_size (int):   number of rows converted at a time
+    Returns:
+        header (dict):      header of the output catalog
+    """
+    # the rows passing the cut are counted with the columns used by the cut
+    nrow = sum(
+        len(chunk)
+        for chunk in catalog.iter_fits(fname, cut_names, chunk_size, quality_cut)
+    )
+
+    def chunks():
+        return catalog.iter_fits(fname, col_names, chunk_size, quality_cut)
+
+    return catalog.write_columnar(
+        out_name,
+        chunks,
+        col_names,
+        layout="fpfs",
+        cut="fpfs_M00 + fpfs_M20 > 1e-5",
+        dtype=dtype,
+        nrow=nrow,
+    )
+
+
+def load_catalog(fname, dtype=None, columns=None):
+    """Loads a catalog in the columnar format [see `convert_catalog`]; the
+    file is memory mapped, so nothing is read until the rows are used
+
+    Args:
+        fname (str):        file name
+        dtype (str):        data type of the output [default to the type on
+                            disk without copy; a float32 catalog can be
+                            evaluated in `impt.precision("float32")`]
+        columns (list):     columns to read [see `read_catalog`]; if given,
+                            only these columns are read and copied
+    Returns:
+        out (ndarray):      catalog [shape: (nrow, ncol)]
+    """
+    out, header = catalog.read_columnar(fname, columns)
+    if header["layout"] != "fpfs" or header["col_names"] != col_names:
+        raise ValueError("%s is not a catalog with fpfs layout" % fname)
+    if dtype is not None and out.dtype != dtype:
+        out = out.astype(dtype)
     return out
 
 
 class FpfsLinResponse(LinRespBase):
+    """Shear response of the FPFS linear observables; the response matrix is
+    sparse and is given as a list of (output, input, coefficient)
+    """
+
+    # shear response for shapelet modes [first component]
+    # TODO: Include spin-4 term in the response of M22s. Will add it when we
+    # have M44
+    # TODO: Incldue the shear response of M40 in the future. This is not
+    # required in the FPFS shear estimation (v1~v3), so I set it to zero
+    # here (But if you are interested in playing with shear response of
+    # this term, please contact me.)
+    _g1_terms = [
+        ("m00", "m22c", -np.sqrt(2.0)),
+        ("m20", "m42c", -np.sqrt(6.0)),
+        ("m22c", "m00", 1.0 / np.sqrt(2.0)),
+        ("m22c", "m40", -1.0 / np.sqrt(2.0)),
+    ] + [("v%d" % i, "v%d_g1" % i, 1.0) for i in range(npeak)]
+
+    # shear response for shapelet modes [second component]
+    _g2_terms = [
+        ("m00", "m22s", -np.sqrt(2.0)),
+        ("m20", "m42s", -np.sqrt(6.0)),
+        ("m22s", "m00", 1.0 / np.sqrt(2.0)),
+        ("m22s", "m40", -1.0 / np.sqrt(2.0)),
+    ] + [("v%d" % i, "v%d_g2" % i, 1.0) for i in range(npeak)]
+
+    def response_terms(self, component):
+        """Returns the nonzero elements of the response matrix"""
+        terms = self._g1_terms if component == 1 else self._g2_terms
+        return [(did[oo], did[ii], cc) for oo, ii, cc in terms]
 
-    # @partial(jit, static_argnums=(0,))
     def _dg1(self, row):
         """Returns shear response array [first component] of shapelet pytree"""
-        # shear response for shapelet modes
-        fpfs_m00 = -jnp.sqrt(2.0) * row[did["m22c"]]
-        fpfs_m20 = -jnp.sqrt(6.0) * row[did["m42c"]]
-        fpfs_m22c = (row[did["m00"]] - row[did["m40"]]) / jnp.sqrt(2.0)
-        # TODO: Include spin-4 term. Will add it when we have M44
-        fpfs_m22s = jnp.zeros_like(row[did["m22s"]])
-        # TODO: Incldue the shear response of M40 in the future. This is not
-        # required in the FPFS shear estimation (v1~v3), so I set it to zero
-        # here (But if you are interested in playing with shear response of
-        # this term, please contact me.)
-        fpfs_m40 = jnp.zeros_like(row[did["m40"]])
-        fpfs_m42c = jnp.zeros_like(row[did["m42c"]])
-        fpfs_m42s = jnp.zeros_like(row[did["m42s"]])
-        out = jnp.stack(
-            [
-                fpfs_m00,
-                fpfs_m20,
-                fpfs_m22c,
-                fpfs_m22s,
-                fpfs_m40,
-                fpfs_m42c,
-                fpfs_m42s,
-                row[did["v0_g1"]],
-                row[did["v1_g1"]],
-                row[did["v2_g1"]],
-                row[did["v3_g1"]],
-                row[did["v4_g1"]],
-                row[did["v5_g1"]],
-                row[did["v6_g1"]],
-                row[did["v7_g1"]],
-            ]
-            + [0] * 16
-        )
-        return out
-
-    # @partial(jit, static_argnums=(0,))
+        mat = self.response_matrix(1, row.shape[-1], row.dtype)
+        return jnp.dot(mat, row)
+
     def _dg2(self, row):
         """Returns shear response array [second component] of shapelet pytree"""
-        fpfs_m00 = -jnp.sqrt(2.0) * row[did["m22s"]]
-        fpfs_m20 = -jnp.sqrt(6.0) * row[did["m42s"]]
-        # TODO: Include spin-4 term. Will add it when we have M44
-        fpfs_m22c = jnp.zeros_like(row[did["m22c"]])
-        fpfs_m22s = (row[did["m00"]] - row[did["m40"]]) / jnp.sqrt(2.0)
-        # TODO: Incldue the shear response of M40 in the future. This is not
-        # required in the FPFS shear estimation (v1~v3), so I set it to zero
-        # here (But if you are interested in playing with shear response of
-        # this term, please contact me.)
-        fpfs_m40 = jnp.zeros_like(row[did["m40"]])
-        fpfs_m42c = jnp.zeros_like(row[did["m42c"]])
-        fpfs_m42s = jnp.zeros_like(row[did["m42s"]])
-        out = jnp.stack(
-            [
-                fpfs_m00,
-                fpfs_m20,
-                fpfs_m22c,
-                fpfs_m22s,
-                fpfs_m40,
-                fpfs_m42c,
-                fpfs_m42s,
-                row[did["v0_g2"]],
-                row[did["v1_g2"]],
-                row[did["v2_g2"]],
-                row[did["v3_g2"]],
-                row[did["v4_g2"]],
-                row[did["v5_g2"]],
-                row[did["v6_g2"]],
-                row[did["v7_g2"]],
-            ]
-            + [0] * 16
-        )
-        return out
+        mat = self.response_matrix(2, row.shape[-1], row.dtype)
+        return jnp.dot(mat, row)
@@ -17,22 +17,26 @@
 # from jax import jit
 # from functools import partial
 
+import jax.numpy as jnp
 from flax import struct
 from .default import npeak
 
 from .default import indexes as did
-from ..base import NlBase
+from ..base import NlBase, struct_key
+from ..engine import shared_call
 from .linobs import FpfsLinResponse
-from .utils import tsfunc2, smfunc, ssfunc2, ssfunc3
+from .utils import tsfunc2, smfunc, ssfunc2, ssfunc3, support_func
 
 __all__ = [
     "FpfsParams",
     "FpfsE1",
     "FpfsE2",
+    "FpfsE",
     "FpfsWeightSelect",
     "FpfsWeightDetect",
     "FpfsWeightE1",
     "FpfsWeightE2",
+    "FpfsWeightE",
 ]
 
 """
@@ -44,29 +48,31 @@ or take it as an example to develop new system
 
 
 class FpfsParams(struct.PyTreeNode):
-    """FPFS parameter tree, these parameters are fixed in the tree"""
+    """FPFS parameter tree, these parameters are the leaves of the tree, so
+    they can be traced (see `NlBase.evaluate`)
+    """
 
     # Weighting parameter
-    Const: float = struct.field(pytree_node=False, default=10.0)
+    Const: float = struct.field(pytree_node=True, default=10.0)
 
     # flux selection
     # cut on magntidue
-    lower_m00: float = struct.field(pytree_node=False, default=0.2)
+    lower_m00: float = struct.field(pytree_node=True, default=0.2)
     # softening paramter for cut on flux
-    sigma_m00: float = struct.field(pytree_node=False, default=0.2)
+    sigma_m00: float = struct.field(pytree_node=True, default=0.2)
 
     # size selection
     # cut on size
-    lower_r2: float = struct.field(pytree_node=False, default=0.03)
-    upper_r2: float = struct.field(pytree_node=False, default=2.0)
+    lower_r2: float = struct.field(pytree_node=True, default=0.03)
+    upper_r2: float = struct.field(pytree_node=True, default=2.0)
     # softening paramter for cut on size
-    sigma_r2: float = struct.field(pytree_node=False, default=0.2)
+    sigma_r2: float = struct.field(pytree_node=True, default=0.2)
 
     # peak selection
     # cut on peak
-    lower_v: float = struct.field(pytree_node=False, default=0.005)
+    lower_v: float = struct.field(pytree_node=True, default=0.005)
     # softening parameter for cut on peak
-    sigma_v: float = struct.field(pytree_node=False, default=0.2)
+    sigma_v: float = struct.field(pytree_node=True, default=0.2)
 
 
 class FpfsObsBase(NlBase):
@@ -90,6 +96,60 @@ class FpfsObsBase(NlBase):
             lin_resp=lin_resp,
         )
 
+    def _shared_weight(self, name, func, cat):
+        """Evaluates a weight function which is shared by the observables
+        with the same parameters in one program (it is traced once)
+        """
+        skip = getattr(self, "skip", 1)
+        key = (name, struct_key(self.params), self.ufunc, skip)
+        return shared_call(key, "weight", func, cat)
+
+    def _weight_flux_r2l(self, cat, ufunc=None):
+        """Returns the selection weight on flux and the lower limit of size
+        [with the weight function ufunc, e.g., the indicator of the support,
+        it is evaluated directly instead of shared]
+        """
+
+        def func(cat):
+            uf = self.ufunc if ufunc is None else ufunc
+            # selection on flux
+            w0 = uf(
+                cat[did["m00"]],
+                self.params.lower_m00,
+                self.params.sigma_m00,
+            )
+            # selection on size (lower limit)
+            # (M00 + M20) / M00 > lower_r2_lower
+            r2l = cat[did["m00"]] * (1.0 - self.params.lower_r2) + cat[did["m20"]]
+            w2l = uf(r2l, self.params.sigma_r2, self.params.sigma_r2)
+            return w0 * w2l
+
+        if ufunc is not None:
+            return func(cat)
+        return self._shared_weight("flux_r2l", func, cat)
+
+    def _weight_peak(self, cat, ufunc=None):
+        """Returns the detection weight on the peak modes (v_i > lower_v)
+        [with the weight function ufunc, it is evaluated directly instead of
+        shared]
+        """
+
+        def func(cat):
+            uf = self.ufunc if ufunc is None else ufunc
+            wdet = 1.0
+            for i in range(0, npeak, self.skip):
+                # v_i > lower_v
+                wdet = wdet * uf(
+                    cat[did["v%d" % i]],
+                    self.params.lower_v,
+                    self.params.sigma_v,
+                )
+            return wdet
+
+        if ufunc is not None:
+            return func(cat)
+        return self._shared_weight("peak", func, cat)
+
 
 class FpfsWeightSelect(FpfsObsBase):
     """FPFS selection weight"""
@@ -102,25 +162,36 @@ class FpfsWeightSelect(FpfsObsBase):
             func_name=func_name,
         )
 
-    # @partial(jit, static_argnums=(0,))
-    def _base_func(self, cat):
+    def _weight(self, cat, ufunc):
+        # selection weight with the weight function ufunc
         # selection on flux
-        w0 = self.ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
+        w0 = ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
 
         # selection on size (lower limit)
         # (M00 + M20) / M00 > lower_r2_lower
         r2l = cat[did["m00"]] * (1.0 - self.params.lower_r2) + cat[did["m20"]]
-        w2l = self.ufunc(r2l, self.params.sigma_r2, self.params.sigma_r2)
+        w2l = ufunc(r2l, self.params.sigma_r2, self.params.sigma_r2)
 
         # selection on size (upper limit)
         # (M00 + M20) / M00 < upper_r2
         r2u = cat[did["m00"]] * (self.params.upper_r2 - 1.0) - cat[did["m20"]]
-        w2u = self.ufunc(r2u, self.params.sigma_r2, self.params.sigma_r2)
+        w2u = ufunc(r2u, self.params.sigma_r2, self.params.sigma_r2)
         # w2l = 1.
         # w2u = 1.
         out = w0 * w2l * w2u
         return out
 
+    def _base_support(self, cat):
+        # the weight is zero where the indicator of its support is zero
+        indicator = support_func(self.ufunc)
+        if indicator is None:
+            return None
+        return self._weight(cat.T, indicator) > 0
+
+    # @partial(jit, static_argnums=(0,))
+    def _base_func(self, cat):
+        return self._weight(cat, self.ufunc)
+
 
 class FpfsWeightDetect(FpfsObsBase):
     """FPFS detection weight"""
@@ -134,15 +205,26 @@ class FpfsWeightDetect(FpfsObsBase):
             func_name=func_name,
         )
 
-    # @partial(jit, static_argnums=(0,))
-    def _base_func(self, cat):
+    def _weight(self, cat, ufunc):
+        # detection weight with the weight function ufunc
         out = 1.0
         for i in range(0, npeak, self.skip):
             # v_i - M00 * lower_v > sigma_v
             vp = cat[did["v%d" % i]] - cat[did["m00"]] * self.params.lower_v
-            out = out * self.ufunc(vp, self.params.sigma_v, self.params.sigma_v)
+            out = out * ufunc(vp, self.params.sigma_v, self.params.sigma_v)
         return out
 
+    def _base_support(self, cat):
+        # the weight is zero where the indicator of its support is zero
+        indicator = support_func(self.ufunc)
+        if indicator is None:
+            return None
+        return self._weight(cat.T, indicator) > 0
+
+    # @partial(jit, static_argnums=(0,))
+    def _base_func(self, cat):
+        return self._weight(cat, self.ufunc)
+
 
 class FpfsE1(FpfsObsBase):
     """FPFS ellipticity (first component)"""
@@ -175,6 +257,22 @@ class FpfsE2(FpfsObsBase):
         return cat[did["m22s"]] / (cat[did["m00"]] + self.params.Const)
 
 
+class FpfsE(FpfsObsBase):
+    """FPFS ellipticity (both components) [shape: (2,)]"""
+
+    def __init__(self, params, parent=None, func_name="ts2"):
+        self.nmodes = 31
+        super().__init__(
+            params=params,
+            parent=parent,
+            func_name=func_name,
+        )
+
+    def _base_func(self, cat):
+        ell = jnp.stack([cat[did["m22c"]], cat[did["m22s"]]])
+        return ell / (cat[did["m00"]] + self.params.Const)
+
+
 class FpfsWeightE1(FpfsObsBase):
     """FPFS selection weight"""
 
@@ -187,34 +285,34 @@ class FpfsWeightE1(FpfsObsBase):
             func_name=func_name,
         )
 
-    # @partial(jit, static_argnums=(0,))
-    def _base_func(self, cat):
-        # selection on flux
-        w0 = self.ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
-
-        # selection on size (lower limit)
-        # (M00 + M20) / M00 > lower_r2_lower
-        r2l = cat[did["m00"]] * (1.0 - self.params.lower_r2) + cat[did["m20"]]
-        w2l = self.ufunc(r2l, self.params.sigma_r2, self.params.sigma_r2)
+    def _weight(self, cat, ufunc=None):
+        # selection and detection weight with the weight function ufunc
+        # selection on flux and size (lower limit) [shared with FpfsWeightE2]
+        w02l = self._weight_flux_r2l(cat, ufunc)
 
         # selection on size (upper limit)
         # (M00 + M20) / M00 < upper_r2
         # M00 ( 1 - lower_r2_lower) + M20 < 0
         r2u = cat[did["m00"]] * (self.params.upper_r2 - 1.0) - cat[did["m20"]]
-        w2u = self.ufunc(r2u, self.params.sigma_r2, self.params.sigma_r2)
-        wsel = w0 * w2l * w2u
+        uf = self.ufunc if ufunc is None else ufunc
+        w2u = uf(r2u, self.params.sigma_r2, self.params.sigma_r2)
+        wsel = w02l * w2u
 
-        wdet = 1.0
-        for i in range(0, npeak, self.skip):
-            # v_i > lower_v
-            wdet = wdet * self.ufunc(
-                cat[did["v%d" % i]],
-                self.params.lower_v,
-                self.params.sigma_v,
-            )
+        # detection [shared with FpfsWeightE2]
+        wdet = self._weight_peak(cat, ufunc)
+        return wdet * wsel
 
+    def _base_support(self, cat):
+        # the weight is zero where the indicator of its support is zero
+        indicator = support_func(self.ufunc)
+        if indicator is None:
+            return None
+        return self._weight(cat.T, indicator) > 0
+
+    # @partial(jit, static_argnums=(0,))
+    def _base_func(self, cat):
         e1 = cat[did["m22c"]] / (cat[did["m00"]] + self.params.Const)
-        return wdet * wsel * e1
+        return self._weight(cat) * e1
 
 
 class FpfsWeightE2(FpfsObsBase):
@@ -229,30 +327,76 @@ class FpfsWeightE2(FpfsObsBase):
             func_name=func_name,
         )
 
+    def _weight(self, cat, ufunc=None):
+        # selection and detection weight with the weight function ufunc
+        # selection on flux and size (lower limit)
+        # M00 ( 1 - lower_r2_lower) + M20 > 0
+        w02l = self._weight_flux_r2l(cat, ufunc)
+
+        # selection on size (upper limit)
+        # (M00 + M20) / M00 < upper_r2
+        r2u = cat[did["m00"]] * (self.params.upper_r2 - 1.0) - cat[did["m20"]]
+        uf = self.ufunc if ufunc is None else ufunc
+        w2u = uf(r2u, 0.0, self.params.sigma_r2)
+        wsel = w02l * w2u
+
+        # detection
+        wdet = self._weight_peak(cat, ufunc)
+        return wdet * wsel
+
+    def _base_support(self, cat):
+        # the weight is zero where the indicator of its support is zero
+        indicator = support_func(self.ufunc)
+        if indicator is None:
+            return None
+        return self._weight(cat.T, indicator) > 0
+
     # @partial(jit, static_argnums=(0,))
     def _base_func(self, cat):
-        # selection on flux
-        w0 = self.ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
+        e2 = cat[did["m22s"]] / (cat[did["m00"]] + self.params.Const)
+        return self._weight(cat) * e2
 
-        # selection on size (lower limit)
-        # (M00 + M20) / M00 > lower_r2_lower
-        # M00 ( 1 - lower_r2_lower) + M20 > 0
-        r2l = cat[did["m00"]] * (1.0 - self.params.lower_r2) + cat[did["m20"]]
-        w2l = self.ufunc(r2l, self.params.sigma_r2, self.params.sigma_r2)
+
+class FpfsWeightE(FpfsObsBase):
+    """FPFS weighted ellipticity (both components) [shape: (2,)]; the
+    selection and detection weights are computed once for the two
+    components, which equal `FpfsWeightE1` and `FpfsWeightE2`
+    """
+
+    def __init__(self, params, parent=None, skip=1, func_name="ts2"):
+        self.nmodes = 31
+        self.skip = skip
+        super().__init__(
+            params=params,
+            parent=parent,
+            func_name=func_name,
+        )
+
+    def _base_support(self, cat):
+        # the union of the supports of the two components
+        indicator = support_func(self.ufunc)
+        if indicator is None:
+            return None
+        cat = cat.T
+        w02l = self._weight_flux_r2l(cat, indicator)
+        r2u = cat[did["m00"]] * (self.params.upper_r2 - 1.0) - cat[did["m20"]]
+        w2u1 = indicator(r2u, self.params.sigma_r2, self.params.sigma_r2)
+        w2u2 = indicator(r2u, 0.0, self.params.sigma_r2)
+        wdet = self._weight_peak(cat, indicator)
+        return wdet * w02l * (w2u1 + w2u2) > 0
+
+    def _base_func(self, cat):
+        # selection on flux and size (lower limit)
+        w02l = self._weight_flux_r2l(cat)
 
         # selection on size (upper limit)
         # (M00 + M20) / M00 < upper_r2
+        # the cuts of FpfsWeightE1 and FpfsWeightE2 are centered differently
         r2u = cat[did["m00"]] * (self.params.upper_r2 - 1.0) - cat[did["m20"]]
-        w2u = self.ufunc(r2u, 0.0, self.params.sigma_r2)
-        wsel = w0 * w2l * w2u
+        w2u1 = self.ufunc(r2u, self.params.sigma_r2, self.params.sigma_r2)
+        w2u2 = self.ufunc(r2u, 0.0, self.params.sigma_r2)
 
-        wdet = 1.0
-        for i in range(0, npeak, self.skip):
-            # v_i > lower_v
-            wdet = wdet * self.ufunc(
-                cat[did["v%d" % i]],
-                self.params.lower_v,
-                self.params.sigma_v,
-            )
-        e2 = cat[did["m22s"]] / (cat[did["m00"]] + self.params.Const)
-        return wdet * wsel * e2
+        # detection
+        wdet = self._weight_peak(cat)
+        ell = jnp.stack([w2u1 * cat[did["m22c"]], w2u2 * cat[did["m22s"]]])
+        return wdet * w02l * ell / (cat[did["m00"]] + self.params.Const)
@@ -0,0 +1,134 @@
+# impt autodiff pipline
+# Copyright 20221222 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# python lib
+
+# This file contains sweeps over the selection cuts which only evaluate the
+# galaxies in the transition band of the selection weight for each cut
+
+import numpy as np
+
+from ..base import NlBase, evaluate_many
+from ..weights import support_func
+from .default import indexes as did
+
+__all__ = ["sweep_lower_m00"]
+
+
+def _pad_size(nrow):
+    """Returns the number of rows the bands are padded to [a power of two,
+    so that the bands of different cuts share one executable]
+    """
+    return 1 << max(int(nrow) - 1, 0).bit_length()
+
+
+def _weight_funcs(obs_list):
+    """Returns the weight functions of the observables and of the observables
+    they are built on
+    """
+    out = []
+    seen = set()
+    todo = list(obs_list)
+    while todo:
+        obs = todo.pop()
+        if id(obs) in seen:
+            continue
+        seen.add(id(obs))
+        if hasattr(obs, "ufunc"):
+            out.append(obs.ufunc)
+        if obs.parent is not None:
+            todo.append(obs.parent)
+        todo.extend(oo for oo in obs._operands if isinstance(oo, NlBase))
+    return out
+
+
+def sweep_lower_m00(obs_list, cat, params, lowers, mode=None, chunk_size=None):
+    """Sums a list of observables over the catalog for a list of cuts on
+    flux (lower_m00)
+
+    The flux weight is exactly 1 for M00 > lower_m00 + sigma_m00 and 0 for
+    M00 < lower_m00 - sigma_m00, and so are its derivatives; the galaxies
+    above the transition band contribute their values with the weight set
+    to 1, which are evaluated once and summed with prefix sums over the
+    catalog sorted by M00. Only the galaxies in the band are evaluated for
+    each cut, so a cut costs O(nband) instead of O(nrow).
+
+    This requires that lower_m00 only enters the observables through the
+    flux weight, and that the weight function is flat outside the band
+    [func_name "ts2", "ss2" or "ss3"; not "sm", for which a ValueError is
+    raised].
+
+    Args:
+        obs_list (list):        a list of observables [with scalar outputs]
+        cat (ndarray):          input catalog
+        params (FpfsParams):    parameters of the observables, except for
+                                lower_m00
+        lowers (ndarray):       cuts on flux [lower_m00]
+        mode (str):             execution mode ["map" or "vmap"]
+        chunk_size (int):       number of rows vectorized together in "vmap"
+                                mode
+    Returns:
+        out (list):             a list of the sums of the observables, one for
+                                each observable [shape: (ncut,)]
+    """
+    lowers = np.atleast_1d(np.asarray(lowers, dtype=np.float64))
+    sigma = float(params.sigma_m00)
+    if sigma <= 0.0:
+        raise ValueError("sigma_m00 should be positive")
+    for ufunc in _weight_funcs(obs_list):
+        if support_func(ufunc) is None:
+            raise ValueError(
+                "The weight function %s does not have compact support"
+                % getattr(ufunc, "__name__", ufunc)
+            )
+    cat = np.asarray(cat)
+    nrow = cat.shape[0]
+    nobs = len(obs_list)
+    if nrow == 0:
+        return [np.zeros(len(lowers)) for _ in range(nobs)]
+    m00 = cat[:, did["m00"]].astype(np.float64)
+    order = np.argsort(m00, kind="stable")
+    m00 = m00[order]
+
+    # all the galaxies have weight 1 with this cut
+    full = params.replace(lower_m00=m00[0] - 2.0 * sigma)
+    vals = evaluate_many(obs_list, cat[order], mode, chunk_size, params=full)
+    # suffix sums [the sum over the sorted rows from i to the end]
+    suffix = [
+        np.concatenate([np.cumsum(np.asarray(vv, dtype=np.float64)[::-1])[::-1], [0]])
+        for vv in vals
+    ]
+
+    # the rows in the band of each cut
+    starts = np.searchsorted(m00, lowers - sigma, side="left")
+    ends = np.searchsorted(m00, lowers + sigma, side="right")
+    npad = _pad_size(np.max(ends - starts))
+    out = [np.zeros(len(lowers)) for _ in range(nobs)]
+    for j, (lower, i0, i1) in enumerate(zip(lowers, starts, ends)):
+        for k in range(nobs):
+            out[k][j] = suffix[k][i1]
+        if i1 == i0:
+            continue
+        # the padded rows are copies of a galaxy and are not summed
+        inds = np.full(npad, order[i0])
+        inds[: i1 - i0] = order[i0:i1]
+        band = evaluate_many(
+            obs_list,
+            cat[inds],
+            mode,
+            chunk_size,
+            params=params.replace(lower_m00=lower),
+        )
+        for k in range(nobs):
+            out[k][j] += np.sum(np.asarray(band[k], dtype=np.float64)[: i1 - i0])
+    return out
@@ -0,0 +1,82 @@
+# impt autodiff pipeline
+# Copyright 20221113 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+"""Shared fixtures of the unit tests: the test catalog, its noise covariance
+and a selected ellipticity with its shear response and noise bias
+"""
+import os
+import inspect
+import fitsio
+import pytest
+from collections import namedtuple
+
+import impt
+
+test_fname = os.path.join(
+    impt.fpfs.__data_dir__,
+    "fpfs-cut32-0000-g1-0000.fits",
+)
+
+Pipeline = namedtuple("Pipeline", ["cat", "noise_cov", "e1", "res1", "rnoise"])
+
+
+def make_pipeline():
+    """Returns the test catalog and the observables shared by the tests"""
+    data = fitsio.read(test_fname)
+    cat = impt.fpfs.read_catalog(test_fname)
+    noise_cov = impt.fpfs.utils.fpfscov_to_imptcov(data)
+    params = impt.fpfs.FpfsParams(Const=2.0, lower_m00=0.5, sigma_m00=0.5)
+    e1 = impt.fpfs.FpfsE1(params) * impt.fpfs.FpfsWeightSelect(params)
+    res1 = impt.RespG1(e1)
+    rnoise = impt.BiasNoise(res1, noise_cov)
+    return Pipeline(cat, noise_cov, e1, res1, rnoise)
+
+
+def run_tests(*tests):
+    """Runs tests with the shared fixtures [when a test file is run as a
+    script]
+    """
+    fixtures = make_pipeline()._asdict()
+    for test in tests:
+        test(*[fixtures[nn] for nn in inspect.signature(test).parameters])
+    return
+
+
+@pytest.fixture(scope="session")
+def pipeline():
+    return make_pipeline()
+
+
+@pytest.fixture
+def cat(pipeline):
+    return pipeline.cat
+
+
+@pytest.fixture
+def noise_cov(pipeline):
+    return pipeline.noise_cov
+
+
+@pytest.fixture
+def e1(pipeline):
+    return pipeline.e1
+
+
+@pytest.fixture
+def res1(pipeline):
+    return pipeline.res1
+
+
+@pytest.fixture
+def rnoise(pipeline):
+    return pipeline.rnoise
@@ -0,0 +1,61 @@
+# impt autodiff pipeline
+# Copyright 20221113 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+"""This unit test checks whether the observables exported to an artifact
+and loaded back give the same outputs as the original observables
+"""
+import os
+import tempfile
+import numpy as np
+
+import impt
+import impt.fpfs.future as future
+
+
+def test_export(cat, noise_cov):
+    print("testing exported observables")
+    obs_list = future.prepare_func_e1(noise_cov, snr_min=0.0)
+    # catalogs with different lengths share one compiled program
+    impt.set_exec_mode(buckets="pow2", min_bucket=32)
+    try:
+        with tempfile.TemporaryDirectory() as out_dir:
+            fname = os.path.join(out_dir, "e1.npz")
+            impt.export_observables(
+                obs_list, cat.shape[1], fname, metadata={"release": "test"}
+            )
+            loaded = impt.load_observables(fname)
+            assert loaded.metadata == {"release": "test"}
+            assert loaded.info["params"][0]["C0"] == float(obs_list[0].params.C0)
+            outs0 = impt.evaluate_many(obs_list, cat)
+            # the number of rows is not fixed in the artifact
+            for nrow in [len(cat), 7]:
+                outs1 = loaded(cat[:nrow])
+                for out0, out1 in zip(outs0, outs1):
+                    np.testing.assert_array_almost_equal(out0[:nrow], out1)
+
+            fname = os.path.join(out_dir, "e1_sum.npz")
+            impt.export_observables(obs_list[:2], cat.shape[1], fname, reduce="sum")
+            outs1 = impt.load_observables(fname)(cat[:7])
+            for out0, out1 in zip(outs0, outs1):
+                np.testing.assert_almost_equal(np.sum(out0[:7]), out1)
+    finally:
+        impt.set_exec_mode(buckets="off")
+    return
+
+
+if __name__ == "__main__":
+    from conftest import run_tests
+
+    run_tests(
+        test_export,
+    )
@@ -0,0 +1,209 @@
+# impt autodiff pipeline
+# Copyright 20221113 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+"""This unit test checks the evaluation of several observables in one pass,
+the reductions over catalogs and the rows skipped outside the supports of
+the observables
+"""
+import numpy as np
+
+import impt
+
+
+def test_evaluate_many(cat, noise_cov, e1, res1, rnoise):
+    print("testing evaluation of multiple observables in one pass")
+    enoise = impt.BiasNoise(e1, noise_cov)
+    obs_list = [e1, enoise, res1, rnoise]
+    outs = impt.evaluate_many(obs_list, cat)
+    assert len(outs) == len(obs_list)
+    for obs, out in zip(obs_list, outs):
+        np.testing.assert_array_almost_equal(out, obs.evaluate(cat))
+    outs2 = impt.evaluate_many(obs_list, cat, mode="vmap", chunk_size=8)
+    for out, out2 in zip(outs, outs2):
+        np.testing.assert_array_almost_equal(out, out2)
+    return
+
+
+def test_sum(cat, e1, res1, rnoise):
+    print("testing streaming sum and mean over the catalog")
+    for mode in ["map", "vmap"]:
+        np.testing.assert_almost_equal(
+            rnoise.sum(cat, mode=mode, chunk_size=7),
+            np.sum(rnoise.evaluate(cat)),
+        )
+        np.testing.assert_almost_equal(
+            res1.mean(cat, mode=mode, chunk_size=8),
+            np.mean(res1.evaluate(cat)),
+        )
+    # padded rows are masked out of the sum
+    impt.set_exec_mode(buckets="pow2", min_bucket=8)
+    try:
+        outs = impt.evaluate_many([e1, res1], cat[:5], reduce="sum")
+    finally:
+        impt.set_exec_mode(buckets="off")
+    np.testing.assert_almost_equal(outs[0], np.sum(e1.evaluate(cat[:5])))
+    np.testing.assert_almost_equal(outs[1], np.sum(res1.evaluate(cat[:5])))
+    # empty catalog
+    for mode in ["map", "vmap"]:
+        assert rnoise.sum(cat[:0], mode=mode) == 0.0
+        outs = impt.evaluate_many([e1, res1], cat[:0], mode=mode, reduce="sum")
+        np.testing.assert_array_equal(outs, 0.0)
+    assert np.isnan(e1.mean(cat[:0]))
+    return
+
+
+def test_evaluate_catalogs(cat, e1, res1):
+    print("testing evaluation of several catalogs in one call")
+    cats = [cat[:5], cat[5:12], cat[:0], cat]
+    for mode in ["map", "vmap"]:
+        outs = impt.evaluate_catalogs([e1, res1], cats, mode=mode, chunk_size=4)
+        for obs, out in zip([e1, res1], outs):
+            assert out.shape == (len(cats),)
+            for cc, oo in zip(cats, out):
+                np.testing.assert_almost_equal(oo, np.sum(obs.evaluate(cc)))
+    outs = impt.evaluate_catalogs([e1], cats[:2], reduce="mean")
+    np.testing.assert_almost_equal(outs[0][1], e1.mean(cats[1]))
+    return
+
+
+def test_update(cat, noise_cov):
+    print("testing evaluation after the observables are updated")
+    # without pruning the catalog shape is fixed, so the compiled programs
+    # would be reused if they were not refreshed
+    impt.set_exec_mode(prune=False)
+    try:
+        pp = impt.fpfs.FpfsParams(Const=2.0, lower_m00=0.3, sigma_m00=0.5)
+        ww = impt.fpfs.FpfsWeightSelect(pp)
+        rr = impt.RespG1(ww)
+        en = impt.BiasNoise(ww, noise_cov)
+        # a product built before the update of its operand
+        ew = impt.fpfs.FpfsE1(pp) * ww
+        impt.evaluate_many([ww, rr], cat, reduce="sum")
+        impt.evaluate_many([en], cat, reduce="sum")
+        impt.evaluate_catalogs([ww], [cat, cat])
+        rew = impt.RespG1(ew)
+        ew.sum(cat)
+        rew.sum(cat)
+        ww.params = pp.replace(lower_m00=8.0)
+        en.update_noise_cov(2.0 * np.asarray(noise_cov))
+        outs = impt.evaluate_many([ww, rr], cat, reduce="sum")
+        outs += impt.evaluate_many([en], cat, reduce="sum")
+        sums = impt.evaluate_catalogs([ww], [cat, cat])[0]
+        np.testing.assert_almost_equal(ew.sum(cat), np.sum(ew.evaluate(cat)))
+        np.testing.assert_almost_equal(rew.sum(cat), np.sum(rew.evaluate(cat)))
+        ew2 = impt.fpfs.FpfsE1(pp) * impt.fpfs.FpfsWeightSelect(ww.params)
+        np.testing.assert_almost_equal(ew.sum(cat), ew2.sum(cat))
+        np.testing.assert_almost_equal(rew.sum(cat), impt.RespG1(ew2).sum(cat))
+    finally:
+        impt.set_exec_mode(prune=True)
+    ww2 = impt.fpfs.FpfsWeightSelect(pp.replace(lower_m00=8.0))
+    en2 = impt.BiasNoise(ww2, 2.0 * np.asarray(noise_cov))
+    np.testing.assert_almost_equal(outs[0], ww2.sum(cat))
+    np.testing.assert_almost_equal(outs[1], impt.RespG1(ww2).sum(cat))
+    np.testing.assert_almost_equal(outs[2], en2.sum(cat))
+    np.testing.assert_array_almost_equal(sums, [ww2.sum(cat)] * 2)
+    return
+
+
+def test_traced_params(cat, noise_cov, e1, res1, rnoise):
+    print("testing parameters traced as inputs of the compiled programs")
+    obs_list = [e1, res1, rnoise]
+    lowers = [0.3, 0.5, 0.8]
+    sums = []
+    for lower in lowers:
+        pp = impt.fpfs.FpfsParams(Const=2.0, lower_m00=lower, sigma_m00=0.5)
+        ee = impt.fpfs.FpfsE1(pp) * impt.fpfs.FpfsWeightSelect(pp)
+        rr = impt.RespG1(ee)
+        outs0 = impt.evaluate_many([ee, rr, impt.BiasNoise(rr, noise_cov)], cat)
+        outs1 = impt.evaluate_many(obs_list, cat, params=pp)
+        for out0, out1 in zip(outs0, outs1):
+            np.testing.assert_array_almost_equal(out0, out1)
+        sums.append(rnoise.sum(cat, params=pp))
+    # new values of the parameters reuse the compiled program
+    keys = [kk for kk in rnoise._executables if kk[0] == "_params_func"]
+    assert len(keys) == 1
+    # a batch of parameters
+    pp = impt.fpfs.FpfsParams(Const=2.0, lower_m00=np.array(lowers), sigma_m00=0.5)
+    np.testing.assert_array_almost_equal(rnoise.sum(cat, params=pp), sums)
+    assert e1.evaluate(cat, params=pp).shape == (len(cat), len(lowers))
+    np.testing.assert_raises(
+        TypeError, e1.evaluate, cat, params=impt.fpfs.future.FpfsExtParams()
+    )
+    return
+
+
+def test_prune(cat, noise_cov):
+    print("testing sums skipping the rows with zero selection weight")
+    m00 = np.asarray(cat[:, impt.fpfs.default.indexes["m00"]])
+    pp = impt.fpfs.FpfsParams(Const=2.0, lower_m00=np.median(m00), sigma_m00=0.2)
+    ee = (
+        impt.fpfs.FpfsE1(pp)
+        * impt.fpfs.FpfsWeightSelect(pp, func_name="ss2")
+        * impt.fpfs.FpfsWeightDetect(pp, func_name="ss2")
+    )
+    rr = impt.RespG1(ee)
+    obs_list = [ee, impt.BiasNoise(ee, noise_cov), rr, impt.BiasNoise(rr, noise_cov)]
+    mask = impt.base.support_mask(obs_list, cat)
+    assert 0 < np.sum(mask) < len(mask)
+    # the observables are zero outside the support
+    for out in impt.evaluate_many(obs_list, cat[~mask]):
+        np.testing.assert_array_equal(out, 0.0)
+    sums0 = impt.evaluate_many(obs_list, cat, reduce="sum")
+    impt.set_exec_mode(prune=False)
+    try:
+        sums1 = impt.evaluate_many(obs_list, cat, reduce="sum")
+    finally:
+        impt.set_exec_mode(prune=True)
+    np.testing.assert_array_almost_equal(sums0, sums1)
+    # the union of the supports of a batch of parameters
+    pb = pp.replace(lower_m00=np.array([0.0, np.median(m00)]))
+    mask0 = impt.base.support_mask(obs_list, cat, pp.replace(lower_m00=0.0))
+    np.testing.assert_array_equal(
+        impt.base.support_mask(obs_list, cat, pb), mask0 | mask
+    )
+    # observables with the selection and detection weights inside
+    for obs in [
+        impt.fpfs.FpfsWeightE1(pp, func_name="ss2"),
+        impt.fpfs.FpfsWeightE2(pp, func_name="ss2"),
+        impt.fpfs.FpfsWeightE(pp, func_name="ss2"),
+    ]:
+        mask = obs.support(cat)
+        assert 0 < np.sum(mask) < len(mask)
+        np.testing.assert_array_equal(obs.evaluate(cat[~mask]), 0.0)
+        np.testing.assert_array_almost_equal(
+            obs.sum(cat), np.sum(obs.evaluate(cat), axis=0)
+        )
+    # weight functions without known compact support are not pruned
+    ww = impt.fpfs.FpfsWeightSelect(pp, func_name="sm")
+    ww.ufunc = lambda x, mu, sigma: impt.fpfs.utils.smfunc(x, mu, sigma)
+    assert ww.support(cat) is None
+    impt.set_exec_mode(prune=False)
+    try:
+        sum1 = ww.sum(cat)
+    finally:
+        impt.set_exec_mode(prune=True)
+    np.testing.assert_almost_equal(ww.sum(cat), sum1)
+    return
+
+
+if __name__ == "__main__":
+    from conftest import run_tests
+
+    run_tests(
+        test_evaluate_many,
+        test_sum,
+        test_evaluate_catalogs,
+        test_update,
+        test_traced_params,
+        test_prune,
+    )
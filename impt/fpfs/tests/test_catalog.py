@@ -15,7 +15,9 @@
 successfully
 """
 import os
+import tempfile
 import fitsio
+import numpy as np
 
 import impt
 from impt.fpfs.default import col_names
@@ -36,5 +38,84 @@ def test_catalog():
     return
 
 
+def test_iter_catalog():
+    print("testing for catalog streaming")
+    cat = impt.fpfs.read_catalog(test_fname)
+    for prefetch in [0, 2]:
+        chunks = list(impt.fpfs.iter_catalog(test_fname, 7, prefetch=prefetch))
+        assert max(len(cc) for cc in chunks) <= 7
+        np.testing.assert_array_equal(np.concatenate(chunks), cat)
+    # stops early
+    for chunk in impt.fpfs.iter_catalog(test_fname, 7, prefetch=1):
+        break
+    np.testing.assert_array_equal(chunk, cat[: len(chunk)])
+
+    params = impt.fpfs.FpfsParams(Const=2.0, lower_m00=0.5, sigma_m00=0.5)
+    e1 = impt.fpfs.FpfsE1(params)
+    res1 = impt.RespG1(e1)
+    outs = impt.evaluate_stream(
+        [e1, res1], impt.fpfs.iter_catalog(test_fname, 8), reduce="mean"
+    )
+    np.testing.assert_almost_equal(outs[0], e1.mean(cat))
+    np.testing.assert_almost_equal(outs[1], res1.mean(cat))
+    return
+
+
+def test_columnar():
+    print("testing for the memory-mapped columnar catalog")
+    cat = impt.fpfs.read_catalog(test_fname)
+    with tempfile.TemporaryDirectory() as out_dir:
+        out_name = os.path.join(out_dir, "cat.impt")
+        header = impt.fpfs.convert_catalog(test_fname, out_name, chunk_size=7)
+        assert header["nrow"] == len(cat)
+        assert header["cut"] == "fpfs_M00 + fpfs_M20 > 1e-5"
+        cat2 = impt.fpfs.load_catalog(out_name)
+        assert isinstance(cat2.base, np.memmap)
+        np.testing.assert_array_equal(cat2, cat)
+
+        params = impt.fpfs.FpfsParams(Const=2.0)
+        e1 = impt.fpfs.FpfsE1(params)
+        np.testing.assert_array_equal(e1.evaluate(cat2), e1.evaluate(cat))
+
+        impt.fpfs.convert_catalog(test_fname, out_name, dtype="float32")
+        cat2 = impt.fpfs.load_catalog(out_name)
+        assert cat2.dtype == np.float32
+        np.testing.assert_allclose(cat2, cat, rtol=1e-6)
+        cat2 = impt.fpfs.load_catalog(out_name, dtype=np.float64)
+        assert cat2.dtype == np.float64
+        # the layout is checked
+        np.testing.assert_raises(ValueError, impt.fpfs4.load_catalog, out_name)
+    return
+
+
+def test_columns():
+    print("testing for reading a subset of columns")
+    cat = impt.fpfs.read_catalog(test_fname)
+    cat2 = impt.fpfs.read_catalog(test_fname, columns=["fpfs_M22c", 0])
+    np.testing.assert_array_equal(cat2[:, [0, 2]], cat[:, [0, 2]])
+    assert np.all(cat2[:, 1] == 0.0) and np.all(cat2[:, 3:] == 0.0)
+
+    params = impt.fpfs.FpfsParams(Const=2.0)
+    e1 = impt.fpfs.FpfsE1(params)
+    res1 = impt.RespG1(e1)
+    idx = res1.input_columns(cat.shape[1])
+    cats = [
+        impt.fpfs.read_catalog(test_fname, columns=[res1]),
+        np.concatenate(list(impt.fpfs.iter_catalog(test_fname, 7, columns=[res1]))),
+    ]
+    with tempfile.TemporaryDirectory() as out_dir:
+        out_name = os.path.join(out_dir, "cat.impt")
+        impt.fpfs.convert_catalog(test_fname, out_name)
+        cats.append(impt.fpfs.load_catalog(out_name, columns=[res1]))
+    for cat2 in cats:
+        np.testing.assert_array_equal(cat2[:, idx], cat[:, idx])
+        assert np.count_nonzero(cat2) <= len(idx) * len(cat)
+        np.testing.assert_array_equal(res1.evaluate(cat2), res1.evaluate(cat))
+    return
+
+
 if __name__ == "__main__":
     test_catalog()
+    test_iter_catalog()
+    test_columnar()
+    test_columns()
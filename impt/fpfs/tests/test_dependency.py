@@ -0,0 +1,85 @@
+# impt autodiff pipeline
+# Copyright 20221113 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+"""This unit test checks the columns of the rows that per-row functions
+depend on
+"""
+
+import numpy as np
+import jax.numpy as jnp
+from jax import jit, lax
+
+import impt
+
+
+def test_calls():
+    print("testing columns read through calls")
+
+    @jit
+    def inner(y):
+        return jnp.sum(y[1:3] ** 2.0)
+
+    def func(x):
+        return inner(x) * x[4]
+
+    assert impt.dependency.input_columns(func, 6, np.float64) == (1, 2, 4)
+    return
+
+
+def test_loops():
+    print("testing columns read in loops")
+
+    def carried(x):
+        # the carry is swapped in each step, so the output depends on all
+        # the initial values of the carry
+        def body(i, carry):
+            a, b = carry
+            return b, a + x[2]
+
+        return lax.fori_loop(0, 3, body, (x[0], x[1]))[0]
+
+    assert impt.dependency.input_columns(carried, 6, np.float64) == (0, 1, 2)
+
+    def scanned(x):
+        # the row is the sequence of the scan
+        def body(carry, xi):
+            return carry * xi, None
+
+        return lax.scan(body, x[5], x[:3])[0]
+
+    assert impt.dependency.input_columns(scanned, 6, np.float64) == (
+        0,
+        1,
+        2,
+        5,
+    )
+
+    def whiled(x):
+        # the number of iterations depends on x[3]
+        def body(carry):
+            return carry[0] + 1.0, carry[1] * x[1]
+
+        return lax.while_loop(lambda c: c[0] < x[3], body, (0.0, x[0]))[1]
+
+    assert impt.dependency.input_columns(whiled, 6, np.float64) == (0, 1, 3)
+
+    def branched(x):
+        return lax.cond(x[0] > 0.0, lambda y: y[1], lambda y: y[2], x)
+
+    assert impt.dependency.input_columns(branched, 6, np.float64) == (0, 1, 2)
+    return
+
+
+if __name__ == "__main__":
+    test_calls()
+    test_loops()
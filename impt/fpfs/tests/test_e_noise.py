@@ -85,5 +85,32 @@ def test_e1e2():
     return
 
 
+def test_hvp():
+    print("testing noise bias correction with Hessian-vector products")
+    bnoise = impt.BiasNoise(ell1, noise_cov, method="hvp", rtol=0.0)
+    np.testing.assert_array_almost_equal(
+        bnoise.evaluate(cat),
+        noicorr_fpfs_e1,
+    )
+
+    bnoise = impt.BiasNoise(ell2_dg2, noise_cov, method="hvp", rtol=0.0)
+    np.testing.assert_array_almost_equal(
+        bnoise.evaluate(cat),
+        noicorr_fpfs_de2dg2,
+    )
+
+    # truncated to the significant eigenvectors of the noise covariance
+    bnoise = impt.BiasNoise(ell1_dg1, noise_cov, method="hvp", rtol=1e-8)
+    idx = ell1_dg1.input_columns(cat.shape[1])
+    vals, vecs = bnoise.noise_cov_sub(idx)
+    assert len(vals) <= len(idx)
+    np.testing.assert_array_almost_equal(
+        bnoise.evaluate(cat),
+        noicorr_fpfs_de1dg1,
+    )
+    return
+
+
 if __name__ == "__main__":
     test_e1e2()
+    test_hvp()
@@ -20,6 +20,7 @@ import fitsio
 import numpy as np
 
 import impt
+from impt.fpfs.default import indexes as did
 
 wconst = 2.0
 test_fname = os.path.join(
@@ -113,7 +114,64 @@ def test_multiply():
     return
 
 
+def test_input_columns():
+    print("testing the columns that FPFS's e1 * w_sel depends on")
+    w_sel = impt.fpfs.FpfsWeightSelect(params)
+    obs = ell1 * w_sel
+    assert obs.input_columns(cat.shape[1]) == tuple(
+        sorted([did["m00"], did["m20"], did["m22c"]])
+    )
+    # full-width gradient is scattered back from the dependent columns
+    gvec = obs.grad(cat)
+    assert gvec.shape == cat.shape
+    np.testing.assert_array_almost_equal(
+        gvec[:, did["m22s"]],
+        np.zeros(len(cat)),
+    )
+    np.testing.assert_array_almost_equal(
+        gvec[:, did["m22c"]],
+        w_sel.evaluate(cat) / (cat[:, did["m00"]] + wconst),
+    )
+    return
+
+
+def test_struct_key():
+    print("testing structural hashing of FPFS observables")
+    w_sel1 = impt.fpfs.FpfsWeightSelect(params)
+    w_sel2 = impt.fpfs.FpfsWeightSelect(params)
+    assert w_sel1.key == w_sel2.key
+    assert (ell1 * w_sel1).key == (w_sel2 * ell1).key
+    assert (ell1 - w_sel1).key != (w_sel1 - ell1).key
+    params2 = impt.fpfs.FpfsParams(Const=wconst + 1.0)
+    assert impt.fpfs.FpfsE1(params2).key != ell1.key
+
+    print("testing shared weights of FPFS's weighted e1 and e2")
+    we1 = impt.fpfs.FpfsWeightE1(params)
+    we2 = impt.fpfs.FpfsWeightE2(params)
+    outs = impt.evaluate_many([we1, we2, impt.RespG1(we1)], cat)
+    np.testing.assert_array_almost_equal(outs[0], we1.evaluate(cat))
+    np.testing.assert_array_almost_equal(outs[1], we2.evaluate(cat))
+    np.testing.assert_array_almost_equal(outs[2], impt.RespG1(we1).evaluate(cat))
+
+    print("testing keys of products after an operand is updated")
+    w_sel = impt.fpfs.FpfsWeightSelect(params)
+    ell_w = ell1 * w_sel
+    res = impt.RespG1(ell_w)
+    key = ell_w.key
+    ell_w.sum(cat)
+    res.sum(cat)
+    w_sel.params = params.replace(lower_m00=8.0)
+    assert ell_w.key != key
+    np.testing.assert_almost_equal(ell_w.sum(cat), np.sum(ell_w.evaluate(cat)))
+    np.testing.assert_almost_equal(res.sum(cat), np.sum(res.evaluate(cat)))
+    ref = impt.RespG1(ell1 * impt.fpfs.FpfsWeightSelect(w_sel.params))
+    np.testing.assert_almost_equal(res.sum(cat), ref.sum(cat))
+    return
+
+
 if __name__ == "__main__":
     test_add()
     test_sub()
     test_multiply()
+    test_input_columns()
+    test_struct_key()
@@ -0,0 +1,169 @@
+# impt autodiff pipeline
+# Copyright 20221113 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+"""This unit test checks the execution modes of the compiled programs
+[chunked vmap, buckets of catalog sizes, precision, devices and the
+persistent compilation cache]
+"""
+import os
+import sys
+import tempfile
+import subprocess
+import numpy as np
+
+import impt
+
+
+def test_vmap(cat, e1, res1, rnoise):
+    print("testing chunked vmap execution against lax.map")
+    for obs in [e1, res1, rnoise]:
+        out0 = obs.evaluate(cat, mode="map")
+        # chunk size does not divide the number of rows
+        out1 = obs.evaluate(cat, mode="vmap", chunk_size=7)
+        np.testing.assert_array_almost_equal(out0, out1)
+    np.testing.assert_array_almost_equal(
+        e1.hessian(cat, mode="map"),
+        e1.hessian(cat, mode="vmap", chunk_size=4),
+    )
+    return
+
+
+def test_global_mode(cat, rnoise):
+    print("testing global execution mode")
+    mode0 = impt.get_exec_mode()
+    impt.set_exec_mode("map", 16)
+    try:
+        assert impt.get_exec_mode() == ("map", 16)
+        out0 = rnoise.evaluate(cat)
+    finally:
+        impt.set_exec_mode(*mode0)
+    np.testing.assert_array_almost_equal(out0, rnoise.evaluate(cat))
+    return
+
+
+def test_bucket(cat, e1, res1):
+    print("testing compiled executables shared by catalogs in one bucket")
+    impt.set_exec_mode(buckets="pow2", min_bucket=8)
+    try:
+        obs = impt.RespG1(e1)
+        out1 = obs.evaluate(cat[:5])
+        out2 = obs.evaluate(cat[:7])
+        out3 = obs.evaluate(cat)
+    finally:
+        impt.set_exec_mode(buckets="off")
+    np.testing.assert_array_almost_equal(out1, res1.evaluate(cat[:5]))
+    np.testing.assert_array_almost_equal(out2, res1.evaluate(cat[:7]))
+    np.testing.assert_array_almost_equal(out3, res1.evaluate(cat))
+    ncompile = sum(ff._cache_size() for ff in obs._executables.values())
+    assert ncompile == 2, "catalogs in one bucket are compiled more than once"
+    # empty catalog
+    impt.set_exec_mode(buckets="pow2", min_bucket=8)
+    try:
+        out4 = obs.evaluate(cat[:0])
+        sum4 = obs.sum(cat[:0])
+    finally:
+        impt.set_exec_mode(buckets="off")
+    assert out4.shape == (0,) and sum4 == 0.0
+    return
+
+
+def test_precision(cat, e1, res1, rnoise):
+    print("testing float32 evaluation with float64 accumulation")
+    with impt.precision("float32"):
+        out = res1.evaluate(cat)
+        out_sum = rnoise.sum(cat, chunk_size=7)
+    assert out.dtype == np.float32
+    assert out_sum.dtype == np.float64
+    # the global setting is restored
+    assert rnoise.evaluate(cat).dtype == np.float64
+    np.testing.assert_allclose(out, res1.evaluate(cat), rtol=1e-4, atol=1e-5)
+    np.testing.assert_allclose(out_sum, rnoise.sum(cat), rtol=1e-4)
+    errs = impt.check_precision([e1, res1, rnoise], cat, nsample=20)
+    for err in errs:
+        assert err["mean_rel"] < 1e-4
+    return
+
+
+sharded_script = """
+import numpy as np
+import impt
+
+impt.set_host_devices(3)
+from impt.fpfs.tests.conftest import make_pipeline
+
+cat, noise_cov, e1, res1, rnoise = make_pipeline()
+
+out0 = res1.evaluate(cat)
+sum0 = impt.evaluate_many([e1, res1], cat, reduce="sum")
+impt.set_exec_mode(devices="all")
+np.testing.assert_array_almost_equal(out0, res1.evaluate(cat))
+sum1 = impt.evaluate_many([e1, res1], cat, reduce="sum")
+np.testing.assert_array_almost_equal(sum0, sum1)
+sum2 = impt.evaluate_catalogs([e1, res1], [cat[:5], cat])
+np.testing.assert_array_almost_equal([ss[1] for ss in sum2], sum0)
+"""
+
+
+def test_sharded():
+    print("testing rows split across several CPU devices")
+    # only one device is exposed in this process
+    np.testing.assert_raises(ValueError, impt.set_exec_mode, devices=2)
+    # the number of host devices is fixed before the first JAX operation, so
+    # it is tested in a new process
+    root = os.path.dirname(os.path.dirname(impt.__file__))
+    env = dict(os.environ, PYTHONPATH=root)
+    subprocess.run([sys.executable, "-c", sharded_script], check=True, env=env)
+    return
+
+
+cache_script = """
+import sys
+import impt
+
+impt.enable_compilation_cache(sys.argv[1], min_compile_time=0.0)
+from impt.fpfs.tests.conftest import make_pipeline
+
+cat, noise_cov, e1, res1, rnoise = make_pipeline()
+rnoise.sum(cat)
+"""
+
+
+def test_compilation_cache():
+    print("testing persistent compilation cache")
+    root = os.path.dirname(os.path.dirname(impt.__file__))
+    env = dict(os.environ, PYTHONPATH=root)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cmd = [sys.executable, "-c", cache_script, cache_dir]
+        subprocess.run(cmd, check=True, env=env)
+        fnames = sorted(os.listdir(cache_dir))
+        assert len(fnames) > 0, "compiled programs are not cached"
+        # a new process reuses the cached programs
+        subprocess.run(cmd, check=True, env=env)
+        assert sorted(os.listdir(cache_dir)) == fnames
+        # the cache is pruned to the size limit
+        impt.engine.prune_compilation_cache(cache_dir, 0)
+        assert len(os.listdir(cache_dir)) == 0
+    return
+
+
+if __name__ == "__main__":
+    from conftest import run_tests
+
+    run_tests(
+        test_vmap,
+        test_global_mode,
+        test_bucket,
+        test_precision,
+        test_sharded,
+        test_compilation_cache,
+    )
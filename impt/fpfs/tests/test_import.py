@@ -0,0 +1,65 @@
+# impt autodiff pipeline
+# Copyright 20221113 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+"""This unit test checks that importing impt does not import the heavy
+dependencies, and that the lazily loaded names are consistent with the
+submodules
+"""
+import os
+import sys
+import importlib
+import subprocess
+
+import impt
+
+import_script = """
+import sys
+import impt
+import impt.fpfs
+import impt.fpfs4
+
+impt.fpfs.__data_dir__
+heavy = [mm for mm in ("jax", "flax", "fitsio") if mm in sys.modules]
+assert not heavy, "importing impt imports %s" % heavy
+"""
+
+
+def test_lazy_import():
+    print("testing import of impt without the heavy dependencies")
+    root = os.path.dirname(os.path.dirname(impt.__file__))
+    env = dict(os.environ, PYTHONPATH=root)
+    subprocess.run([sys.executable, "-c", import_script], check=True, env=env)
+    return
+
+
+def test_lazy_names():
+    print("testing lazily loaded names")
+    for package in [impt, impt.fpfs, impt.fpfs4]:
+        for name in package.__all__:
+            assert getattr(package, name) is not None
+    # the names exported by the submodules are all exported by the package
+    for package, modules in [
+        (impt, ["perturb", "engine", "artifact"]),
+        (impt.fpfs, ["linobs", "nlobs"]),
+        (impt.fpfs4, ["linobs", "nlobs"]),
+    ]:
+        for mod in modules:
+            mod = importlib.import_module("%s.%s" % (package.__name__, mod))
+            for name in mod.__all__:
+                assert getattr(package, name) is getattr(mod, name)
+    return
+
+
+if __name__ == "__main__":
+    test_lazy_import()
+    test_lazy_names()
@@ -17,6 +17,7 @@ response is implemented correctly. """
 import os
 import fitsio
 import numpy as np
+import jax.numpy as jnp
 
 import impt
 import impt.fpfs.default as df
@@ -88,6 +89,26 @@ def test_g2():
     return
 
 
+def test_dg_sub():
+    print("testing for the sparse shear response of a subset of columns")
+    linres = impt.fpfs.FpfsLinResponse()
+    mat = linres.response_matrix(1, df.ncol)
+    assert np.count_nonzero(mat) == 12, "response matrix is not sparse"
+    idx = (did["m00"], did["m22c"], did["v3"])
+    for component, out in [(1, linres.dg1(data2)), (2, linres.dg2(data2))]:
+        for row, dg in zip(data2[:10], out[:10]):
+            np.testing.assert_array_almost_equal(
+                linres.dg_sub(component, row, idx),
+                dg[np.array(idx)],
+            )
+    # rows in single precision are not upcast
+    row = jnp.asarray(data2[0], dtype=jnp.float32)
+    assert linres.dg1(row[None]).dtype == jnp.float32
+    assert linres.dg_sub(2, row, idx).dtype == jnp.float32
+    return
+
+
 if __name__ == "__main__":
     test_g1()
     test_g2()
+    test_dg_sub()
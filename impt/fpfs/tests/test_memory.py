@@ -0,0 +1,51 @@
+# impt autodiff pipeline
+# Copyright 20221113 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+"""This unit test checks the memory estimates of the compiled programs and
+the chunk sizes fitting the memory budget
+"""
+import numpy as np
+
+import impt
+
+
+def test_memory_budget(cat, rnoise):
+    print("testing chunk sizes fitting the memory budget")
+    est = impt.engine.estimate_memory(rnoise, "_obs_func", cat, "vmap", 16)
+    assert est["row"] > 0 and est["chunk"] == 16 * est["row"]
+    sum0 = rnoise.sum(cat, mode="vmap", chunk_size=16)
+    # the budget fits the catalog and four rows
+    impt.set_exec_mode(memory_budget=est["catalog"] + est["outputs"] + 5 * est["row"])
+    try:
+        sum1 = rnoise.sum(cat, mode="vmap", chunk_size=16)
+        np.testing.assert_array_almost_equal(sum0, sum1)
+        assert impt.engine.get_memory_budget() is not None
+        chunks = [kk[2] for kk in rnoise._executables if kk[0] == "_obs_func"]
+        assert 4 in chunks
+        # the Hessian matrices of the rows do not fit
+        np.testing.assert_raises(MemoryError, rnoise.hessian, cat)
+        impt.set_exec_mode(memory_budget=1)
+        np.testing.assert_raises(MemoryError, rnoise.sum, cat)
+    finally:
+        impt.set_exec_mode(memory_budget="off")
+    assert impt.engine.get_memory_budget() is None
+    np.testing.assert_raises(ValueError, impt.set_exec_mode, memory_budget=0)
+    return
+
+
+if __name__ == "__main__":
+    from conftest import run_tests
+
+    run_tests(
+        test_memory_budget,
+    )
@@ -0,0 +1,57 @@
+# impt autodiff pipeline
+# Copyright 20221113 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+"""This unit test checks whether the sweep over the flux cut with prefix sums
+is consistent with evaluating every cut on the full catalog
+"""
+import numpy as np
+
+import impt
+
+
+def test_sweep_lower_m00(cat, noise_cov):
+    print("testing sweep over the flux cut")
+    m00 = np.asarray(cat[:, impt.fpfs.default.indexes["m00"]])
+    lowers = np.percentile(m00, [0, 20, 50, 80, 100])
+    for func_name in ["ts2", "ss2"]:
+        params = impt.fpfs.FpfsParams(Const=2.0, lower_m00=1.0, sigma_m00=0.5)
+        e1 = impt.fpfs.FpfsE1(params, func_name=func_name) * (
+            impt.fpfs.FpfsWeightSelect(params, func_name=func_name)
+        )
+        res1 = impt.RespG1(e1)
+        obs_list = [e1, res1, impt.BiasNoise(res1, noise_cov)]
+        outs = impt.fpfs.sweep_lower_m00(obs_list, cat, params, lowers)
+        for lower, out in zip(lowers, np.transpose(outs)):
+            pp = params.replace(lower_m00=lower)
+            refs = impt.evaluate_many(obs_list, cat, reduce="sum", params=pp)
+            np.testing.assert_array_almost_equal(out, refs)
+    # the sigmoid weight is not flat outside the band
+    params = impt.fpfs.FpfsParams(Const=2.0, lower_m00=1.0, sigma_m00=0.5)
+    e1 = impt.fpfs.FpfsE1(params) * impt.fpfs.FpfsWeightSelect(params, func_name="sm")
+    np.testing.assert_raises(
+        ValueError,
+        impt.fpfs.sweep_lower_m00,
+        [impt.RespG1(e1)],
+        cat,
+        params,
+        lowers,
+    )
+    return
+
+
+if __name__ == "__main__":
+    from conftest import run_tests
+
+    run_tests(
+        test_sweep_lower_m00,
+    )
@@ -0,0 +1,116 @@
+# impt autodiff pipeline
+# Copyright 20221113 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+"""This unit test checks whether the vector-valued observables (e1, e2), their
+shear response matrix and noise biases are consistent with the observables of
+each component
+"""
+
+import os
+import fitsio
+import numpy as np
+
+import impt
+import impt.fpfs.future as future
+
+test_fname = os.path.join(
+    impt.fpfs.__data_dir__,
+    "fpfs-cut32-0000-g1-0000.fits",
+)
+
+data = fitsio.read(test_fname)
+cat = impt.fpfs.read_catalog(test_fname)
+noise_cov = impt.fpfs.utils.fpfscov_to_imptcov(data)
+params = impt.fpfs.FpfsParams(Const=2.0, lower_m00=1.0, sigma_m00=0.5)
+
+
+def test_weight_e():
+    print("testing vector-valued weighted ellipticity")
+    we = impt.fpfs.FpfsWeightE(params)
+    we1 = impt.fpfs.FpfsWeightE1(params)
+    we2 = impt.fpfs.FpfsWeightE2(params)
+    out = we.evaluate(cat)
+    assert out.shape == (cat.shape[0], 2)
+    np.testing.assert_array_almost_equal(out[:, 0], we1.evaluate(cat))
+    np.testing.assert_array_almost_equal(out[:, 1], we2.evaluate(cat))
+    np.testing.assert_array_almost_equal(we.grad(cat)[:, 1], we2.grad(cat))
+    np.testing.assert_array_almost_equal(we.hessian(cat)[:, 0], we1.hessian(cat))
+
+    ell = impt.fpfs.FpfsE(params) * impt.fpfs.FpfsWeightSelect(params)
+    ell1 = impt.fpfs.FpfsE1(params) * impt.fpfs.FpfsWeightSelect(params)
+    np.testing.assert_array_almost_equal(ell.evaluate(cat)[:, 0], ell1.evaluate(cat))
+    return
+
+
+def test_response_matrix():
+    print("testing shear response matrix and noise bias")
+    we = impt.fpfs.FpfsWeightE(params)
+    res = impt.RespG(we)
+    outs = impt.evaluate_many(
+        [
+            res,
+            impt.BiasNoise(we, noise_cov),
+            impt.BiasNoise(we, noise_cov, method="hvp", rtol=0.0),
+            impt.BiasNoise(res, noise_cov),
+            # the Hessian of the responses [instead of the gradient of the
+            # noise bias of the ellipticity]
+            impt.BiasNoise(res, noise_cov, method="hvp", rtol=0.0),
+        ],
+        cat,
+    )
+    np.testing.assert_array_almost_equal(outs[3], outs[4])
+    assert outs[0].shape == (cat.shape[0], 2, 2)
+    assert np.all(np.abs(outs[0].sum(axis=0)) > 0.0)
+    # observables of each component [in one program]
+    obs_list = []
+    for wei in [impt.fpfs.FpfsWeightE1(params), impt.fpfs.FpfsWeightE2(params)]:
+        obs_list.append(impt.BiasNoise(wei, noise_cov))
+        for resp in [impt.RespG1, impt.RespG2]:
+            obs_list.append(resp(wei))
+            obs_list.append(impt.BiasNoise(resp(wei), noise_cov))
+    refs = impt.evaluate_many(obs_list, cat)
+    for i in range(2):
+        np.testing.assert_array_almost_equal(outs[1][:, i], refs[5 * i])
+        np.testing.assert_array_almost_equal(outs[2][:, i], refs[5 * i])
+        for j in range(2):
+            ind = 5 * i + 2 * j + 1
+            np.testing.assert_array_almost_equal(outs[0][:, i, j], refs[ind])
+            np.testing.assert_array_almost_equal(outs[3][:, i, j], refs[ind + 1])
+    return
+
+
+def test_future_e():
+    print("testing vector-valued ellipticity in future")
+    # the test covariance has no noise on the peak modes [sigma_v would be
+    # zero]
+    cov = np.asarray(noise_cov) + np.eye(noise_cov.shape[0]) * 1e-3
+    outs = impt.evaluate_many(future.prepare_func_e(cov, snr_min=4), cat)
+    refs = impt.evaluate_many(
+        future.prepare_func_e1(cov, snr_min=4) + future.prepare_func_e2(cov, snr_min=4),
+        cat,
+    )
+    assert np.abs(outs[2][:, 0, 0].sum()) > 0.0
+    for k in range(2):
+        np.testing.assert_array_almost_equal(outs[k][:, 0], refs[k])
+        np.testing.assert_array_almost_equal(outs[k][:, 1], refs[k + 4])
+    # the diagonal of the response matrix
+    for k in range(2, 4):
+        np.testing.assert_array_almost_equal(outs[k][:, 0, 0], refs[k])
+        np.testing.assert_array_almost_equal(outs[k][:, 1, 1], refs[k + 4])
+    return
+
+
+if __name__ == "__main__":
+    test_weight_e()
+    test_response_matrix()
+    test_future_e()
@@ -15,9 +15,11 @@
 arithmetic sum, subtract, multiply and divide correctly.
 """
 import os
+import jax
 import fpfs
 import fitsio
 import numpy as np
+import jax.numpy as jnp
 
 import impt
 
@@ -26,13 +28,11 @@ test_fname = os.path.join(
     "fpfs-cut32-0000-g1-0000.fits",
 )
 
-# impt.fpfs
-cat = impt.fpfs.read_catalog(test_fname)
 # FPFS
 data = fitsio.read(test_fname)
 
 
-def test_flux():
+def test_flux(cat):
     print("testing selection weight on M00")
     params = impt.fpfs.FpfsParams(lower_m00=4.0, sigma_m00=0.5, lower_r2=-10.0)
     w_sel = impt.fpfs.FpfsWeightSelect(params)
@@ -47,7 +47,7 @@ def test_flux():
     return
 
 
-def test_R2():
+def test_R2(cat):
     print("testing selection weight on R2")
     params = impt.fpfs.FpfsParams(
         lower_m00=-4.0, sigma_m00=0.5, lower_r2=0.12, sigma_r2=0.2
@@ -64,7 +64,7 @@ def test_R2():
     return
 
 
-def test_peak():
+def test_peak(cat):
     print("testing selection weight on peak modes")
     params = impt.fpfs.FpfsParams(
         lower_m00=-4.0,
@@ -85,7 +85,85 @@ def test_peak():
     return
 
 
+def test_weight_derivatives():
+    print("testing derivatives of the weight functions")
+    mu, sigma = 0.3, 0.7
+    x = np.linspace(-2.0, 2.0, 401)
+    # (weight function, reference inside the band, band of the reference)
+    funcs = [
+        (
+            impt.fpfs.utils.tsfunc2,
+            lambda t: 0.5 + t / 2.0 + jnp.sin(t * jnp.pi) / 2.0 / jnp.pi,
+            lambda x: (x - mu) / sigma,
+            (-1.0, 1.0),
+        ),
+        (
+            impt.fpfs.utils.ssfunc2,
+            lambda t: 6 * t**5 - 15 * t**4 + 10 * t**3,
+            lambda x: (x - mu) / sigma / 2.0 + 0.5,
+            (0.0, 1.0),
+        ),
+        (
+            impt.fpfs.utils.ssfunc3,
+            lambda t: -20 * t**7 + 70 * t**6 - 84 * t**5 + 35 * t**4,
+            lambda x: (x - mu) / sigma / 2.0 + 0.5,
+            (0.0, 1.0),
+        ),
+        (
+            impt.fpfs.utils.smfunc,
+            jax.nn.sigmoid,
+            lambda x: (x - mu) / sigma,
+            (-np.inf, np.inf),
+        ),
+    ]
+    for ufunc, ref, tfunc, (lower, upper) in funcs:
+        t = tfunc(x)
+        inside = (t > lower) & (t < upper)
+        # values outside the band
+        out = np.where(t >= upper, 1.0, 0.0)
+        f0 = lambda x: ufunc(x, mu, sigma)
+        f1 = lambda x: ref(tfunc(x))
+        for _ in range(4):
+            np.testing.assert_array_almost_equal(
+                jax.vmap(f0)(x),
+                np.where(inside, jax.vmap(f1)(x), out),
+            )
+            # exact outside the band [compact support]
+            np.testing.assert_array_equal(jax.vmap(f0)(x)[~inside], out[~inside])
+            f0 = jax.grad(f0)
+            f1 = jax.grad(f1)
+            out = np.zeros_like(x)
+    return
+
+
+def test_support():
+    print("testing supports of the weight functions")
+    x = np.linspace(-2.0, 2.0, 401)
+    for ufunc in [
+        impt.fpfs.utils.tsfunc2,
+        impt.fpfs.utils.ssfunc2,
+        impt.fpfs.utils.ssfunc3,
+    ]:
+        indicator = impt.fpfs.utils.support_func(ufunc)
+        # a negative sigma flips the cut
+        for mu, sigma in [(0.3, 0.7), (0.3, -0.7)]:
+            mask = indicator(x, mu, sigma) > 0
+            assert 0 < np.sum(mask) < len(mask)
+            f0 = lambda x: ufunc(x, mu, sigma)
+            for _ in range(4):
+                np.testing.assert_array_equal(jax.vmap(f0)(x)[~mask], 0.0)
+                f0 = jax.grad(f0)
+    assert impt.fpfs.utils.support_func(impt.fpfs.utils.smfunc) is None
+    return
+
+
 if __name__ == "__main__":
-    test_flux()
-    test_R2()
-    test_peak()
+    from conftest import run_tests
+
+    run_tests(
+        test_flux,
+        test_R2,
+        test_peak,
+        test_weight_derivatives,
+        test_support,
+    )
@@ -1,15 +1,34 @@
 # impt autodiff pipline
 # flake8: noqa
 import os
-from .linobs import *
-from .nlobs import *
-from . import utils
-from . import test_utils
+from ..lazy import attach
 
 __data_dir__ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
 
-__all__ = []
-__all__ += linobs.__all__
-__all__ += nlobs.__all__
-__all__ += ["utils"]
-__all__ += ["test_utils"]
+# the submodules (and JAX) are imported on first access
+__getattr__, __dir__, __all__ = attach(
+    __name__,
+    submodules=["default", "linobs", "nlobs", "utils", "test_utils"],
+    attrs={
+        "linobs": [
+            "read_catalog",
+            "iter_catalog",
+            "convert_catalog",
+            "load_catalog",
+            "FpfsLinResponse",
+        ],
+        "nlobs": [
+            "FpfsParams",
+            "FpfsE1",
+            "FpfsE2",
+            "FpfsE41",
+            "FpfsE42",
+            "FpfsWeightSelect",
+            "FpfsWeightDetect",
+            "FpfsWeightE1",
+            "FpfsWeightE2",
+            "FpfsWeightE41",
+            "FpfsWeightE42",
+        ],
+    },
+)
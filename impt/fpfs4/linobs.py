@@ -16,18 +16,21 @@
 # This file contains pytrees for linear observables measured from images
 # and functions to get their shear response
 
-from functools import partial
-
 import jax.numpy as jnp
-import numpy.lib.recfunctions as rfn
-from fitsio import read as fitsread
-from jax import jit
+import numpy as np
 
+from .. import catalog
 from ..base import LinRespBase
-from .default import col_names
+from .default import col_names, npeak
 from .default import indexes as did
 
-__all__ = ["read_catalog", "FpfsLinResponse"]
+__all__ = [
+    "read_catalog",
+    "iter_catalog",
+    "convert_catalog",
+    "load_catalog",
+    "FpfsLinResponse",
+]
 
 
 """
@@ -38,89 +41,130 @@ or take it as an example to develop new system
 # of Observables
 
 
-def read_catalog(fname):
-    x = fitsread(fname)[col_names]
-    out = rfn.structured_to_unstructured(x, copy=False)
-    out = jnp.array(out, dtype=jnp.float64)
+def read_catalog(fname, columns=None):
+    """Reads a FITS catalog; only the columns which are used are read
+
+    Args:
+        fname (str):        FITS file name
+        columns (list):     columns to read, e.g., the observables to evaluate
+                            [see `impt.catalog.column_indexes`]; the other
+                            columns are set to zero [default to all]
+    Returns:
+        out (ndarray):      catalog [shape: (nrow, ncol)]
+    """
+    out = catalog.read_fits(fname, col_names, columns=columns)
+    # the matrix is already in float64 [no conversion copy]
+    out = jnp.asarray(out)
+    return out
+
+
+def iter_catalog(fname, chunk_size=1000000, prefetch=1, columns=None):
+    """Iterates over a catalog in chunks of rows, so that a large catalog is
+    processed in bounded memory; the next chunk is read in a background
+    thread while the current one is evaluated
+
+    Args:
+        fname (str):        FITS file name
+        chunk_size (int):   number of rows read at a time [the chunks are
+                            smaller after the quality cut]
+        prefetch (int):     number of chunks read in advance
+        columns (list):     columns to read [see `read_catalog`]
+    Yields:
+        out (ndarray):      a chunk of the catalog [shape: (nrow, ncol)]
+    """
+    chunks = catalog.iter_fits(fname, col_names, chunk_size, columns=columns)
+    yield from catalog.prefetch(chunks, prefetch)
+
+
+def convert_catalog(fname, out_name, dtype="float64", chunk_size=1000000):
+    """Converts a FITS catalog to the columnar format [see `load_catalog`];
+    the catalog is converted in chunks of rows
+
+    Args:
+        fname (str):        FITS file name
+        out_name (str):     output file name
+        dtype (str):        data type on disk ["float32" or "float64"]
+        chunk_size (int):   number of rows converted at a time
+    Returns:
+        header (dict):      header of the output catalog
+    """
+    import fitsio
+
+    with fitsio.FITS(fname) as ff:
+        nrow = ff[1].get_nrows()
+
+    def chunks():
+        return catalog.iter_fits(fname, col_names, chunk_size)
+
+    return catalog.write_columnar(
+        out_name, chunks, col_names, layout="fpfs4", dtype=dtype, nrow=nrow
+    )
+
+
+def load_catalog(fname, dtype=None, columns=None):
+    """Loads a catalog in the columnar format [see `convert_catalog`]; the
+    file is memory mapped, so nothing is read until the rows are used
+
+    Args:
+        fname (str):        file name
+        dtype (str):        data type of the output [default to the type on
+                            disk without copy; a float32 catalog can be
+                            evaluated in `impt.precision("float32")`]
+        columns (list):     columns to read [see `read_catalog`]; if given,
+                            only these columns are read and copied
+    Returns:
+        out (ndarray):      catalog [shape: (nrow, ncol)]
+    """
+    out, header = catalog.read_columnar(fname, columns)
+    if header["layout"] != "fpfs4" or header["col_names"] != col_names:
+        raise ValueError("%s is not a catalog with fpfs4 layout" % fname)
+    if dtype is not None and out.dtype != dtype:
+        out = out.astype(dtype)
     return out
 
 
 class FpfsLinResponse(LinRespBase):
-    @partial(jit, static_argnums=(0,))
+    """Shear response of the FPFS linear observables; the response matrix is
+    sparse and is given as a list of (output, input, coefficient)
+    """
+
+    # shear response for shapelet modes [first component]
+    # TODO: Include spin-4 term in the response of M22s. Will add it when we
+    # have M44
+    # TODO: Incldue the shear response of M40 in the future. This is not
+    # required in the FPFS shear estimation (v1~v3), so I set it to zero
+    # here (But if you are interested in playing with shear response of
+    # this term, please contact me.)
+    _g1_terms = [
+        ("m00", "m22c", -np.sqrt(2.0)),
+        ("m20", "m42c", -np.sqrt(6.0)),
+        ("m22c", "m00", 1.0 / np.sqrt(2.0)),
+        ("m22c", "m40", -1.0 / np.sqrt(2.0)),
+        ("m42c", "m20", np.sqrt(6.0) / 2.0),
+        ("m42c", "m60", -np.sqrt(6.0) / 2.0),
+    ] + [("v%d" % i, "v%d_g1" % i, 1.0) for i in range(npeak)]
+
+    # shear response for shapelet modes [second component]
+    _g2_terms = [
+        ("m00", "m22s", -np.sqrt(2.0)),
+        ("m20", "m42s", -np.sqrt(6.0)),
+        ("m22s", "m00", 1.0 / np.sqrt(2.0)),
+        ("m22s", "m40", -1.0 / np.sqrt(2.0)),
+        ("m42s", "m20", np.sqrt(6.0) / 2.0),
+        ("m42s", "m60", -np.sqrt(6.0) / 2.0),
+    ] + [("v%d" % i, "v%d_g2" % i, 1.0) for i in range(npeak)]
+
+    def response_terms(self, component):
+        """Returns the nonzero elements of the response matrix"""
+        terms = self._g1_terms if component == 1 else self._g2_terms
+        return [(did[oo], did[ii], cc) for oo, ii, cc in terms]
+
     def _dg1(self, row):
         """Returns shear response array [first component] of shapelet pytree"""
-        # shear response for shapelet modes
-        fpfs_m00 = -jnp.sqrt(2.0) * row[did["m22c"]]
-        fpfs_m20 = -jnp.sqrt(6.0) * row[did["m42c"]]
-        fpfs_m22c = (row[did["m00"]] - row[did["m40"]]) / jnp.sqrt(2.0)
-        # TODO: Include spin-4 term. Will add it when we have M44
-        fpfs_m22s = jnp.zeros_like(row[did["m22s"]])
-        # TODO: Incldue the shear response of M40 in the future. This is not
-        # required in the FPFS shear estimation (v1~v3), so I set it to zero
-        # here (But if you are interested in playing with shear response of
-        # this term, please contact me.)
-        fpfs_m40 = jnp.zeros_like(row[did["m40"]])  # fix this to 0
-        fpfs_m42c = jnp.sqrt(6.0) / 2 * (row[did["m20"]] - row[did["m60"]])
-        fpfs_m42s = jnp.zeros_like(row[did["m42s"]])
-        fpfs_m60 = jnp.zeros_like(row[did["m42c"]])
-        out = jnp.stack(
-            [
-                fpfs_m00,
-                fpfs_m20,
-                fpfs_m22c,
-                fpfs_m22s,
-                fpfs_m40,
-                fpfs_m42c,
-                fpfs_m42s,
-                fpfs_m60,
-                row[did["v0_g1"]],
-                row[did["v1_g1"]],
-                row[did["v2_g1"]],
-                row[did["v3_g1"]],
-                row[did["v4_g1"]],
-                row[did["v5_g1"]],
-                row[did["v6_g1"]],
-                row[did["v7_g1"]],
-            ]
-            + [0] * 16
-        )
-        return out
-
-    @partial(jit, static_argnums=(0,))
+        mat = self.response_matrix(1, row.shape[-1], row.dtype)
+        return jnp.dot(mat, row)
+
     def _dg2(self, row):
         """Returns shear response array [second component] of shapelet pytree"""
-        fpfs_m00 = -jnp.sqrt(2.0) * row[did["m22s"]]
-        fpfs_m20 = -jnp.sqrt(6.0) * row[did["m42s"]]
-        # TODO: Include spin-4 term. Will add it when we have M44
-        fpfs_m22c = jnp.zeros_like(row[did["m22c"]])
-        fpfs_m22s = (row[did["m00"]] - row[did["m40"]]) / jnp.sqrt(2.0)
-        # TODO: Incldue the shear response of M40 in the future. This is not
-        # required in the FPFS shear estimation (v1~v3), so I set it to zero
-        # here (But if you are interested in playing with shear response of
-        # this term, please contact me.)
-        fpfs_m40 = jnp.zeros_like(row[did["m40"]])
-        fpfs_m42c = jnp.zeros_like(row[did["m42c"]])
-        fpfs_m42s = jnp.sqrt(6.0) / 2 * (row[did["m20"]] - row[did["m60"]])
-        fpfs_m60 = jnp.zeros_like(row[did["m42c"]])
-        out = jnp.stack(
-            [
-                fpfs_m00,
-                fpfs_m20,
-                fpfs_m22c,
-                fpfs_m22s,
-                fpfs_m40,
-                fpfs_m42c,
-                fpfs_m42s,
-                fpfs_m60,
-                row[did["v0_g2"]],
-                row[did["v1_g2"]],
-                row[did["v2_g2"]],
-                row[did["v3_g2"]],
-                row[did["v4_g2"]],
-                row[did["v5_g2"]],
-                row[did["v6_g2"]],
-                row[did["v7_g2"]],
-            ]
-            + [0] * 16
-        )
-        return out
+        mat = self.response_matrix(2, row.shape[-1], row.dtype)
+        return jnp.dot(mat, row)
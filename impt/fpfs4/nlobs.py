@@ -13,19 +13,15 @@
 #
 # python lib
 
-from functools import partial
-
 import jax.numpy as jnp
 from flax import struct
 
 # This file contains modules for nonlinear observables measured from images
-from jax import jit
-
 from ..base import NlBase
 from .default import indexes as did
 from .default import npeak
 from .linobs import FpfsLinResponse
-from .utils import smfunc, ssfunc2, ssfunc3, tsfunc2
+from .utils import smfunc, ssfunc2, ssfunc3, support_func, tsfunc2
 
 __all__ = [
     "FpfsParams",
@@ -50,29 +46,31 @@ or take it as an example to develop new system
 
 
 class FpfsParams(struct.PyTreeNode):
-    """FPFS parameter tree, these parameters are fixed in the tree"""
+    """FPFS parameter tree, these parameters are the leaves of the tree, so
+    they can be traced (see `NlBase.evaluate`)
+    """
 
     # Weighting parameter
-    Const: jnp.float64 = struct.field(pytree_node=False, default=10.0)
+    Const: jnp.float64 = struct.field(pytree_node=True, default=10.0)
 
     # flux selection
     # cut on magntidue
-    lower_m00: jnp.float64 = struct.field(pytree_node=False, default=0.2)
+    lower_m00: jnp.float64 = struct.field(pytree_node=True, default=0.2)
     # softening paramter for cut on flux
-    sigma_m00: jnp.float64 = struct.field(pytree_node=False, default=0.2)
+    sigma_m00: jnp.float64 = struct.field(pytree_node=True, default=0.2)
 
     # size selection
     # cut on size
-    lower_r2: jnp.float64 = struct.field(pytree_node=False, default=0.03)
-    upper_r2: jnp.float64 = struct.field(pytree_node=False, default=2.0)
+    lower_r2: jnp.float64 = struct.field(pytree_node=True, default=0.03)
+    upper_r2: jnp.float64 = struct.field(pytree_node=True, default=2.0)
     # softening paramter for cut on size
-    sigma_r2: jnp.float64 = struct.field(pytree_node=False, default=0.2)
+    sigma_r2: jnp.float64 = struct.field(pytree_node=True, default=0.2)
 
     # peak selection
     # cut on peak
-    lower_v: jnp.float64 = struct.field(pytree_node=False, default=0.005)
+    lower_v: jnp.float64 = struct.field(pytree_node=True, default=0.005)
     # softening parameter for cut on peak
-    sigma_v: jnp.float64 = struct.field(pytree_node=False, default=0.2)
+    sigma_v: jnp.float64 = struct.field(pytree_node=True, default=0.2)
 
 
 # class FpfsNodeParams(struct.PyTreeNode):
@@ -114,25 +112,35 @@ class FpfsWeightSelect(FpfsObsBase):
             func_name=func_name,
         )
 
-    @partial(jit, static_argnums=(0,))
-    def _base_func(self, cat):
+    def _weight(self, cat, ufunc):
+        # selection weight with the weight function ufunc
         # selection on flux
-        w0 = self.ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
+        w0 = ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
 
         # selection on size (lower limit)
         # (M00 + M20) / M00 > lower_r2_lower
         r2l = cat[did["m00"]] * (1.0 - self.params.lower_r2) + cat[did["m20"]]
-        w2l = self.ufunc(r2l, 0.0, self.params.sigma_r2)
+        w2l = ufunc(r2l, 0.0, self.params.sigma_r2)
 
         # selection on size (upper limit)
         # (M00 + M20) / M00 < upper_r2
         r2u = cat[did["m00"]] * (self.params.upper_r2 - 1.0) - cat[did["m20"]]
-        w2u = self.ufunc(r2u, 0.0, self.params.sigma_r2)
+        w2u = ufunc(r2u, 0.0, self.params.sigma_r2)
         # w2l = 1.
         # w2u = 1.
         out = w0 * w2l * w2u
         return out
 
+    def _base_support(self, cat):
+        # the weight is zero where the indicator of its support is zero
+        indicator = support_func(self.ufunc)
+        if indicator is None:
+            return None
+        return self._weight(cat.T, indicator) > 0
+
+    def _base_func(self, cat):
+        return self._weight(cat, self.ufunc)
+
 
 class FpfsWeightDetect(FpfsObsBase):
     """FPFS detection weight"""
@@ -145,15 +153,25 @@ class FpfsWeightDetect(FpfsObsBase):
             func_name=func_name,
         )
 
-    @partial(jit, static_argnums=(0,))
-    def _base_func(self, cat):
+    def _weight(self, cat, ufunc):
+        # detection weight with the weight function ufunc
         out = 1.0
         for i in range(npeak):
             # v_i - M00 * lower_v > sigma_v
             vp = cat[did["v%d" % i]] - cat[did["m00"]] * self.params.lower_v
-            out = out * self.ufunc(vp, self.params.sigma_v, self.params.sigma_v)
+            out = out * ufunc(vp, self.params.sigma_v, self.params.sigma_v)
         return out
 
+    def _base_support(self, cat):
+        # the weight is zero where the indicator of its support is zero
+        indicator = support_func(self.ufunc)
+        if indicator is None:
+            return None
+        return self._weight(cat.T, indicator) > 0
+
+    def _base_func(self, cat):
+        return self._weight(cat, self.ufunc)
+
 
 class FpfsE1(FpfsObsBase):
     """FPFS ellipticity (first component)"""
@@ -165,7 +183,6 @@ class FpfsE1(FpfsObsBase):
             parent=parent,
         )
 
-    @partial(jit, static_argnums=(0,))
     def _base_func(self, cat):
         return cat[did["m22c"]] / (cat[did["m00"]] + self.params.Const)
 
@@ -181,7 +198,6 @@ class FpfsE2(FpfsObsBase):
             func_name=func_name,
         )
 
-    @partial(jit, static_argnums=(0,))
     def _base_func(self, cat):
         return cat[did["m22s"]] / (cat[did["m00"]] + self.params.Const)
 
@@ -193,7 +209,6 @@ class FpfsE41(FpfsObsBase):
         self.nmodes = 32
         super().__init__(params=params, parent=parent, func_name=func_name)
 
-    @partial(jit, static_argnums=(0,))
     def _base_func(self, cat):
         return cat[did["m42c"]] / (cat[did["m00"]] + self.params.Const)
 
@@ -209,7 +224,6 @@ class FpfsE42(FpfsObsBase):
             func_name=func_name,
         )
 
-    @partial(jit, static_argnums=(0,))
     def _base_func(self, cat):
         return cat[did["m42s"]] / (cat[did["m00"]] + self.params.Const)
 
@@ -225,29 +239,39 @@ class FpfsWeightE1(FpfsObsBase):
             func_name=func_name,
         )
 
-    @partial(jit, static_argnums=(0,))
-    def _base_func(self, cat):
+    def _weight(self, cat, ufunc):
+        # selection and detection weight with the weight function ufunc
         # selection on flux
-        w0 = self.ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
+        w0 = ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
 
         # selection on size (lower limit)
         # (M00 + M20) / M00 > lower_r2_lower
         r2l = cat[did["m00"]] * (1.0 - self.params.lower_r2) + cat[did["m20"]]
-        w2l = self.ufunc(r2l, self.params.sigma_r2, self.params.sigma_r2)
+        w2l = ufunc(r2l, self.params.sigma_r2, self.params.sigma_r2)
 
         # selection on size (upper limit)
         # (M00 + M20) / M00 < upper_r2
         r2u = cat[did["m00"]] * (self.params.upper_r2 - 1.0) - cat[did["m20"]]
-        w2u = self.ufunc(r2u, 0.0, self.params.sigma_r2)
+        w2u = ufunc(r2u, 0.0, self.params.sigma_r2)
         wsel = w0 * w2l * w2u
 
         wdet = 1.0
         for i in range(npeak):
             # v_i - M00 * lower_v > sigma_v
             vp = cat[did["v%d" % i]] - cat[did["m00"]] * self.params.lower_v
-            wdet = wdet * self.ufunc(vp, self.params.sigma_v, self.params.sigma_v)
+            wdet = wdet * ufunc(vp, self.params.sigma_v, self.params.sigma_v)
+        return wdet * wsel
+
+    def _base_support(self, cat):
+        # the weight is zero where the indicator of its support is zero
+        indicator = support_func(self.ufunc)
+        if indicator is None:
+            return None
+        return self._weight(cat.T, indicator) > 0
+
+    def _base_func(self, cat):
         e1 = cat[did["m22c"]] / (cat[did["m00"]] + self.params.Const)
-        return wdet * wsel * e1
+        return self._weight(cat, self.ufunc) * e1
 
 
 class FpfsWeightE2(FpfsObsBase):
@@ -261,29 +285,39 @@ class FpfsWeightE2(FpfsObsBase):
             func_name=func_name,
         )
 
-    @partial(jit, static_argnums=(0,))
-    def _base_func(self, cat):
+    def _weight(self, cat, ufunc):
+        # selection and detection weight with the weight function ufunc
         # selection on flux
-        w0 = self.ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
+        w0 = ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
 
         # selection on size (lower limit)
         # (M00 + M20) / M00 > lower_r2_lower
         r2l = cat[did["m00"]] * (1.0 - self.params.lower_r2) + cat[did["m20"]]
-        w2l = self.ufunc(r2l, 0.0, self.params.sigma_r2)
+        w2l = ufunc(r2l, 0.0, self.params.sigma_r2)
 
         # selection on size (upper limit)
         # (M00 + M20) / M00 < upper_r2
         r2u = cat[did["m00"]] * (self.params.upper_r2 - 1.0) - cat[did["m20"]]
-        w2u = self.ufunc(r2u, 0.0, self.params.sigma_r2)
+        w2u = ufunc(r2u, 0.0, self.params.sigma_r2)
         wsel = w0 * w2l * w2u
 
         wdet = 1.0
         for i in range(npeak):
             # v_i - M00 * lower_v > sigma_v
             vp = cat[did["v%d" % i]] - cat[did["m00"]] * self.params.lower_v
-            wdet = wdet * self.ufunc(vp, self.params.sigma_v, self.params.sigma_v)
+            wdet = wdet * ufunc(vp, self.params.sigma_v, self.params.sigma_v)
+        return wdet * wsel
+
+    def _base_support(self, cat):
+        # the weight is zero where the indicator of its support is zero
+        indicator = support_func(self.ufunc)
+        if indicator is None:
+            return None
+        return self._weight(cat.T, indicator) > 0
+
+    def _base_func(self, cat):
         e2 = cat[did["m22s"]] / (cat[did["m00"]] + self.params.Const)
-        return wdet * wsel * e2
+        return self._weight(cat, self.ufunc) * e2
 
 
 class FpfsWeightE41(FpfsObsBase):
@@ -297,32 +331,42 @@ class FpfsWeightE41(FpfsObsBase):
             func_name=func_name,
         )
 
-    @partial(jit, static_argnums=(0,))
-    def _base_func(self, cat):
+    def _weight(self, cat, ufunc):
+        # selection and detection weight with the weight function ufunc
         # selection on flux
-        w0 = self.ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
+        w0 = ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
 
         # selection on size (lower limit)
         # (M00 + M20) / M00 > lower_r2_lower
         r2l = cat[did["m00"]] * (1.0 - self.params.lower_r2) + cat[did["m20"]]
-        w2l = self.ufunc(r2l, self.params.sigma_r2, self.params.sigma_r2)
+        w2l = ufunc(r2l, self.params.sigma_r2, self.params.sigma_r2)
 
         # selection on size (upper limit)
         # (M00 + M20) / M00 < upper_r2
         r2u = cat[did["m00"]] * (self.params.upper_r2 - 1.0) - cat[did["m20"]]
-        w2u = self.ufunc(r2u, 0.0, self.params.sigma_r2)
+        w2u = ufunc(r2u, 0.0, self.params.sigma_r2)
         wsel = w0 * w2l * w2u
 
         wdet = 1.0
         for i in range(0, npeak):
             # v_i > lower_v
-            wdet = wdet * self.ufunc(
+            wdet = wdet * ufunc(
                 cat[did["v%d" % i]],
                 self.params.lower_v,
                 self.params.sigma_v,
             )
+        return wdet * wsel
+
+    def _base_support(self, cat):
+        # the weight is zero where the indicator of its support is zero
+        indicator = support_func(self.ufunc)
+        if indicator is None:
+            return None
+        return self._weight(cat.T, indicator) > 0
+
+    def _base_func(self, cat):
         e1 = cat[did["m42c"]] / (cat[did["m00"]] + self.params.Const)
-        return wdet * wsel * e1
+        return self._weight(cat, self.ufunc) * e1
 
 
 class FpfsWeightE42(FpfsObsBase):
@@ -336,29 +380,39 @@ class FpfsWeightE42(FpfsObsBase):
             func_name=func_name,
         )
 
-    @partial(jit, static_argnums=(0,))
-    def _base_func(self, cat):
+    def _weight(self, cat, ufunc):
+        # selection and detection weight with the weight function ufunc
         # selection on flux
-        w0 = self.ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
+        w0 = ufunc(cat[did["m00"]], self.params.lower_m00, self.params.sigma_m00)
 
         # selection on size (lower limit)
         # (M00 + M20) / M00 > lower_r2_lower
         r2l = cat[did["m00"]] * (1.0 - self.params.lower_r2) + cat[did["m20"]]
-        w2l = self.ufunc(r2l, 0.0, self.params.sigma_r2)
+        w2l = ufunc(r2l, 0.0, self.params.sigma_r2)
 
         # selection on size (upper limit)
         # (M00 + M20) / M00 < upper_r2
         r2u = cat[did["m00"]] * (self.params.upper_r2 - 1.0) - cat[did["m20"]]
-        w2u = self.ufunc(r2u, 0.0, self.params.sigma_r2)
+        w2u = ufunc(r2u, 0.0, self.params.sigma_r2)
         wsel = w0 * w2l * w2u
 
         wdet = 1.0
         for i in range(0, npeak):
             # v_i > lower_v
-            wdet = wdet * self.ufunc(
+            wdet = wdet * ufunc(
                 cat[did["v%d" % i]],
                 self.params.lower_v,
                 self.params.sigma_v,
             )
+        return wdet * wsel
+
+    def _base_support(self, cat):
+        # the weight is zero where the indicator of its support is zero
+        indicator = support_func(self.ufunc)
+        if indicator is None:
+            return None
+        return self._weight(cat.T, indicator) > 0
+
+    def _base_func(self, cat):
         e2 = cat[did["m42s"]] / (cat[did["m00"]] + self.params.Const)
-        return wdet * wsel * e2
+        return self._weight(cat, self.ufunc) * e2
@@ -0,0 +1,53 @@
+# impt autodiff pipline
+# Copyright 20221222 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# python lib
+
+# This file loads the submodules of a package on the first access of their
+# attributes, so that importing the package does not import JAX
+
+import importlib
+
+
+def attach(package, submodules, attrs):
+    """Returns the module-level __getattr__, __dir__ and __all__ of a package
+    with lazily loaded submodules
+
+    Args:
+        package (str):      name of the package
+        submodules (list):  names of the submodules loaded on first access
+        attrs (dict):       names of the submodules exporting the attributes
+                            of the package, e.g. {"submodule": ["attr", ...]}
+    Returns:
+        __getattr__ (Callable): module-level __getattr__
+        __dir__ (Callable):     module-level __dir__
+        __all__ (list):         names exported by the package
+    """
+    owners = {name: mod for mod, names in attrs.items() for name in names}
+    names = list(submodules) + list(owners)
+
+    def __getattr__(name):
+        if name in submodules:
+            return importlib.import_module("%s.%s" % (package, name))
+        if name in owners:
+            mod = importlib.import_module("%s.%s" % (package, owners[name]))
+            value = getattr(mod, name)
+            # later accesses do not go through __getattr__
+            setattr(importlib.import_module(package), name, value)
+            return value
+        raise AttributeError("module %s has no attribute %s" % (package, name))
+
+    def __dir__():
+        return sorted(names)
+
+    return __getattr__, __dir__, names
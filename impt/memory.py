@@ -0,0 +1,117 @@
+# impt autodiff pipline
+# Copyright 20221222 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# python lib
+
+# This file estimates the memory used by a per-row function by walking
+# through its jaxpr, so that the number of rows evaluated together can be
+# chosen to fit a memory budget [see `impt.set_exec_mode`]
+
+import numpy as np
+import jax
+
+try:
+    from jax.extend import core
+except ImportError:  # older versions of jax
+    from jax import core
+
+
+def _nbytes(var):
+    """Returns the size of the value of a variable [bytes]"""
+    aval = var.aval
+    try:
+        size = int(np.prod(aval.shape, dtype=np.int64))
+        return size * np.dtype(aval.dtype).itemsize
+    except (AttributeError, TypeError):
+        # tokens, keys and other non-array values
+        return 0
+
+
+def _sub_jaxprs(eqn):
+    """Returns the sub-jaxprs called by an equation (e.g. jit, custom_jvp,
+    the body of scan or the branches of cond)
+    """
+    out = []
+    for val in eqn.params.values():
+        vals = val if isinstance(val, (tuple, list)) else [val]
+        for vv in vals:
+            if isinstance(vv, core.ClosedJaxpr):
+                vv = vv.jaxpr
+            if isinstance(vv, core.Jaxpr):
+                out.append(vv)
+    return out
+
+
+def peak_bytes(jaxpr, memo=None):
+    """Returns the peak size of the intermediate values of a jaxpr; a value
+    is kept until its last use, and the peak of a called sub-jaxpr adds to
+    the values alive at the call [the inputs are not counted]
+
+    Args:
+        jaxpr (Jaxpr):      jaxpr of the function
+        memo (dict):        peaks of the sub-jaxprs already walked
+    Returns:
+        out (int):          peak size [bytes]
+    """
+    if memo is None:
+        memo = {}
+    if id(jaxpr) in memo:
+        return memo[id(jaxpr)][1]
+    last = {}
+    for i, eqn in enumerate(jaxpr.eqns):
+        for var in eqn.invars:
+            if not isinstance(var, core.Literal):
+                last[var] = i
+    for var in jaxpr.outvars:
+        if not isinstance(var, core.Literal):
+            last[var] = len(jaxpr.eqns)
+    inputs = set(jaxpr.invars) | set(jaxpr.constvars)
+    live = 0
+    peak = 0
+    for i, eqn in enumerate(jaxpr.eqns):
+        inner = max([peak_bytes(sub, memo) for sub in _sub_jaxprs(eqn)], default=0)
+        outs = [var for var in eqn.outvars if var in last]
+        peak = max(peak, live + inner + sum(_nbytes(var) for var in eqn.outvars))
+        live += sum(_nbytes(var) for var in outs)
+        done = set(
+            var
+            for var in eqn.invars
+            if not isinstance(var, core.Literal)
+            and var not in inputs
+            and last[var] == i
+        )
+        live -= sum(_nbytes(var) for var in done)
+    # the jaxpr is kept in the memo, so its id cannot be reused
+    memo[id(jaxpr)] = (jaxpr, peak)
+    return peak
+
+
+def row_footprint(func, ncol, dtype, args=()):
+    """Returns the size of the outputs of a per-row function and the peak
+    size of its intermediate values (including the outputs) for one row
+
+    Args:
+        func (Callable):    per-row function func(x, *args)
+        ncol (int):         number of columns in a row
+        dtype (dtype):      data type of the row
+        args (tuple):       extra arguments of func
+    Returns:
+        out (int):          size of the outputs [bytes]
+        work (int):         peak size of the intermediate values [bytes]
+    """
+    args = jax.tree_util.tree_map(
+        lambda vv: jax.ShapeDtypeStruct(np.shape(vv), vv.dtype), args
+    )
+    closed = jax.make_jaxpr(func)(jax.ShapeDtypeStruct((ncol,), dtype), *args)
+    out = sum(_nbytes(var) for var in closed.jaxpr.outvars)
+    return out, max(peak_bytes(closed.jaxpr), out)
@@ -18,10 +18,13 @@
 
 # from jax import jit
 # from functools import partial
+import numpy as np
 import jax.numpy as jnp
-from .base import NlBase
+from jax import jacfwd, jacrev, jvp, vmap
+from .base import NlBase, mark_updated
+from .engine import shared_call
 
-__all__ = ["RespG1", "RespG2", "BiasNoise"]
+__all__ = ["RespG1", "RespG2", "RespG", "BiasNoise"]
 
 
 """
@@ -31,11 +34,24 @@ This is a mapping from function to function.
 """
 
 
-class RespG1(NlBase):
-    """A Class to derive the shear response function [1st component] for an
-    observable, following eq. (4) of
-    https://arxiv.org/abs/2208.10522
+def _dg_sub(lin_resp, component, x, idx):
+    """Returns the shear response of the columns idx of the row x [shared by
+    the observables in one program]
     """
+    return shared_call(
+        (type(lin_resp), idx),
+        "dg%d" % component,
+        lambda x: lin_resp.dg_sub(component, x, idx),
+        x,
+    )
+
+
+class _RespBase(NlBase):
+    """Shear responses of an observable for the shear components in
+    `components`
+    """
+
+    components = ()
 
     def __init__(self, parent):
         """Initializes shear response object using a parent_obj object and
@@ -46,39 +62,50 @@ class RespG1(NlBase):
         super().__init__(parent.params, parent, parent.lin_resp)
         return
 
+    def _base_support(self, cat):
+        # the gradient vanishes where the parent vanishes
+        return self.parent.support(cat)
+
     # @partial(jit, static_argnums=(0,))
     def _base_func(self, x):
         """Returns the first-order shear response."""
-        res = jnp.dot(
-            self.parent._obs_grad_func(x),
-            self.lin_resp._dg1(x),
-        )
-        return res
+        gvec, idx = self.parent._obs_reduced_grad(x)
+        res = [
+            jnp.dot(gvec, _dg_sub(self.lin_resp, comp, x, idx))
+            for comp in self.components
+        ]
+        if len(res) == 1:
+            return res[0]
+        return jnp.stack(res, axis=-1)
+
+
+class RespG1(_RespBase):
+    """A Class to derive the shear response function [1st component] for an
+    observable, following eq. (4) of
+    https://arxiv.org/abs/2208.10522
+    """
+
+    components = (1,)
 
 
-class RespG2(NlBase):
+class RespG2(_RespBase):
     """A Class to derive the shear response function [2nd component] for an
     observable, following eq. (4) of
     https://arxiv.org/abs/2208.10522
     """
 
-    def __init__(self, parent):
-        """Initializes shear response object using a parent_obj object and
-        a noise covariance matrix.
-        """
-        if not hasattr(parent, "_obs_grad_func"):
-            raise TypeError("parent object does not has gradient operation")
-        super().__init__(parent.params, parent, parent.lin_resp)
-        return
+    components = (2,)
 
-    # @partial(jit, static_argnums=(0,))
-    def _base_func(self, x):
-        """Returns the first-order shear response."""
-        res = jnp.dot(
-            self.parent._obs_grad_func(x),
-            self.lin_resp._dg2(x),
-        )
-        return res
+
+class RespG(_RespBase):
+    """A Class to derive both the shear response functions of an observable
+    from one Jacobian evaluation; for a vector-valued observable [e.g.,
+    `impt.fpfs.FpfsWeightE`], the output is the response matrix with
+    R_ij = d obs_i / d g_j [shape: (nout, 2)], so (e1, e2) gives R11, R12,
+    R21 and R22 at once
+    """
+
+    components = (1, 2)
 
 
 """
@@ -88,31 +115,151 @@ This is a mapping from function to function.
 
 
 class BiasNoise(NlBase):
-    """A Class to derive the second-order noise perturbation function."""
+    """A Class to derive the second-order noise perturbation function.
 
-    def __init__(self, parent, noise_cov):
+    The noise bias is tr(H C) / 2, where H is the Hessian matrix of the parent
+    observable and C is the noise covariance matrix [one for each output of
+    vector-valued observables]. With method="hessian",
+    the full Hessian matrix is computed and contracted with C; for the shear
+    responses R = grad(f) . A x of an observable f [`RespG1`, `RespG2` and
+    `RespG`], which are linear in the row, tr(H[R] C) / 2 is computed as
+    A x . grad(N) + sum(H[f] * A C) from the Hessian of f and the gradient of
+    its noise bias N = tr(H[f] C) / 2, which are shared by the components
+    [instead of the Hessian of each component of R]. With
+    method="hvp", C is eigen-decomposed once, and tr(H C) / 2 is computed with
+    forward-over-reverse Hessian-vector products along the eigenvectors whose
+    eigenvalues are larger than rtol times the largest eigenvalue (rtol=0
+    keeps all the eigenvectors and is exact).
+    """
+
+    def __init__(self, parent, noise_cov, method="hessian", rtol=1e-8):
         """Initializes shear response object using a parent_obj object and
         a noise covariance matrix.
+
+        Args:
+            parent (NlBase):        parent observable
+            noise_cov (ndarray):    noise covariance matrix
+            method (str):           "hessian" or "hvp"
+            rtol (float):           relative tolerance on the eigenvalues of
+                                    the noise covariance [for method="hvp"]
         """
-        if not hasattr(parent, "_obs_hessian_func"):
-            raise TypeError("parent object does not has hessian operation")
+        if method == "hessian":
+            if not hasattr(parent, "_obs_hessian_func"):
+                raise TypeError("parent object does not has hessian operation")
+        elif method == "hvp":
+            if not hasattr(parent, "_reduced_func"):
+                raise TypeError("parent object does not has gradient operation")
+        else:
+            raise ValueError("method: %s is not supported" % method)
+        if rtol < 0.0:
+            raise ValueError("rtol should be non-negative")
+        self.method = method
+        self.rtol = rtol
         self.update_noise_cov(noise_cov)
         super().__init__(parent.params, parent, parent.lin_resp)
         return
 
     def update_noise_cov(self, noise_cov):
         self.noise_cov = noise_cov
+        # noise covariance (or its eigen decomposition) in the space of the
+        # columns that the parent depends on [kept as numpy constants, so they
+        # are not bound to the trace that requests them first]
+        self._sub_cov = {}
+        mark_updated(self)
+
+    def noise_cov_sub(self, idx):
+        """Returns the noise covariance matrix of the columns idx; for
+        method="hvp", returns its eigenvalues and eigenvectors (in rows) with
+        the eigenvalues smaller than rtol times the largest one removed
+        """
+        idx = tuple(idx)
+        if idx not in self._sub_cov:
+            cov = np.asarray(self.noise_cov, dtype=np.float64)
+            cov = cov[np.ix_(idx, idx)]
+            if self.method == "hvp":
+                # C = sum_k val_k vec_k vec_k^T
+                vals, vecs = np.linalg.eigh(cov)
+                amp = np.abs(vals)
+                mask = amp > 0.0
+                if len(amp) > 0:
+                    mask = mask & (amp > self.rtol * np.max(amp))
+                self._sub_cov[idx] = (vals[mask], vecs[:, mask].T)
+            else:
+                self._sub_cov[idx] = cov
+        return self._sub_cov[idx]
+
+    def resp_cov_sub(self, component, idx, ncol):
+        """Returns A C in the space of the columns idx, where A is the shear
+        response matrix of the row [see `LinRespBase.response_matrix`] and C
+        the noise covariance matrix
+        """
+        key = ("resp", component, tuple(idx), ncol)
+        if key not in self._sub_cov:
+            idx = np.array(idx, dtype=int)
+            mat = self.lin_resp.response_matrix(component, ncol)[idx]
+            cov = np.asarray(self.noise_cov, dtype=np.float64)
+            self._sub_cov[key] = mat @ cov[:, idx]
+        return self._sub_cov[key]
+
+    def _base_support(self, cat):
+        # the Hessian vanishes where the parent vanishes
+        return self.parent.support(cat)
 
     # @partial(jit, static_argnums=(0,))
     def _base_func(self, x):
         """Returns the second-order noise response"""
+        if self.method == "hvp":
+            return self._hvp_func(x)
+        if isinstance(self.parent, _RespBase):
+            return self._resp_func(x)
+        hessian, idx = self.parent._obs_reduced_hessian(x)
         indexes = [[-2, -1], [-2, -1]]
         res = (
             jnp.tensordot(
-                self.parent._obs_hessian_func(x),
-                self.noise_cov,
+                hessian,
+                self.noise_cov_sub(idx).astype(hessian.dtype),
                 indexes,
             )
             / 2.0
         )
         return res
+
+    def _hvp_func(self, x):
+        """Returns the second-order noise response computed with
+        Hessian-vector products
+        """
+        func, idx, z = self.parent._reduced_func(x)
+        vals, vecs = self.noise_cov_sub(idx)
+        vals, vecs = vals.astype(z.dtype), vecs.astype(z.dtype)
+        gfunc = jacrev(func)
+
+        def vhv(vec):
+            # vec^T H vec [for each output of vector-valued observables]
+            hvec = jvp(gfunc, (z,), (vec,))[1]
+            return jnp.sum(hvec * vec, axis=-1)
+
+        res = jnp.tensordot(vals, vmap(vhv)(vecs), 1) / 2.0
+        return res
+
+    def _resp_func(self, x):
+        """Returns the second-order noise response of the shear responses of
+        an observable, from the Hessian of the observable and the gradient of
+        its noise bias
+        """
+        func, idx, z = self.parent.parent._reduced_func(x)
+        cov = self.noise_cov_sub(idx).astype(z.dtype)
+        indexes = [[-2, -1], [-2, -1]]
+
+        def noise(z):
+            hessian = jacfwd(jacrev(func))(z)
+            return jnp.tensordot(hessian, cov, indexes) / 2.0, hessian
+
+        gnoise, hessian = jacrev(noise, has_aux=True)(z)
+        res = []
+        for comp in self.parent.components:
+            dg = _dg_sub(self.lin_resp, comp, x, idx)
+            rcov = self.resp_cov_sub(comp, idx, x.shape[-1]).astype(z.dtype)
+            res.append(jnp.dot(gnoise, dg) + jnp.tensordot(hessian, rcov, indexes))
+        if len(res) == 1:
+            return res[0]
+        return jnp.stack(res, axis=-1)
@@ -0,0 +1,221 @@
+# impt autodiff pipline
+# Copyright 20221222 Xiangchong Li.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# python lib
+
+# This file contains the weight functions of the selections [smooth steps of
+# the observables] shared by the FPFS modules
+import numpy as np
+from jax import jit
+import jax.numpy as jnp
+import jax
+
+__all__ = ["ssfunc2", "ssfunc3", "tsfunc2", "smfunc", "support_func"]
+
+
+def _with_derivative(func, deriv):
+    """Returns func (a function of one array) with the derivative deriv"""
+    func = jax.custom_jvp(func)
+
+    @func.defjvp
+    def func_jvp(primals, tangents):
+        (t,) = primals
+        (dt,) = tangents
+        return func(t), deriv(t) * dt
+
+    return func
+
+
+def _derivative_chain(funcs):
+    """Returns funcs[0] with closed-form derivatives: the derivative of
+    funcs[i] is funcs[i + 1] [the last one is differentiated by JAX]
+    """
+    out = funcs[-1]
+    for func in funcs[-2::-1]:
+        out = _with_derivative(func, out)
+    return out
+
+
+def _inside(t, lower, upper):
+    """Returns 1 inside (lower, upper) and 0 outside"""
+    return ((t > lower) & (t < upper)).astype(t.dtype)
+
+
+# The steps below are functions of t with closed-form derivatives. The
+# derivatives which vanish on the edges are evaluated at the clipped t, so
+# they are zero outside the edges without branches; the first derivative
+# which does not vanish on the edges is multiplied by the indicator of the
+# inside
+
+
+def _ss2_d0(t):
+    # C2 smooth step on [0, 1] [in Horner form]
+    t = jnp.clip(t, 0.0, 1.0)
+    return t**3 * (10.0 + t * (6.0 * t - 15.0))
+
+
+def _ss2_d1(t):
+    t = jnp.clip(t, 0.0, 1.0)
+    return 30.0 * (t * (1.0 - t)) ** 2
+
+
+def _ss2_d2(t):
+    t = jnp.clip(t, 0.0, 1.0)
+    return 60.0 * t * (1.0 - t) * (1.0 - 2.0 * t)
+
+
+def _ss2_d3(t):
+    return 60.0 * (1.0 + t * (6.0 * t - 6.0)) * _inside(t, 0.0, 1.0)
+
+
+def _ss3_d0(t):
+    # C3 smooth step on [0, 1] [in Horner form]
+    t = jnp.clip(t, 0.0, 1.0)
+    return t**4 * (35.0 + t * (t * (70.0 - 20.0 * t) - 84.0))
+
+
+def _ss3_d1(t):
+    t = jnp.clip(t, 0.0, 1.0)
+    return 140.0 * (t * (1.0 - t)) ** 3
+
+
+def _ss3_d2(t):
+    t = jnp.clip(t, 0.0, 1.0)
+    return 420.0 * (t * (1.0 - t)) ** 2 * (1.0 - 2.0 * t)
+
+
+def _ss3_d3(t):
+    t = jnp.clip(t, 0.0, 1.0)
+    return 840.0 * t * (1.0 - t) * (1.0 + t * (5.0 * t - 5.0))
+
+
+def _ss3_d4(t):
+    out = 1.0 + t * (t * (30.0 - 20.0 * t) - 12.0)
+    return 840.0 * out * _inside(t, 0.0, 1.0)
+
+
+def _sm_d1(t):
+    # derivatives of the sigmoid
+    s = jax.nn.sigmoid(t)
+    return s * (1.0 - s)
+
+
+def _sm_d2(t):
+    s = jax.nn.sigmoid(t)
+    return s * (1.0 - s) * (1.0 - 2.0 * s)
+
+
+def _sm_d3(t):
+    s = jax.nn.sigmoid(t)
+    return s * (1.0 - s) * (1.0 + s * (6.0 * s - 6.0))
+
+
+_ss2_step = _derivative_chain([_ss2_d0, _ss2_d1, _ss2_d2, _ss2_d3])
+_ss3_step = _derivative_chain([_ss3_d0, _ss3_d1, _ss3_d2, _ss3_d3, _ss3_d4])
+_sm_step = _derivative_chain([jax.nn.sigmoid, _sm_d1, _sm_d2, _sm_d3])
+
+
+@jit
+def tsfunc2(x, mu, sigma):
+    """Returns the C2 sinusoidal weight funciton
+    This is for C2 sinusoidal based funciton; it is piecewise, since the
+    closed-form derivative chain of the sinusoids was slower in the Hessians
+    of the noise bias [the smooth steps below are branch free]
+
+    Args:
+        x (ndarray):    input data vector
+        mu (float):     center of the cut
+        sigma (float):  width of the selection function
+    Returns:
+        out (ndarray):  the weight funciton
+    """
+    t = (x - mu) / sigma
+
+    def func(t):
+        return 1.0 / 2.0 + t / 2.0 + 1.0 / 2.0 / jnp.pi * jnp.sin(t * jnp.pi)
+
+    # the edges are in the constant pieces, where all the derivatives are
+    # exactly zero
+    return jnp.piecewise(t, [t <= -1, (t > -1) & (t < 1), t >= 1], [0.0, func, 1.0])
+
+
+@jit
+def smfunc(x, mu, sigma):
+    """Returns the sigmoid weight funciton
+
+    Args:
+        x (ndarray):    input data vector
+        mu (float):     center of the cut
+        sigma (float):  width of the selection function
+    Returns:
+        out (ndarray):  the weight funciton
+    """
+    return _sm_step((x - mu) / sigma)
+
+
+@jit
+def ssfunc2(x, mu, sigma):
+    """Returns the C2 smooth step weight funciton; it is branch free, with
+    closed-form derivatives
+
+    Args:
+        x (ndarray):    input data vector
+        mu (float):     center of the cut
+        sigma (float):  width of the selection function
+    Returns:
+        out (ndarray):  the weight funciton
+    """
+    return _ss2_step((x - mu) / sigma / 2.0 + 0.5)
+
+
+@jit
+def ssfunc3(x, mu, sigma):
+    """Returns the C3 smooth step weight funciton; it is branch free, with
+    closed-form derivatives
+
+    Args:
+        x (ndarray):    input data vector
+        mu (float):     center of the cut
+        sigma (float):  width of the selection function
+    Returns:
+        out (ndarray):  the weight funciton
+    """
+    return _ss3_step((x - mu) / sigma / 2.0 + 0.5)
+
+
+def support_func(ufunc):
+    """Returns the indicator function of the support of a weight function;
+    the weight function and its derivatives vanish for (x - mu) / sigma < -1,
+    where the indicator is zero [x > mu - sigma for a negative sigma; only
+    for tsfunc2, ssfunc2 and ssfunc3; None for the other functions (e.g.,
+    smfunc), which may not have compact support]
+
+    Args:
+        ufunc (Callable):   weight function
+    Returns:
+        out (Callable):     indicator function with the arguments of ufunc
+                            [numpy arrays], None if the support is unknown
+    """
+    if ufunc not in (tsfunc2, ssfunc2, ssfunc3):
+        return None
+
+    def func(x, mu, sigma):
+        x = np.asarray(x, dtype=np.float64)
+        # margin for the round-off of x and of the cut evaluated in float32
+        tol = 1e-3 * np.abs(sigma) + 1e-5 * (np.abs(x) + np.abs(mu))
+        # (x - mu) / sigma >= -1 without the division [all the rows for a
+        # zero sigma]
+        out = (x - mu) * np.sign(sigma) >= -np.abs(sigma) - tol
+        return out.astype(np.float64)
+
+    return func
@@ -13,6 +13,7 @@ with open(fname, "r") as ff:
 scripts = [
     "bin/impt_config",
     "bin/impt_process_fpfs_sim.py",
+    "bin/impt_convert_catalog.py",
 ]
 
 setup(
@@ -28,6 +29,7 @@ setup(
         "jax>=0.4.9",
         "jaxlib>=0.4.9",
         "flax",
+        "flatbuffers",
         "fitsio",
         "pre-commit",
     ],